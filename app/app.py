@@ -1,18 +1,24 @@
-from flask import Flask, render_template, jsonify
+from flask import Flask, Response, g, render_template, jsonify, request
 import requests
 import json
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import threading
 import psycopg2
-from psycopg2.extras import DictCursor
 from dotenv import load_dotenv
-import os
-from functools import lru_cache
 import time
 import logging
-from typing import Dict, List, Optional, Any
-import subprocess
+from typing import Dict, List, Optional, Any, Set, Tuple
+import hashlib
+import hmac
+from .block_production import BlockProductionTracker
 from .config import Config
+from .db import DB_CONFIG, get_connection, pool_stats
+from .fanout import FanOut, FanOutResult, fan_out
+from .geo import create_geo_locator
+from . import cache, concurrency, credits, history, listing, monitoring, publish, rewards, scheduler, snapshot, stream, tracing
+from .leader import BuildLock, LeaderLock, LockSession, create_leader_lock
+from .metrics import RECORD_FIELDS, ValidatorColumns
+from .rpc import RpcError, rpc_client
 
 # Load environment variables
 load_dotenv()
@@ -24,233 +30,358 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Under gevent workers, database queries must yield like the rest of the I/O
+concurrency.patch_psycopg()
+
 app = Flask(__name__)
 
-# Cache configuration
+# In-process caches
 CACHE_TTL = 30  # seconds
-last_cache_time = 0
-cached_data = None
+validator_info_cache = cache.namespace('validator_info', CACHE_TTL, max_entries=1)
+NODE_INFO_CACHE_TTL = 300  # 5 minutes
+cluster_nodes_cache = cache.namespace('cluster_nodes', NODE_INFO_CACHE_TTL, max_entries=1, stale_ttl=Config.CLUSTER_NODES_STALE_TTL)
 
-# Cache for IP geolocation data
-ip_cache = {}
+# IP geolocation with a persistent cache shared by all workers
+geo_locator = create_geo_locator()
 
-# Cache for KOII price data
-price_cache = None
-last_price_cache_time = 0
+# Per-identity block production of the current epoch, merged incrementally
+block_production_tracker = BlockProductionTracker(
+    rpc_client, Config.BLOCK_PRODUCTION_PAGE_SLOTS, Config.BLOCK_PRODUCTION_MIN_SLOTS, Config.RPC_BATCH
+)
 
-# Add this at the top with other cache variables
-node_info_cache = {}
-last_node_info_cache_time = 0
-NODE_INFO_CACHE_TTL = 300  # 5 minutes
+# When to fetch each upstream source; vote accounts every cycle, per-epoch data once an epoch
+source_schedule = scheduler.SourceSchedule(
+    [
+        scheduler.Source('voteAccounts', Config.VALIDATORS_REFRESH_INTERVAL),
+        scheduler.Source('rpcEpochInfo', Config.VALIDATORS_REFRESH_INTERVAL),
+        scheduler.Source('clusterNodes', NODE_INFO_CACHE_TTL, max_age=NODE_INFO_CACHE_TTL + Config.CLUSTER_NODES_STALE_TTL),
+        scheduler.Source('inflationRate', Config.EPOCH_DATA_REFRESH_INTERVAL, epoch_bound=True),
+        scheduler.Source('totalSupply', Config.EPOCH_DATA_REFRESH_INTERVAL, epoch_bound=True),
+        scheduler.Source('slotsPerEpoch', None),
+    ] + ([
+        # Keep serving the last price while Cryptorank is slow or down
+        scheduler.Source('koiiPrice', Config.PRICE_CACHE_TTL, max_age=Config.PRICE_CACHE_TTL + Config.PRICE_CACHE_STALE_TTL)
+    ] if Config.CRYPTORANK_API_KEY else []),
+    jitter=Config.REFRESH_JITTER, retry_min=Config.REFRESH_RETRY_MIN, retry_max=Config.REFRESH_RETRY_MAX
+)
 
-# Database configuration
-DB_CONFIG = {
-    'dbname': os.getenv('DB_NAME', 'koii_validators'),
-    'user': os.getenv('DB_USER', 'postgres'),
-    'password': os.getenv('DB_PASSWORD', 'postgres'),
-    'host': os.getenv('DB_HOST', 'localhost'),
-    'port': os.getenv('DB_PORT', '5432')
-}
+# Lock deciding which worker runs the background refresh
+leader_lock: LeaderLock = LeaderLock()
+# Version this process last published to PUBLISH_DIR
+published_version: Optional[int] = None
+
+# Pre-encoded snapshot last served by this worker
+encoded_snapshot: Optional[snapshot.EncodedSnapshot] = None
+
+# Snapshot last served by this worker, decoded for requests that reshape it
+decoded_snapshot: Optional[Dict[str, Any]] = None
+
+# Sort orders and filter columns of the snapshot last served by this worker
+validator_index: Optional[listing.ValidatorIndex] = None
+
+# Packed epochCredits of the snapshot last served by this worker
+epoch_credits: Optional[credits.PackedEpochCredits] = None
+
+# Rewards of the last closed epoch, fetched once per epoch; one fetch at a time
+epoch_rewards: Optional[rewards.EpochRewards] = None
+rewards_lock = threading.Lock()
+
+# Pre-encoded deltas to the current snapshot, keyed by base version
+encoded_deltas: Dict[int, snapshot.EncodedSnapshot] = {}
+encoded_deltas_version: Optional[int] = None
+
+# Recent snapshots written by this worker, diffed against on each refresh
+snapshot_log = snapshot.SnapshotLog(Config.SNAPSHOT_DELTA_HISTORY)
+
+# Encoding of the snapshot copy that load_snapshot decodes
+snapshot_codec = snapshot.get_codec(Config.SNAPSHOT_CODEC)
+
+# Wakes this worker's /api/stream clients when a new snapshot is stored
+broadcaster = stream.SnapshotBroadcaster(DB_CONFIG, snapshot.NOTIFY_CHANNEL, snapshot.VERSION_SQL)
+
+# Time of the last validator history sample
+last_history_sample_time = 0
+
+# Advisory lock serializing schema setup across workers
+SCHEMA_LOCK_KEY = Config.LEADER_LOCK_KEY + 1
+
+# Advisory lock held by whichever process is building a snapshot
+BUILD_LOCK_KEY = Config.LEADER_LOCK_KEY + 2
+
+# This process's connection holding its advisory locks (leader and build keys)
+lock_session = LockSession(DB_CONFIG)
+# Taken by the refresh leader and by cold /api/nodes builds; across workers only with the Postgres leader lock
+build_lock = BuildLock(lock_session if Config.LEADER_LOCK.lower() == 'postgres' else None, BUILD_LOCK_KEY)
+
+# Snapshot built by /api/nodes while none is stored; one build per worker at a time
+cold_start_cache = cache.namespace('cold_start', CACHE_TTL, max_entries=1)
 
 def init_db():
     """Initialize database tables if they don't exist"""
     conn = None
     try:
+        # Dedicated connection: the schema lock must not stay on a pooled one
         conn = psycopg2.connect(**DB_CONFIG)
         with conn.cursor() as cur:
+            # Workers start together; let one of them run the DDL at a time
+            cur.execute("SELECT pg_advisory_lock(%s)", (SCHEMA_LOCK_KEY,))
             # Create tables
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS latest_validator_data (
-                    id SERIAL PRIMARY KEY,
-                    data JSONB NOT NULL,
-                    timestamp TIMESTAMPTZ DEFAULT NOW()
-                )
-            """)
+            snapshot.init_snapshot_schema(cur)
+            tracing.init_trace_schema(cur)
+            rewards.init_rewards_schema(cur)
             conn.commit()
-            logger.info("Database tables initialized successfully")
+        history.init_history_schema(conn, Config.HISTORY_RETENTION_DAYS)
+        logger.info("Database tables initialized successfully")
     except Exception as e:
         logger.error(f"Error initializing database: {e}")
     finally:
         if conn:
             conn.close()
 
-def store_latest_data(data: Dict[str, Any]):
-    """Store the latest validator data in the database"""
+def store_latest_data(data: Dict[str, Any], log: Optional[snapshot.SnapshotLog] = None) -> Optional[snapshot.EncodedSnapshot]:
+    """Store the latest validator data in the database, with deltas from the versions in `log`"""
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        with conn.cursor() as cur:
-            # Store new data
-            cur.execute("""
-                INSERT INTO latest_validator_data (data)
-                VALUES (%s)
-            """, (json.dumps(data),))
-            
-            # Keep only the latest record
-            cur.execute("""
-                DELETE FROM latest_validator_data
-                WHERE id NOT IN (
-                    SELECT id FROM latest_validator_data
-                    ORDER BY timestamp DESC
-                    LIMIT 1
-                )
-            """)
-            conn.commit()
-            logger.info("Latest validator data stored in database")
+        with get_connection() as conn:
+            with monitoring.DB_QUERY_LATENCY.labels('store_snapshot').time():
+                encoded = snapshot.store_snapshot(conn, data, log, snapshot_codec)
+        logger.info(f"Latest validator data stored in database (version {encoded.version}, {len(encoded.body)} bytes)")
+        return encoded
     except Exception as e:
         logger.error(f"Error storing data in database: {e}")
-    finally:
-        if conn:
-            conn.close()
+        return None
+
+def store_validator_history(data: Dict[str, Any]) -> None:
+    """Append per-validator samples of a snapshot to the metrics history"""
+    global last_history_sample_time
+    if time.time() - last_history_sample_time < Config.HISTORY_SAMPLE_INTERVAL:
+        return
+    try:
+        with get_connection() as conn:
+            with monitoring.DB_QUERY_LATENCY.labels('record_samples').time():
+                count = history.record_samples(conn, data)
+        last_history_sample_time = time.time()
+        logger.info(f"Stored {count} validator history samples")
+    except Exception as e:
+        logger.error(f"Error storing validator history: {e}")
+
+def take_profile_request() -> bool:
+    """Whether a profile of the next refresh cycle was requested"""
+    try:
+        with get_connection() as conn:
+            return tracing.take_profile_request(conn)
+    except Exception as e:
+        logger.error(f"Error checking for profile requests: {e}")
+        return False
+
+def store_refresh_traces() -> None:
+    try:
+        with get_connection() as conn:
+            tracing.store_traces(conn, Config.REFRESH_TRACE_HISTORY)
+    except Exception as e:
+        logger.error(f"Error storing refresh timings: {e}")
 
 def get_latest_data() -> Optional[Dict[str, Any]]:
     """Get the latest validator data from the database"""
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        with conn.cursor(cursor_factory=DictCursor) as cur:
-            cur.execute("""
-                SELECT data, timestamp
-                FROM latest_validator_data
-                ORDER BY timestamp DESC
-                LIMIT 1
-            """)
-            result = cur.fetchone()
-            if result:
-                data, timestamp = result
-                age_seconds = (datetime.now() - timestamp.replace(tzinfo=None)).total_seconds()
-                logger.info(f"Retrieved cached data from database (age: {age_seconds:.1f} seconds)")
-                return data
-            return None
+        with get_connection() as conn:
+            result = snapshot.load_snapshot(conn)
+        if result:
+            version, data, timestamp = result
+            age_seconds = (datetime.now(timezone.utc) - timestamp).total_seconds()
+            logger.info(f"Retrieved cached data from database (version {version}, age: {age_seconds:.1f} seconds)")
+            return data
+        return None
     except Exception as e:
         logger.error(f"Error retrieving data from database: {e}")
         return None
-    finally:
-        if conn:
-            conn.close()
-
-def get_cached_data() -> Optional[Dict[str, Any]]:
-    global last_cache_time, cached_data
-    current_time = time.time()
-    if cached_data and (current_time - last_cache_time) < CACHE_TTL:
-        return cached_data
-    return None
-
-def set_cached_data(data: Dict[str, Any]) -> None:
-    global last_cache_time, cached_data
-    cached_data = data
-    last_cache_time = time.time()
-
-@lru_cache(maxsize=1)
-def get_block_production() -> Dict[str, List[int]]:
-    try:
-        payload = {
-            "jsonrpc": "2.0",
-            "id": 1,
-            "method": "getBlockProduction",
-            "params": [{
-                "startSlot": 0,
-                "limit": 150
-            }]
-        }
-        logger.info(f"Making RPC request to: {Config.KOII_RPC_URL}")
-        
-        # Add proper headers for JSON-RPC request
-        headers = {
-            'Content-Type': 'application/json',
-            'Accept': 'application/json'
-        }
-        
-        response = requests.post(Config.KOII_RPC_URL, json=payload, headers=headers, timeout=10)
-        logger.info(f"Response status code: {response.status_code}")
-        logger.info(f"Response headers: {dict(response.headers)}")
-        
-        # Check content type
-        content_type = response.headers.get('content-type', '')
-        logger.info(f"Response content type: {content_type}")
-        
-        if response.status_code != 200:
-            logger.error(f"RPC endpoint returned status code {response.status_code}")
-            logger.error(f"Response text: {response.text[:200]}...")
-            return {}
 
-        if 'application/json' not in content_type.lower():
-            logger.error(f"Unexpected content type from RPC endpoint: {content_type}")
-            logger.error(f"Response text: {response.text[:200]}...")  # Log first 200 chars
-            return {}
+def get_encoded_snapshot() -> Optional[snapshot.EncodedSnapshot]:
+    """Get the pre-encoded snapshot, re-reading the bytes only when its version changed"""
+    global encoded_snapshot
+    try:
+        with get_connection() as conn:
+            encoded_snapshot = snapshot.load_encoded_snapshot(conn, encoded_snapshot)
+        return encoded_snapshot
+    except Exception as e:
+        logger.error(f"Error retrieving encoded snapshot from database: {e}")
+        return None
 
-        try:
-            data = response.json()
-        except ValueError as e:
-            logger.error(f"Failed to parse JSON from RPC endpoint: {str(e)}")
-            logger.error(f"Response text: {response.text[:200]}...")  # Log first 200 chars
-            return {}
-
-        if "error" in data:
-            logger.error(f"Error in block production: {data['error']}")
-            return {}
-        return data["result"]["value"]["byIdentity"]
+def get_snapshot_data(encoded: snapshot.EncodedSnapshot) -> Dict[str, Any]:
+    """The decoded form of `encoded`, decoded once per version"""
+    global decoded_snapshot
+    if decoded_snapshot is None or decoded_snapshot.get('snapshotVersion') != encoded.version:
+        data = snapshot.loads(encoded.body)
+        # Legacy snapshots carry no version of their own
+        data['snapshotVersion'] = encoded.version
+        decoded_snapshot = data
+    return decoded_snapshot
+
+def get_validator_index(encoded: snapshot.EncodedSnapshot) -> listing.ValidatorIndex:
+    """The sort index of `encoded`, built once per version"""
+    global validator_index
+    index = validator_index
+    if index is None or index.version != encoded.version:
+        index = listing.ValidatorIndex(get_snapshot_data(encoded))
+        validator_index = index
+    return index
+
+def get_epoch_credits() -> Optional[credits.PackedEpochCredits]:
+    """Get the packed epochCredits, re-reading them only when the snapshot version changed"""
+    global epoch_credits
+    try:
+        with get_connection() as conn:
+            epoch_credits = snapshot.load_epoch_credits(conn, epoch_credits)
+        return epoch_credits
     except Exception as e:
-        logger.error(f"Error getting block production: {e}", exc_info=True)
-        return {}
+        logger.error(f"Error retrieving epoch credits from database: {e}")
+        return None
 
-def get_cluster_nodes() -> Dict[str, str]:
-    """Get all node IPs from the cluster."""
-    global node_info_cache, last_node_info_cache_time
-    
-    current_time = time.time()
-    if node_info_cache and (current_time - last_node_info_cache_time) < NODE_INFO_CACHE_TTL:
-        return node_info_cache
-        
+def get_encoded_delta(base_version: int, version: int) -> Optional[snapshot.EncodedSnapshot]:
+    """Get the pre-encoded delta from `base_version` to the current `version`, if one was stored"""
+    global encoded_deltas, encoded_deltas_version
+    if encoded_deltas_version != version:
+        encoded_deltas = {}
+        encoded_deltas_version = version
+    if base_version in encoded_deltas:
+        return encoded_deltas[base_version]
     try:
-        payload = {
-            "jsonrpc": "2.0",
-            "id": 1,
-            "method": "getClusterNodes",
-            "params": []
+        with get_connection() as conn:
+            delta = snapshot.load_delta(conn, base_version, version)
+    except Exception as e:
+        logger.error(f"Error retrieving snapshot delta from database: {e}")
+        return None
+    if delta is not None:
+        encoded_deltas[base_version] = delta
+    return delta
+
+def negotiate_encoding(encoded: snapshot.EncodedSnapshot) -> Tuple[bytes, Optional[str]]:
+    """The variant of `encoded` to send and its Content-Encoding"""
+    if encoded.br is not None and request.accept_encodings['br'] > 0:
+        return encoded.br, 'br'
+    if request.accept_encodings['gzip'] > 0:
+        return encoded.gzip, 'gzip'
+    return encoded.body, None
+
+def encoded_response(encoded: snapshot.EncodedSnapshot) -> Response:
+    """Serve pre-encoded snapshot bytes, honoring If-None-Match and Accept-Encoding"""
+    content, encoding = negotiate_encoding(encoded)
+    etag = encoded.variant_etag(content)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(content, mimetype='application/json')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    if encoded.modified is not None:
+        response.last_modified = encoded.modified
+    response.headers['Vary'] = 'Accept-Encoding'
+    # Clients may keep the body but must revalidate it
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+# Validator fields clients can select with ?fields=; epochCredits only come when asked for
+VALIDATOR_FIELDS = RECORD_FIELDS + ('epochCredits',)
+
+def parse_fields(value: str) -> List[str]:
+    """The validator fields named in a `fields` parameter; raises ValueError on unknown ones"""
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in VALIDATOR_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields or list(RECORD_FIELDS)
+
+def project_validators(validators: List[Dict[str, Any]], fields: List[str]) -> List[Dict[str, Any]]:
+    """Only `fields` of each validator, with epochCredits unpacked if requested"""
+    packed = get_epoch_credits() if 'epochCredits' in fields else None
+    return [
+        {
+            field: (packed.get(validator['voteAccountPubkey']) if packed else None)
+            if field == 'epochCredits' else validator.get(field)
+            for field in fields
         }
-        response = requests.post(Config.KOII_RPC_URL, json=payload)
-
-        # Check content type
-        content_type = response.headers.get('content-type', '')
-        if 'application/json' not in content_type.lower():
-            logger.error(f"Unexpected content type from RPC endpoint: {content_type}")
-            logger.error(f"Response text: {response.text[:200]}...")  # Log first 200 chars
-            return {}
+        for validator in validators
+    ]
+
+def parse_int(args, name: str, default: Optional[int], low: int = 0, high: Optional[int] = None) -> Optional[int]:
+    """An integer query parameter within [low, high]; raises ValueError otherwise"""
+    value = args.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer") from None
+    if number < low or (high is not None and number > high):
+        raise ValueError(f"{name} must be between {low} and {high}" if high is not None else f"{name} must be at least {low}")
+    return number
+
+def parse_validator_query(args) -> Dict[str, Any]:
+    """The sort, filters and page of an /api/validators/page request; raises ValueError on bad parameters"""
+    sort = args.get('sort') or 'activatedStake'
+    if sort not in listing.SORT_FIELDS:
+        raise ValueError(f"Cannot sort by {sort}; use one of {', '.join(listing.SORT_FIELDS)}")
+    order = args.get('order') or 'desc'
+    if order not in ('asc', 'desc'):
+        raise ValueError("order must be asc or desc")
+    delinquent = args.get('delinquent')
+    if delinquent is not None and delinquent not in ('true', 'false'):
+        raise ValueError("delinquent must be true or false")
+    cursor = args.get('cursor')
+    if cursor and args.get('offset'):
+        raise ValueError("Use either offset or cursor")
+    return {
+        'sort': sort,
+        'descending': order == 'desc',
+        'delinquent': None if delinquent is None else delinquent == 'true',
+        'versions': [version.strip() for version in args.get('version', '').split(',') if version.strip()],
+        'min_stake': parse_int(args, 'minStake', None),
+        'limit': parse_int(args, 'limit', Config.VALIDATORS_PAGE_LIMIT, 1, Config.VALIDATORS_MAX_LIMIT),
+        'offset': parse_int(args, 'offset', 0),
+        'after': listing.decode_cursor(cursor) if cursor else None
+    }
+
+def json_response(data: Any, status: int = 200) -> Response:
+    """A JSON response serialized like the snapshots"""
+    response = Response(snapshot.dumps(data), status=status, mimetype='application/json')
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def get_block_production(epoch_info: Dict[str, Any]) -> Optional[Dict[str, List[int]]]:
+    """Block production of the current epoch so far, fetching only the slots since the last refresh"""
+    try:
+        return block_production_tracker.update(epoch_info)
+    except Exception as e:
+        logger.error(f"Error getting block production: {e}", exc_info=True)
+        return None
 
-        try:
-            data = response.json()
-        except ValueError as e:
-            logger.error(f"Failed to parse JSON from RPC endpoint: {str(e)}")
-            logger.error(f"Response text: {response.text[:200]}...")  # Log first 200 chars
-            return {}
-            
-        if "error" in data:
-            logger.error(f"RPC error in getClusterNodes: {data['error']}")
-            return {}
-            
-        if "result" not in data:
-            logger.error("Unexpected response structure from getClusterNodes")
-            return {}
-            
-        # Build a map of pubkey to IP
-        node_map = {}
-        for node in data["result"]:
-            pubkey = node.get("pubkey")
-            gossip = node.get("gossip")
-            if pubkey and gossip:
-                # Extract IP from gossip address (format: IP:PORT)
-                ip = gossip.split(":")[0]
-                if ip and ip != "0.0.0.0":
-                    node_map[pubkey] = ip
-        
-        # Update cache
-        node_info_cache = node_map
-        last_node_info_cache_time = current_time
-        
-        return node_map
-        
+def _parse_cluster_nodes(result: List[Dict[str, Any]]) -> Dict[str, str]:
+    # Build a map of pubkey to IP
+    node_map = {}
+    for node in result:
+        pubkey = node.get("pubkey")
+        gossip = node.get("gossip")
+        if pubkey and gossip:
+            # Extract IP from gossip address (format: IP:PORT)
+            ip = gossip.split(":")[0]
+            if ip and ip != "0.0.0.0":
+                node_map[pubkey] = ip
+    return node_map
+
+def load_cluster_nodes() -> Optional[Dict[str, str]]:
+    """Fetch the node map from the cluster; None on error so it is not cached"""
+    try:
+        return _parse_cluster_nodes(rpc_client.call("getClusterNodes"))
+    except RpcError as e:
+        logger.error(f"RPC error in getClusterNodes: {e}")
+        return None
     except Exception as e:
         logger.error(f"Error getting cluster nodes: {e}")
-        return {}
+        return None
+
+def get_cluster_nodes() -> Dict[str, str]:
+    """Get all node IPs from the cluster."""
+    return cluster_nodes_cache.get_or_load(load_cluster_nodes) or {}
 
 def get_validator_ip(identity_pubkey: str) -> Optional[str]:
     """Get the IP address of a validator."""
@@ -270,297 +401,289 @@ def get_validator_ip(identity_pubkey: str) -> Optional[str]:
         return None
 
 def get_location_from_ip(ip: str) -> Optional[Dict[str, Any]]:
-    """Get location data for an IP address using IP-API."""
-    if ip in ip_cache:
-        return ip_cache[ip]
-        
+    """Get location data for an IP address."""
     try:
-        response = requests.get(f'http://ip-api.com/json/{ip}')
-        if response.status_code == 200:
-            data = response.json()
-            if data['status'] == 'success':
-                location = {
-                    'latitude': data['lat'],
-                    'longitude': data['lon'],
-                    'city': data['city'],
-                    'country': data['country']
-                }
-                ip_cache[ip] = location
-                return location
-        return None
+        return geo_locator.lookup(ip)
     except Exception as e:
         logger.error(f"Error getting location for IP {ip}: {e}")
         return None
 
-def get_validator_rewards(vote_accounts: List[str], epoch: Optional[int] = None) -> Dict[str, float]:
-    try:
-        # Get current epoch if not specified
-        if epoch is None:
-            epoch_payload = {
-                "jsonrpc": "2.0",
-                "id": 1,
-                "method": "getEpochInfo",
-                "params": []
-            }
-            epoch_response = requests.post(Config.KOII_RPC_URL, json=epoch_payload)
-            if epoch_response.status_code == 200:
-                epoch_data = epoch_response.json()
-                if "result" in epoch_data:
-                    current_epoch = epoch_data["result"].get("epoch")
-                    # Use previous epoch
-                    epoch = current_epoch - 1
-                else:
-                    logger.error("Failed to get current epoch")
-                    return {}
-            else:
-                logger.error(f"Failed to get epoch info: HTTP status code {epoch_response.status_code}")
-                return {}
-
-        # Get finalized slot for the epoch
-        slot_payload = {
-            "jsonrpc": "2.0",
-            "id": 1,
-            "method": "getEpochSchedule",
-            "params": []
-        }
-        slot_response = requests.post(Config.KOII_RPC_URL, json=slot_payload)
-        if slot_response.status_code == 200:
-            slot_data = slot_response.json()
-            if "result" in slot_data:
-                slots_per_epoch = slot_data["result"].get("slotsPerEpoch", 432000)
-                # Use a slot from the middle of the epoch to ensure it's finalized
-                target_slot = (epoch * slots_per_epoch) + (slots_per_epoch // 2)
-            else:
-                logger.error("Failed to get epoch schedule")
-                return {}
-        else:
-            logger.error(f"Failed to get epoch schedule: HTTP status code {slot_response.status_code}")
-            return {}
-
-        # Create params array with vote account addresses
-        params = [vote_accounts]  # Pass as array of arrays
-        params.append({
-            "epoch": epoch,
-            "commitment": "finalized",
-            "minContextSlot": target_slot
-        })
+def get_rpc_epoch_info() -> Optional[Dict[str, Any]]:
+    """Get the raw getEpochInfo result"""
+    try:
+        return rpc_client.call("getEpochInfo")
+    except RpcError as e:
+        logger.error(f"Failed to get epoch info: {e}")
+        return None
 
-        payload = {
-            "jsonrpc": "2.0",
-            "id": 1,
-            "method": "getInflationReward",
-            "params": params
-        }
-        
-        response = requests.post(Config.KOII_RPC_URL, json=payload)
-        if response.status_code != 200:
-            logger.error(f"Failed to get inflation rewards: HTTP status code {response.status_code}")
-            return {}
-
-        data = response.json()
-        if "error" in data:
-            logger.error(f"Error getting inflation rewards: {data['error']}")
-            return {}
-
-        result = data.get("result", [])
-        if not result or not isinstance(result, list):
-            logger.error("No result data in inflation rewards response")
-            return {}
-
-        # Process all rewards
-        rewards = {}
-        for i, reward_data in enumerate(result):
-            if i >= len(vote_accounts):
-                break
-            vote_account = vote_accounts[i]
-            if reward_data:
-                reward = reward_data.get("amount", 0) / 1e9
-                rewards[vote_account] = reward
-            else:
-                rewards[vote_account] = 0
+def get_slots_per_epoch() -> Optional[int]:
+    """Get the number of slots per epoch from the epoch schedule"""
+    try:
+        return rpc_client.call("getEpochSchedule").get("slotsPerEpoch", 432000)
+    except RpcError as e:
+        logger.error(f"Failed to get epoch schedule: {e}")
+        return None
+    except Exception as e:
+        logger.error(f"Error getting epoch schedule: {e}", exc_info=True)
+        return None
 
-        return rewards
+def get_validator_rewards(vote_accounts: List[str], epoch: int, slots_per_epoch: int) -> Optional[rewards.EpochRewards]:
+    """The rewards of `epoch`, read from the database and fetched only for vote accounts not stored yet"""
+    global epoch_rewards
+    if not rewards_lock.acquire(blocking=False):
+        # A fetch started by an earlier cycle is still running
+        known = epoch_rewards
+        return known if known and known.epoch == epoch else None
+    try:
+        known = epoch_rewards
+        if known is None or known.epoch != epoch:
+            known = rewards.EpochRewards(epoch)
+            try:
+                with get_connection() as conn:
+                    known.add(rewards.load_rewards(conn, epoch))
+                logger.info(f"Loaded {len(known)} stored rewards of epoch {epoch}")
+            except Exception as e:
+                logger.error(f"Error loading stored rewards of epoch {epoch}: {e}")
+            epoch_rewards = known
+
+        missing = known.missing(vote_accounts)
+        if missing:
+            # A slot from the middle of the epoch ensures it's finalized
+            target_slot = (epoch * slots_per_epoch) + (slots_per_epoch // 2)
+            fetched = rewards.fetch_rewards(
+                rpc_client, missing, epoch, target_slot,
+                Config.RPC_REWARDS_CHUNK_SIZE, Config.RPC_REWARDS_RETRIES, Config.RPC_REWARDS_TIMEOUT
+            )
+            logger.info(f"Fetched epoch {epoch} rewards of {len(fetched)} of {len(missing)} vote accounts")
+            known.add(fetched)
+            if fetched:
+                try:
+                    with get_connection() as conn:
+                        rewards.store_rewards(conn, epoch, fetched)
+                except Exception as e:
+                    logger.error(f"Error storing rewards of epoch {epoch}: {e}")
+        return known
     except Exception as e:
         logger.error(f"Error getting inflation rewards: {e}", exc_info=True)
-        return {}
+        return epoch_rewards if epoch_rewards and epoch_rewards.epoch == epoch else None
+    finally:
+        rewards_lock.release()
 
-def calculate_validator_metrics(validator: Dict[str, Any], block_production: Dict[str, List[int]], total_stake: int, inflation_rate: float, rewards: Dict[str, float], all_validators: List[Dict[str, Any]], network_apr: float) -> Dict[str, Any]:
+def calculate_validator_metrics(validator: Dict[str, Any], block_production: Dict[str, List[int]], network_apr: float, locations: Optional[Dict[str, Optional[Dict[str, Any]]]] = None) -> Optional[Dict[str, Any]]:
+    """Metrics of a single validator; refreshes compute them all at once with ValidatorColumns"""
     try:
-        vote_pubkey = str(validator.get("votePubkey", ""))
-        identity_pubkey = str(validator.get("nodePubkey", vote_pubkey))
-        stake = int(validator.get("activatedStake", 0))
-        commission = int(validator.get("commission", 0)) / 100  # Convert percentage to decimal
-        
-        # Skip rate calculation
-        skip_rate = 0
-        if identity_pubkey in block_production:
-            slots = block_production[identity_pubkey]
-            assigned_slots = int(slots[0])
-            produced_blocks = int(slots[1])
-            missed_slots = assigned_slots - produced_blocks
-            skip_rate = (missed_slots / assigned_slots) * 100 if assigned_slots > 0 else 0
-        
-        # Calculate epoch credits growth
-        epoch_credits = validator.get("epochCredits", [])
-        credits_growth = 0
-        if len(epoch_credits) >= 2:
-            latest = epoch_credits[-1]
-            previous = epoch_credits[-2]
-            credits_growth = latest[2] - previous[2]
-        
-        # Get rewards from the rewards dictionary
-        reward = rewards.get(vote_pubkey, 0)
-        
-        # Calculate validator APR as Network APR minus commission
-        validator_apr = network_apr - (network_apr * commission)
-        
-        # Log validator APR calculation for debugging
-        logger.info(f"Validator {identity_pubkey} APR calculation:")
-        logger.info(f"  Network APR: {network_apr:.2f}%")
-        logger.info(f"  Commission Rate: {commission:.2%}")
-        logger.info(f"  Final Validator APR: {validator_apr:.2f}%")
-        logger.info("---")
-        
-        # Get validator IP and location
-        ip_address = get_validator_ip(identity_pubkey)
-        location = get_location_from_ip(ip_address) if ip_address else None
-        
-        return {
-            'identityPubkey': identity_pubkey,
-            'voteAccountPubkey': vote_pubkey,
-            'commission': int(validator.get("commission", 0)),
-            'lastVote': int(validator.get("lastVote", 0)),
-            'rootSlot': int(validator.get("rootSlot", 0)),
-            'credits': int(validator.get("credits", 0)),
-            'epochCredits': epoch_credits,
-            'activatedStake': stake,
-            'version': str(validator.get("version", "1.16.0")),
-            'skipRate': skip_rate,
-            'creditsGrowth': credits_growth,
-            'location': location,
-            'delinquent': False,
-            'apr': validator_apr
-        }
+        columns = ValidatorColumns([validator], [], block_production)
+        if locations is None:
+            ip_address = get_validator_ip(columns.identities[0])
+            locations = {columns.identities[0]: get_location_from_ip(ip_address) if ip_address else None}
+        return columns.records(columns.apr(network_apr), locations)[0].to_dict()
     except Exception as e:
-        logger.error(f"Error calculating metrics for validator {vote_pubkey}: {e}", exc_info=True)
+        logger.error(f"Error calculating metrics for validator {validator.get('votePubkey')}: {e}", exc_info=True)
         return None
 
-def get_inflation_rate() -> Optional[float]:
-    try:
-        payload = {
-            "jsonrpc": "2.0",
-            "id": 1,
-            "method": "getInflationRate",
-            "params": []
-        }
-        response = requests.post(Config.KOII_RPC_URL, json=payload)
-        if response.status_code != 200:
-            logger.error("Failed to get inflation rate: HTTP status code %d", response.status_code)
-            return None
+def _parse_inflation_rate(result: Dict[str, Any]) -> Optional[float]:
+    if not result:
+        logger.error("No result data in inflation rate response")
+        return None
 
-        data = response.json()
-        if "error" in data:
-            logger.error(f"Error getting inflation rate: {data['error']}")
-            return None
+    # Log the complete inflation rate structure
+    logger.info(f"Complete inflation rate result: {json.dumps(result, indent=2)}")
 
-        result = data.get("result", {})
-        if not result:
-            logger.error("No result data in inflation rate response")
-            return None
+    # Get inflation rate components directly from result
+    validator_rate = result.get("validator")
+    foundation_rate = result.get("foundation")
+    total_rate = result.get("total")
+    current_epoch = result.get("epoch")
 
-        # Log the complete inflation rate structure
-        logger.info(f"Complete inflation rate result: {json.dumps(result, indent=2)}")
-        
-        # Get inflation rate components directly from result
-        validator_rate = result.get("validator")
-        foundation_rate = result.get("foundation")
-        total_rate = result.get("total")
-        current_epoch = result.get("epoch")
-        
-        # Log raw values before conversion
-        logger.info("Raw inflation rate values:")
-        logger.info(f"  Current epoch: {current_epoch}")
-        logger.info(f"  Validator rate (raw): {validator_rate}")
-        logger.info(f"  Foundation rate (raw): {foundation_rate}")
-        logger.info(f"  Total rate (raw): {total_rate}")
-        
-        # Convert to float and handle None values
-        validator_rate = float(validator_rate) if validator_rate is not None else 0
-        foundation_rate = float(foundation_rate) if foundation_rate is not None else 0
-        total_rate = float(total_rate) if total_rate is not None else 0
-        
-        logger.info("Inflation rate components:")
-        logger.info(f"  Validator rate: {validator_rate * 100:.2f}%")
-        logger.info(f"  Foundation rate: {foundation_rate * 100:.2f}%")
-        logger.info(f"  Total rate: {total_rate * 100:.2f}%")
-        
-        return validator_rate
+    # Log raw values before conversion
+    logger.info("Raw inflation rate values:")
+    logger.info(f"  Current epoch: {current_epoch}")
+    logger.info(f"  Validator rate (raw): {validator_rate}")
+    logger.info(f"  Foundation rate (raw): {foundation_rate}")
+    logger.info(f"  Total rate (raw): {total_rate}")
+
+    # Convert to float and handle None values
+    validator_rate = float(validator_rate) if validator_rate is not None else 0
+    foundation_rate = float(foundation_rate) if foundation_rate is not None else 0
+    total_rate = float(total_rate) if total_rate is not None else 0
+
+    logger.info("Inflation rate components:")
+    logger.info(f"  Validator rate: {validator_rate * 100:.2f}%")
+    logger.info(f"  Foundation rate: {foundation_rate * 100:.2f}%")
+    logger.info(f"  Total rate: {total_rate * 100:.2f}%")
+
+    return validator_rate
+
+def get_inflation_rate() -> Optional[float]:
+    try:
+        return _parse_inflation_rate(rpc_client.call("getInflationRate"))
+    except RpcError as e:
+        logger.error(f"Error getting inflation rate: {e}")
+        return None
     except Exception as e:
         logger.error(f"Error getting inflation rate: {e}", exc_info=True)
         return None
 
-def get_total_supply() -> Optional[int]:
-    try:
-        payload = {
-            "jsonrpc": "2.0",
-            "id": 1,
-            "method": "getSupply",
-            "params": [{"commitment": "finalized"}]
-        }
-        response = requests.post(Config.KOII_RPC_URL, json=payload)
-        if response.status_code != 200:
-            logger.error("Failed to get total supply: HTTP status code %d", response.status_code)
-            return None
+def _parse_total_supply(result: Dict[str, Any]) -> Optional[int]:
+    if not result:
+        logger.error("No result data in supply response")
+        return None
 
-        data = response.json()
-        if "error" in data:
-            logger.error(f"Error getting total supply: {data['error']}")
-            return None
+    # Get total supply from the nested value object
+    value = result.get("value", {})
+    if not value:
+        logger.error("No value object in supply response")
+        return None
 
-        result = data.get("result", {})
-        if not result:
-            logger.error("No result data in supply response")
-            return None
+    total = value.get("total")
+    if total is None:
+        logger.error("No total supply value in response")
+        return None
 
-        # Get total supply from the nested value object
-        value = result.get("value", {})
-        if not value:
-            logger.error("No value object in supply response")
-            return None
+    return total
 
-        total = value.get("total")
-        if total is None:
-            logger.error("No total supply value in response")
-            return None
-
-        return total
+def get_total_supply() -> Optional[int]:
+    try:
+        return _parse_total_supply(rpc_client.call("getSupply", [{"commitment": "finalized"}]))
+    except RpcError as e:
+        logger.error(f"Error getting total supply: {e}")
+        return None
     except Exception as e:
         logger.error(f"Error getting total supply: {e}", exc_info=True)
         return None
 
-def get_validator_info() -> Optional[Dict[str, Any]]:
+def _parse_vote_accounts(result: Dict[str, Any]) -> Dict[str, List[Dict[str, Any]]]:
+    return {
+        'current': result.get("current", []),
+        'delinquent': result.get("delinquent", [])
+    }
+
+def get_vote_accounts() -> Optional[Dict[str, List[Dict[str, Any]]]]:
+    """Get current and delinquent vote accounts"""
+    logger.info(f"Making validator RPC request to: {', '.join(Config.KOII_RPC_URLS)}")
     try:
-        # Check cache first
-        cached_data = get_cached_data()
-        if cached_data:
-            return cached_data
+        return _parse_vote_accounts(rpc_client.call("getVoteAccounts", [{"commitment": "confirmed"}]))
+    except RpcError as e:
+        logger.error(f"Error getting validators: {e}")
+        return None
+
+# First-stage calls sent as one JSON-RPC batch: name -> (method, params, parser)
+UPSTREAM_BATCH = {
+    'inflationRate': ("getInflationRate", [], _parse_inflation_rate),
+    'totalSupply': ("getSupply", [{"commitment": "finalized"}], _parse_total_supply),
+    'voteAccounts': ("getVoteAccounts", [{"commitment": "confirmed"}], _parse_vote_accounts),
+    'clusterNodes': ("getClusterNodes", [], _parse_cluster_nodes),
+    'rpcEpochInfo': ("getEpochInfo", [], lambda result: result if "epoch" in result else None),
+    'slotsPerEpoch': ("getEpochSchedule", [], lambda result: result.get("slotsPerEpoch", 432000))
+}
+
+# Every source by name, fetched one call each
+SOURCE_LOADERS = {
+    'inflationRate': get_inflation_rate,
+    'totalSupply': get_total_supply,
+    'voteAccounts': get_vote_accounts,
+    'clusterNodes': load_cluster_nodes,
+    'rpcEpochInfo': get_rpc_epoch_info,
+    'slotsPerEpoch': get_slots_per_epoch,
+    # Defined further down
+    'koiiPrice': lambda: fetch_koii_price()
+}
 
-        if not Config.KOII_RPC_URL:
+# Sources the validator metrics are computed from; the rest only fill in snapshot fields
+VALIDATOR_SOURCES = frozenset(('inflationRate', 'totalSupply', 'voteAccounts', 'clusterNodes', 'rpcEpochInfo', 'slotsPerEpoch'))
+
+def fetch_upstream_batch(names: List[str]) -> FanOutResult:
+    """Fetch the named first-stage RPC sources in a single round trip"""
+    upstream = FanOutResult()
+    calls = {name: UPSTREAM_BATCH[name] for name in names}
+    started = upstream.started = time.time()
+    responses = rpc_client.batch([(method, params) for method, params, _ in calls.values()])
+    for (name, (method, _, parser)), response in zip(calls.items(), responses):
+        upstream.durations[name] = time.time() - started
+        try:
+            if isinstance(response, RpcError):
+                raise response
+            value = parser(response)
+            if value is None:
+                upstream.errors[name] = 'returned no data'
+            else:
+                upstream.results[name] = value
+        except Exception as e:
+            upstream.errors[name] = str(e)
+            logger.warning(f"Batched call {name} failed: {e}")
+
+    logger.info(f"Batched {len(calls)} RPC calls in {time.time() - started:.2f}s")
+    return upstream
+
+def fetch_upstream(names: List[str]) -> FanOutResult:
+    """Fetch the named sources: RPC ones batched if enabled, else concurrently, the price alongside"""
+    rpc_names = [name for name in names if name in UPSTREAM_BATCH]
+    others = FanOut({name: SOURCE_LOADERS[name] for name in names if name not in UPSTREAM_BATCH})
+    upstream = None
+    if Config.RPC_BATCH and rpc_names:
+        try:
+            upstream = fetch_upstream_batch(rpc_names)
+        except RpcError as e:
+            logger.warning(f"Batch request failed, falling back to concurrent calls: {e}")
+    if upstream is None:
+        # None of these calls depend on each other, so send them together
+        upstream = fan_out({name: SOURCE_LOADERS[name] for name in rpc_names})
+
+    extras = others.wait()
+    upstream.results.update(extras.results)
+    upstream.errors.update(extras.errors)
+    upstream.durations.update(extras.durations)
+    return upstream
+
+def refresh_sources() -> Set[str]:
+    """Fetch the sources that are due; returns the names of those whose value changed"""
+    due = source_schedule.due()
+    if not due:
+        return set()
+    with tracing.span('upstream'):
+        upstream = fetch_upstream(due)
+    monitoring.record_stages(upstream.durations)
+    tracing.record_fanout(upstream, 'upstream')
+
+    changed = source_schedule.record(due, upstream.results)
+    if 'clusterNodes' in upstream.results:
+        cluster_nodes_cache.set(upstream.results['clusterNodes'])
+    epoch_info = upstream.get('rpcEpochInfo')
+    if epoch_info:
+        source_schedule.observe_epoch(epoch_info.get('epoch'))
+    logger.info(f"Fetched {', '.join(due)}; changed: {', '.join(sorted(changed)) or 'nothing'}")
+    return changed
+
+def get_validator_info() -> Optional[Dict[str, Any]]:
+    """Validator info, cached for CACHE_TTL; concurrent callers share one fetch"""
+    return validator_info_cache.get_or_load(fetch_validator_info)
+
+def fetch_validator_info() -> Optional[Dict[str, Any]]:
+    try:
+        if not Config.KOII_RPC_URLS:
             logger.error("KOII_RPC_URL is not configured")
             return None
 
+        # The sources as last fetched by refresh_sources
+        sources = source_schedule.values()
+
         # Get real inflation rate from RPC
-        inflation_rate = get_inflation_rate()
+        inflation_rate = sources.get('inflationRate')
         if inflation_rate is None:
             logger.error("Failed to get inflation rate")
             return None
 
         # Get total supply
-        total_supply = get_total_supply()
+        total_supply = sources.get('totalSupply')
         if total_supply is None:
             logger.error("Failed to get total supply")
             return None
 
+        vote_accounts = sources.get('voteAccounts')
+        if vote_accounts is None:
+            logger.error("Failed to get vote accounts")
+            return None
+
         # Calculate total rewards using total supply and inflation rate
         total_rewards = (total_supply * inflation_rate) / 1e9  # Convert to KOII
         total_supply_koii = total_supply / 1e9
@@ -570,68 +693,9 @@ def get_validator_info() -> Optional[Dict[str, Any]]:
         logger.info(f"Inflation rate: {inflation_rate * 100:.2f}%")
         logger.info(f"Total rewards: {total_rewards:.2f} KOII")
 
-        # Get validators
-        validators_payload = {
-            "jsonrpc": "2.0",
-            "id": 1,
-            "method": "getVoteAccounts",
-            "params": [{
-                "commitment": "confirmed"
-            }]
-        }
-        
-        # Add proper headers for JSON-RPC request
-        headers = {
-            'Content-Type': 'application/json',
-            'Accept': 'application/json'
-        }
-        
-        logger.info(f"Making validator RPC request to: {Config.KOII_RPC_URL}")
-        
-        try:
-            response = requests.post(Config.KOII_RPC_URL, json=validators_payload, headers=headers, timeout=10)
-            logger.info(f"Response status code: {response.status_code}")
-            logger.info(f"Response headers: {dict(response.headers)}")
-            
-            if response.status_code != 200:
-                logger.error(f"RPC endpoint returned status code {response.status_code}")
-                logger.error(f"Response text: {response.text[:200]}...")
-                return None
-            
-            # Check content type
-            content_type = response.headers.get('content-type', '')
-            logger.info(f"Response content type: {content_type}")
-            
-            if 'application/json' not in content_type.lower():
-                logger.error(f"Unexpected content type from RPC endpoint: {content_type}")
-                logger.error(f"Response text: {response.text[:200]}...")
-                return None
-
-            try:
-                validators_response = response.json()
-            except ValueError as e:
-                logger.error(f"Failed to parse JSON from RPC endpoint: {str(e)}")
-                logger.error(f"Response text: {response.text[:200]}...")
-                return None
+        current_validators = vote_accounts['current']
+        delinquent_validators = vote_accounts['delinquent']
 
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Failed to connect to RPC endpoint: {e}")
-            return None
-        
-        if "error" in validators_response:
-            logger.error(f"Error getting validators: {validators_response['error']}")
-            return None
-            
-        if "result" not in validators_response:
-            logger.error("Unexpected validators response structure:", validators_response)
-            return None
-            
-        current_validators = validators_response["result"].get("current", [])
-        delinquent_validators = validators_response["result"].get("delinquent", [])
-        
-        # Get block production data
-        block_production = get_block_production()
-        
         # Collect all vote account pubkeys
         all_vote_accounts = []
         for validator in current_validators + delinquent_validators:
@@ -639,26 +703,30 @@ def get_validator_info() -> Optional[Dict[str, Any]]:
             if vote_pubkey:
                 all_vote_accounts.append(vote_pubkey)
         
-        # Get rewards for all validators in a single call
-        rewards = get_validator_rewards(all_vote_accounts)
-        
-        # Process validators
-        processed_validators = []
-        total_active_stake = 0
-        total_current_stake = 0
-        total_delinquent_stake = 0
-        
-        # First pass: calculate total stakes
-        for validator in current_validators:
-            stake = int(validator.get("activatedStake", 0))
-            total_active_stake += stake
-            total_current_stake += stake
-        
-        for validator in delinquent_validators:
-            stake = int(validator.get("activatedStake", 0))
-            total_delinquent_stake += stake
-            total_current_stake += stake
+        # Second stage: block production since the last refresh and last epoch's rewards
+        epoch_info = sources.get('rpcEpochInfo')
+        current_epoch = epoch_info.get('epoch') if epoch_info else None
+        slots_per_epoch = sources.get('slotsPerEpoch')
+        second_stage = {}
+        if epoch_info:
+            second_stage['blockProduction'] = lambda: get_block_production(epoch_info)
+        if current_epoch is not None and slots_per_epoch is not None:
+            second_stage['rewards'] = lambda: get_validator_rewards(all_vote_accounts, current_epoch - 1, slots_per_epoch)
+        with tracing.span('second_stage'):
+            second = fan_out(second_stage, timeouts={'rewards': Config.RPC_REWARDS_TIMEOUT})
+        monitoring.record_stages(second.durations)
+        tracing.record_fanout(second, 'second_stage')
+
+        # Block production is optional: skip rates fall back to 0 without it
+        block_production = second.get('blockProduction', {})
+        # Without last epoch's rewards APR falls back to the network estimate
+        last_epoch_rewards = second.get('rewards')
         
+        # Load all vote accounts into columns once
+        with monitoring.REFRESH_STAGE_DURATION.labels('metrics').time(), tracing.span('metrics'):
+            columns = ValidatorColumns(current_validators, delinquent_validators, block_production)
+        total_active_stake, total_current_stake, total_delinquent_stake = columns.stake_totals()
+
         # Calculate Network APR using total rewards and total active stake
         total_stake_in_koii = total_active_stake / 1e9  # Convert lamports to KOII
         network_apr = (total_rewards / total_stake_in_koii) * 100 if total_stake_in_koii > 0 else 0
@@ -667,98 +735,48 @@ def get_validator_info() -> Optional[Dict[str, Any]]:
         logger.info(f"Total active stake: {total_stake_in_koii:.2f} KOII")
         logger.info(f"Network APR: {network_apr:.2f}%")
 
-        # Process validators with the calculated network_apr
-        all_validators = current_validators + delinquent_validators
-        for validator in current_validators:
-            metrics = calculate_validator_metrics(validator, block_production, total_active_stake, inflation_rate, rewards, all_validators, network_apr)
-            if metrics:
-                metrics['delinquent'] = False
-                processed_validators.append(metrics)
-        
-        for validator in delinquent_validators:
-            metrics = calculate_validator_metrics(validator, block_production, total_active_stake, inflation_rate, rewards, all_validators, network_apr)
-            if metrics:
-                metrics['delinquent'] = True
-                processed_validators.append(metrics)
-        
+        # Resolve all validator locations with one bulk lookup
+        node_map = sources.get('clusterNodes', {})
+        validator_ips = {identity: node_map.get(identity) for identity in columns.identities}
+        with monitoring.REFRESH_STAGE_DURATION.labels('geolocation').time(), tracing.span('geolocation'):
+            ip_locations = geo_locator.lookup_many(validator_ips.values())
+        locations = {identity: ip_locations.get(ip) if ip else None for identity, ip in validator_ips.items()}
+
+        with tracing.span('records'):
+            apr = columns.apr(network_apr)
+            if last_epoch_rewards is not None:
+                apr = last_epoch_rewards.apr(columns, rewards.epochs_per_year(slots_per_epoch, Config.SLOT_DURATION), apr)
+            processed_validators = columns.records(apr, locations)
+            delinquent_count = int(columns.delinquent.sum())
+            version_stats = columns.version_stats(apr)
+
         # Calculate statistics
         stats = {
             'totalActiveStake': total_active_stake,
             'totalCurrentStake': total_current_stake,
             'totalDelinquentStake': total_delinquent_stake,
             'validators': processed_validators,
-            'averageSkipRate': sum(v['skipRate'] for v in processed_validators) / len(processed_validators) if processed_validators else 0,
+            'averageSkipRate': columns.average_skip_rate(),
             'networkApr': network_apr,
             'inflationRate': inflation_rate * 100,
-            'totalValidators': len(processed_validators),
-            'activeValidators': len([v for v in processed_validators if not v['delinquent']]),
-            'delinquentValidators': len([v for v in processed_validators if v['delinquent']]),
-            'stakeByVersion': {}
+            'totalValidators': len(columns),
+            'activeValidators': len(columns) - delinquent_count,
+            'delinquentValidators': delinquent_count,
+            'stakeByVersion': version_stats
         }
         
-        # Group by version
-        for validator in processed_validators:
-            version = validator['version']
-            if version not in stats['stakeByVersion']:
-                stats['stakeByVersion'][version] = {
-                    'currentValidators': 0,
-                    'delinquentValidators': 0,
-                    'currentActiveStake': 0,
-                    'delinquentActiveStake': 0,
-                    'averageSkipRate': 0,
-                    'averageCreditsGrowth': 0,
-                    'averageApr': 0,
-                    'totalApr': 0,
-                    'validatorsWithApr': 0
-                }
-            
-            version_stats = stats['stakeByVersion'][version]
-            if validator['delinquent']:
-                version_stats['delinquentValidators'] += 1
-                version_stats['delinquentActiveStake'] += validator['activatedStake']
-            else:
-                version_stats['currentValidators'] += 1
-                version_stats['currentActiveStake'] += validator['activatedStake']
-            
-            version_stats['averageSkipRate'] += validator['skipRate']
-            version_stats['averageCreditsGrowth'] += validator['creditsGrowth']
-            
-            # Add APR to version stats
-            if validator.get('apr') is not None:
-                version_stats['totalApr'] += validator['apr']
-                version_stats['validatorsWithApr'] += 1
-        
-        # Calculate averages for each version
-        for version_stats in stats['stakeByVersion'].values():
-            total_validators = version_stats['currentValidators'] + version_stats['delinquentValidators']
-            if total_validators > 0:
-                version_stats['averageSkipRate'] /= total_validators
-                version_stats['averageCreditsGrowth'] /= total_validators
-                if version_stats['validatorsWithApr'] > 0:
-                    version_stats['averageApr'] = version_stats['totalApr'] / version_stats['validatorsWithApr']
-        
-        # Cache the results
-        set_cached_data(stats)
-        
         return stats
         
     except Exception as e:
         logger.error(f"Error in get_validator_info: {e}", exc_info=True)
         return None
 
-def get_koii_price() -> Optional[float]:
+def fetch_koii_price() -> Optional[float]:
     try:
-        global price_cache, last_price_cache_time
-        current_time = time.time()
-
-        # Return cached price if within TTL
-        if price_cache is not None and (current_time - last_price_cache_time) < Config.PRICE_CACHE_TTL:
-            return price_cache
-
         # Check if we have an API key
         if not Config.CRYPTORANK_API_KEY:
             logger.warning("No Cryptorank API key configured. Price updates disabled.")
-            return price_cache or None
+            return None
 
         # Fetch price from Cryptorank API using X-Api-Key header
         headers = {
@@ -769,7 +787,7 @@ def get_koii_price() -> Optional[float]:
         
         if not url:
             logger.warning("No Cryptorank API URL configured")
-            return price_cache or None
+            return None
 
         logger.info(f"Fetching KOII price from Cryptorank API")
         
@@ -778,47 +796,28 @@ def get_koii_price() -> Optional[float]:
             response.raise_for_status()  # Raise exception for bad status codes
         except requests.exceptions.RequestException as e:
             logger.error(f"Failed to fetch price from Cryptorank API: {e}")
-            return price_cache or None
+            return None
 
         try:
             data = response.json()
             price = data.get('data', {}).get('price')
             if price is not None:
-                # Update cache
-                price_cache = float(price)
-                last_price_cache_time = current_time
-                return price_cache
+                return float(price)
             else:
                 logger.warning("Price data not found in Cryptorank API response")
-                return price_cache or None
+                return None
         except (ValueError, TypeError) as e:
             logger.error(f"Error parsing Cryptorank API response: {e}")
-            return price_cache or None
+            return None
 
     except Exception as e:
         logger.error(f"Error fetching KOII price: {e}", exc_info=True)
-        return price_cache or None
+        return None
 
 def get_epoch_info() -> Optional[Dict[str, Any]]:
+    """Epoch progress for the dashboard, from the getEpochInfo result the refresh fetched"""
     try:
-        # Get current epoch
-        payload = {
-            "jsonrpc": "2.0",
-            "id": 1,
-            "method": "getEpochInfo",
-            "params": []
-        }
-        response = requests.post(Config.KOII_RPC_URL, json=payload)
-        if response.status_code != 200:
-            logger.error("Failed to get epoch info: HTTP status code %d", response.status_code)
-            return None
-
-        data = response.json()
-        if "error" in data:
-            logger.error(f"Error getting epoch info: {data['error']}")
-            return None
-
-        result = data.get("result", {})
+        result = source_schedule.value('rpcEpochInfo')
         if not result:
             logger.error("No result data in epoch info response")
             return None
@@ -840,7 +839,8 @@ def get_epoch_info() -> Optional[Dict[str, Any]]:
         epoch_info = {
             "currentEpoch": result.get("epoch", 0),
             "epochProgress": min(max(progress, 0), 100),  # Ensure between 0-100
-            "timeLeftInEpoch": max((slots_in_epoch - slot_index) * 0.4, 0)  # 0.4 seconds per slot
+            "timeLeftInEpoch": max((slots_in_epoch - slot_index) * Config.SLOT_DURATION, 0),
+            "absoluteSlot": result.get("absoluteSlot", 0)
         }
         logger.info("Returning epoch info: %s", epoch_info)
         return epoch_info
@@ -848,36 +848,154 @@ def get_epoch_info() -> Optional[Dict[str, Any]]:
         logger.error(f"Error getting epoch info: {e}", exc_info=True)
         return None
 
+def assemble_snapshot(changed: Set[str]) -> Optional[Dict[str, Any]]:
+    """The snapshot from the current source values; validator metrics are recomputed only if one of their sources changed"""
+    if changed & VALIDATOR_SOURCES:
+        validator_info_cache.invalidate()
+    with tracing.span('validator_info'):
+        data = get_validator_info()
+    if not data:
+        return None
+    # Price and epoch info do not depend on the validator set
+    return dict(data, koiiPrice=source_schedule.value('koiiPrice'), epochInfo=get_epoch_info())
+
+def build_snapshot() -> Optional[Dict[str, Any]]:
+    """Fetch the due sources and assemble the snapshot"""
+    return assemble_snapshot(refresh_sources())
+
+def wait_for_snapshot(timeout: float) -> Optional[snapshot.EncodedSnapshot]:
+    """Wait up to `timeout` for another process to store a snapshot"""
+    broadcaster.start()
+    deadline = time.time() + timeout
+    encoded = None
+    while encoded is None and time.time() < deadline:
+        # Woken by the NOTIFY of the store; the timeout covers a missed one
+        broadcaster.wait(None, min(1.0, max(deadline - time.time(), 0)))
+        encoded = get_encoded_snapshot()
+    return encoded
+
+def build_cold_snapshot() -> Optional[snapshot.EncodedSnapshot]:
+    """Build the snapshot for /api/nodes while none is stored; only the holder of the build lock calls the RPC node"""
+    if not build_lock.try_acquire():
+        logger.info("Another process is building the first snapshot (or the database is unreachable), waiting for it")
+        return wait_for_snapshot(Config.COLD_START_WAIT)
+    try:
+        # Stored while we were taking the lock
+        encoded = get_encoded_snapshot()
+        if encoded:
+            return encoded
+        data = build_snapshot()
+        if not data:
+            return None
+        return store_latest_data(data) or snapshot.encode_snapshot(data)
+    finally:
+        build_lock.release()
+
+def update_validator_data() -> None:
+    """Fetch the sources that are due and store a new snapshot if any of them changed"""
+    if not source_schedule.due():
+        return
+    if not build_lock.try_acquire():
+        logger.info("Another process is building a snapshot (or the database is unreachable), skipping this refresh")
+        return
+    logger.info("Updating validator data in background")
+    try:
+        with tracing.trace_cycle('refresh', profile=take_profile_request()), monitoring.REFRESH_DURATION.time():
+            changed = refresh_sources()
+            data = encoded = None
+            if changed:
+                data = assemble_snapshot(changed)
+            if data:
+                # Store in database
+                with tracing.span('store_snapshot'):
+                    encoded = store_latest_data(data, snapshot_log)
+                with tracing.span('store_history'):
+                    store_validator_history(data)
+            if encoded and Config.PUBLISH_DIR:
+                with monitoring.REFRESH_STAGE_DURATION.labels('publish').time(), tracing.span('publish'):
+                    publish_latest(encoded)
+    finally:
+        build_lock.release()
+    store_refresh_traces()
+    if not changed:
+        logger.info("No source changed, keeping the stored snapshot")
+        return
+    if encoded is None:
+        monitoring.REFRESH_FAILURES.inc()
+        return
+    monitoring.SNAPSHOT_STORED.set_to_current_time()
+    monitoring.SNAPSHOT_VERSION.set(encoded.version)
+    monitoring.VALIDATORS_PROCESSED.set(len(data['validators']))
+
+def publish_latest(encoded: snapshot.EncodedSnapshot) -> None:
+    """Publish `encoded` for nginx to serve"""
+    global published_version
+    if publish.publish_snapshot(Config.PUBLISH_DIR, encoded, Config.PUBLISH_KEEP_VERSIONS):
+        published_version = encoded.version
+
 def background_update():
-    """Background task to update validator data"""
+    """Background task to refresh the sources as they fall due while this process is the leader"""
+    global published_version
+    leading = False
     while True:
         try:
-            logger.info("Updating validator data in background")
-            data = get_validator_info()
-            if data:
-                # Add KOII price
-                data['koiiPrice'] = get_koii_price()
-                # Add epoch information
-                data['epochInfo'] = get_epoch_info()
-                # Store in database
-                store_latest_data(data)
-            time.sleep(30)  # Update every 30 seconds
+            if not leader_lock.is_held() and not leader_lock.try_acquire():
+                if leading:
+                    leading = False
+                    logger.info("Lost the leader lock")
+                    if Config.PUBLISH_DIR and published_version is not None:
+                        # Unless the new leader already replaced it, nobody updates what we published
+                        publish.unpublish(Config.PUBLISH_DIR, published_version)
+                        published_version = None
+                # Another worker refreshes; we only serve what it stores
+                time.sleep(Config.LEADER_POLL_INTERVAL)
+                continue
+            if not leading:
+                leading = True
+                if Config.PUBLISH_DIR:
+                    # What a previous leader published may be older than what it stored
+                    encoded = get_encoded_snapshot()
+                    if encoded:
+                        publish_latest(encoded)
+            update_validator_data()
+            # Wake for the next due source, and often enough to notice a lost lock
+            time.sleep(min(max(source_schedule.seconds_until_due(), 0.5), Config.LEADER_POLL_INTERVAL))
         except Exception as e:
             logger.error(f"Error in background update: {e}")
             time.sleep(5)  # Wait before retrying on error
 
 def init_app():
     """Initialize the application"""
+    global leader_lock
     init_db()
+    if not Config.BACKGROUND_REFRESH:
+        logger.info("Background refresh disabled")
+        return
+    leader_lock = create_leader_lock(Config.LEADER_LOCK, lock_session, Config.LEADER_LOCK_KEY, Config.LEADER_LOCK_FILE)
     thread = threading.Thread(target=background_update, daemon=True)
     thread.start()
-    logger.info("Background update thread started")
+    logger.info(f"Background update thread started (leader lock: {leader_lock.mode})")
 
 # Remove @app.before_first_request
 # Start background update thread when app starts
 with app.app_context():
     init_app()
 
+@app.before_request
+def start_request_timer():
+    g.request_started = time.time()
+
+@app.after_request
+def record_request_metrics(response: Response) -> Response:
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    started = g.get('request_started')
+    if started is not None:
+        monitoring.HTTP_LATENCY.labels(endpoint, str(response.status_code)).observe(time.time() - started)
+    if not response.is_streamed:
+        encoding = response.headers.get('Content-Encoding', 'identity')
+        monitoring.HTTP_RESPONSE_SIZE.labels(endpoint, encoding).observe(response.content_length or 0)
+    return response
+
 @app.route('/')
 def index():
     return render_template('index.html', config=Config.to_dict())
@@ -885,37 +1003,213 @@ def index():
 @app.route('/api/nodes')
 def get_nodes():
     try:
-        # First try to get cached data from database
-        data = get_latest_data()
-        if data:
-            return jsonify(data)
-            
-        # If no cached data, fetch fresh data
-        data = get_validator_info()
-        if not data:
-            return jsonify({'error': 'Failed to fetch data'}), 500
-            
-        # Add additional data
-        data['koiiPrice'] = get_koii_price()
-        data['epochInfo'] = get_epoch_info()
-        
-        # Store in database for next time
-        store_latest_data(data)
-        
-        return jsonify(data)
+        # First try the pre-encoded snapshot from the database
+        encoded = get_encoded_snapshot()
+        fields = request.args.get('fields')
+        if encoded and fields is not None:
+            try:
+                fields = parse_fields(fields)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            data = get_snapshot_data(encoded)
+            return json_response(dict(data, validators=project_validators(data['validators'], fields)))
+        if encoded:
+            since = request.args.get('since', type=int)
+            if since is not None:
+                if since == encoded.version:
+                    response = Response(status=304)
+                    response.set_etag(encoded.variant_etag(negotiate_encoding(encoded)[0]))
+                    return response
+                # Unknown or expired versions get the full snapshot
+                delta = get_encoded_delta(since, encoded.version)
+                if delta:
+                    return encoded_response(delta)
+            return encoded_response(encoded)
+
+        # Nothing stored yet: one caller builds it, the rest wait a bounded time
+        encoded = cold_start_cache.get_or_load(build_cold_snapshot, wait=Config.COLD_START_WAIT)
+        if not encoded:
+            response = jsonify({'error': 'Validator data is not available yet'})
+            response.status_code = 503
+            response.headers['Retry-After'] = str(Config.COLD_START_RETRY_AFTER)
+            return response
+
+        return encoded_response(encoded)
     except Exception as e:
         logger.error(f"Error in /api/nodes endpoint: {e}", exc_info=True)
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/stream')
+def stream_snapshots():
+    """Push each new snapshot version, as a delta from the client's version when one is stored"""
+    # Browsers send the last event id when they reconnect
+    since = request.headers.get('Last-Event-ID', type=int)
+    if since is None:
+        since = request.args.get('since', type=int)
+    if not broadcaster.add_client(Config.STREAM_MAX_CLIENTS):
+        response = jsonify({'error': 'Too many stream clients'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(Config.STREAM_RETRY // 1000)
+        return response
+    broadcaster.start()
+
+    def events():
+        version = since
+        yield f"retry: {Config.STREAM_RETRY}\n\n"
+        while True:
+            current = broadcaster.wait(version, Config.STREAM_KEEPALIVE)
+            if current is None or current == version:
+                yield ": keepalive\n\n"
+                continue
+            delta = get_encoded_delta(version, current) if version is not None else None
+            if delta:
+                yield stream.format_event('delta', delta.body.decode(), current)
+            else:
+                yield stream.format_event('snapshot', json.dumps({'snapshotVersion': current}), current)
+            version = current
+
+    response = Response(events(), mimetype='text/event-stream')
+    response.call_on_close(broadcaster.remove_client)
+    response.headers['Cache-Control'] = 'no-cache'
+    # Let proxies pass events through as they are written
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/validators/page')
+def list_validators():
+    """A sorted, filtered page of validators, e.g. ?sort=apr&order=desc&limit=20&delinquent=false"""
+    try:
+        fields = parse_fields(request.args.get('fields', ''))
+        query = parse_validator_query(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        encoded = get_encoded_snapshot() or cold_start_cache.get_or_load(build_cold_snapshot, wait=Config.COLD_START_WAIT)
+        if not encoded:
+            response = jsonify({'error': 'Validator data is not available yet'})
+            response.status_code = 503
+            response.headers['Retry-After'] = str(Config.COLD_START_RETRY_AFTER)
+            return response
+
+        index = get_validator_index(encoded)
+        mask_key, mask = index.mask(query['delinquent'], query['versions'], query['min_stake'])
+        try:
+            validators, total, cursor = index.page(
+                query['sort'], query['descending'], mask_key, mask, query['limit'], query['offset'], query['after']
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        response = json_response({
+            'snapshotVersion': encoded.version,
+            'total': total,
+            'limit': query['limit'],
+            'nextCursor': cursor,
+            'validators': project_validators(validators, fields)
+        })
+        # A page only changes with the snapshot
+        response.set_etag(f"{encoded.etag}-{hashlib.sha1(request.query_string).hexdigest()[:16]}")
+        return response.make_conditional(request)
+    except Exception as e:
+        logger.error(f"Error in /api/validators/page endpoint: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/validators/<vote_account>/credits')
+def get_validator_credits(vote_account: str):
+    """The `[epoch, credits, previous credits]` history of one vote account"""
+    packed = get_epoch_credits()
+    if packed is None:
+        return jsonify({'error': 'Validator data is not available yet'}), 503
+    epoch_credits = packed.get(vote_account)
+    if epoch_credits is None:
+        return jsonify({'error': 'Unknown vote account'}), 404
+    return jsonify({
+        'voteAccountPubkey': vote_account,
+        'snapshotVersion': packed.version,
+        'epochCredits': epoch_credits
+    })
+
+@app.route('/api/validators/<identity>/history')
+def get_validator_history(identity: str):
+    try:
+        end = history.parse_time(request.args.get('to'), datetime.now(timezone.utc))
+        start = history.parse_time(request.args.get('from'), end - timedelta(days=1))
+    except ValueError as e:
+        return jsonify({'error': f'Invalid time range: {e}'}), 400
+    if start >= end:
+        return jsonify({'error': 'from must be before to'}), 400
+
+    step = request.args.get('step') or history.choose_step(start, end)
+    if step != 'raw' and step not in history.STEPS:
+        return jsonify({'error': f"step must be one of: raw, {', '.join(history.STEPS)}"}), 400
+
+    try:
+        with get_connection() as conn:
+            with monitoring.DB_QUERY_LATENCY.labels('query_history').time():
+                points = history.query_history(conn, identity, start, end, step)
+        return jsonify({
+            'identityPubkey': identity,
+            'from': start.isoformat(),
+            'to': end.isoformat(),
+            'step': step,
+            'points': points
+        })
+    except Exception as e:
+        logger.error(f"Error in /api/validators/{identity}/history endpoint: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+def admin_authorized() -> bool:
+    """Check X-Admin-Token against ADMIN_TOKEN; nothing is authorized without one configured"""
+    if not Config.ADMIN_TOKEN:
+        return False
+    return hmac.compare_digest(request.headers.get('X-Admin-Token', ''), Config.ADMIN_TOKEN)
+
+@app.route('/api/debug/timings')
+def get_refresh_timings():
+    """Stage timings of the most recent refresh cycles, newest first"""
+    if not admin_authorized():
+        return jsonify({'error': 'Forbidden'}), 403
+    limit = min(request.args.get('limit', Config.REFRESH_TRACE_HISTORY, type=int), Config.REFRESH_TRACE_HISTORY)
+    try:
+        with get_connection() as conn:
+            traces = tracing.load_traces(conn, limit)
+        return jsonify({'traces': traces})
+    except Exception as e:
+        logger.error(f"Error in /api/debug/timings endpoint: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/debug/profile', methods=['POST'])
+def request_refresh_profile():
+    """Have the refresh leader profile its next cycle"""
+    if not admin_authorized():
+        return jsonify({'error': 'Forbidden'}), 403
+    try:
+        with get_connection() as conn:
+            tracing.request_profile(conn)
+        return jsonify({'status': 'scheduled', 'profileDir': Config.PROFILE_DIR}), 202
+    except Exception as e:
+        logger.error(f"Error in /api/debug/profile endpoint: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/metrics')
+def prometheus_metrics():
+    body, content_type = monitoring.render()
+    return Response(body, content_type=content_type)
+
 @app.route('/api/health')
 def health_check():
+    age = validator_info_cache.age()
     return jsonify({
         'status': 'healthy',
         'timestamp': datetime.utcnow().isoformat(),
         'cache_status': {
-            'last_update': datetime.fromtimestamp(last_cache_time).isoformat() if last_cache_time else None,
+            'last_update': (datetime.utcnow() - timedelta(seconds=age)).isoformat() if age is not None else None,
             'ttl': CACHE_TTL
-        }
+        },
+        'caches': cache.stats(),
+        'sources': source_schedule.status(),
+        'rpc': rpc_client.status(),
+        'refresh_leader': leader_lock.is_held(),
+        'db_pool': pool_stats()
     })
 
 if __name__ == '__main__':
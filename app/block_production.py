@@ -0,0 +1,111 @@
+"""Incremental block production for the current epoch"""
+
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from .rpc import KoiiRpcClient, RpcError
+
+logger = logging.getLogger(__name__)
+
+
+class SlotRangeMismatch(ValueError):
+    """A page's returned range does not continue the covered slots"""
+
+
+class BlockProductionTracker:
+    def __init__(self, client: KoiiRpcClient, page_slots: int, min_new_slots: int, batch: bool = True):
+        self.client = client
+        self.page_slots = max(page_slots, 1)
+        self.min_new_slots = min_new_slots
+        self.batch = batch
+        self.epoch: Optional[int] = None
+        self.first_slot = 0
+        # First slot of the epoch not yet merged
+        self.next_slot = 0
+        self.by_identity: Dict[str, List[int]] = {}
+        self._lock = threading.Lock()
+
+    def update(self, epoch_info: Dict[str, Any]) -> Optional[Dict[str, List[int]]]:
+        """Merge the slots produced since the last update; returns identity -> [leader slots, blocks produced] or None"""
+        epoch = epoch_info['epoch']
+        current_slot = epoch_info['absoluteSlot']
+        with self._lock:
+            if epoch != self.epoch:
+                self.epoch = epoch
+                self.first_slot = self.next_slot = current_slot - epoch_info['slotIndex']
+                self.by_identity = {}
+
+            # Cached counts stay valid until the chain has moved on a bit
+            if self.next_slot > self.first_slot and current_slot - self.next_slot + 1 < self.min_new_slots:
+                return dict(self.by_identity)
+
+            fetched = self._fetch(current_slot)
+            logger.info(f"Block production of epoch {epoch}: fetched {fetched} pages, "
+                        f"covered slots {self.first_slot}-{self.next_slot - 1}")
+            if self.next_slot == self.first_slot:
+                return None
+            return dict(self.by_identity)
+
+    def _page(self, first: int, current_slot: int) -> Tuple[int, int]:
+        return first, min(first + self.page_slots - 1, current_slot)
+
+    @staticmethod
+    def _call(page: Tuple[int, int]) -> Tuple[str, list]:
+        return "getBlockProduction", [{"range": {"firstSlot": page[0], "lastSlot": page[1]}}]
+
+    def _fetch(self, current_slot: int) -> int:
+        """Request the slots up to `current_slot` page by page and merge them until one fails; returns pages merged"""
+        fetched = 0
+        if self.batch and current_slot - self.next_slot + 1 > self.page_slots:
+            fetched, misaligned = self._fetch_batch(current_slot)
+            if not misaligned:
+                return fetched
+        # Each page starts where the node's previous answer ended, even if it returned fewer slots than asked
+        while self.next_slot <= current_slot:
+            page = self._page(self.next_slot, current_slot)
+            try:
+                self._merge(self.client.call(*self._call(page))['value'])
+            except (RpcError, KeyError, TypeError, ValueError) as e:
+                # Keep the covered range contiguous: the rest is retried next time
+                logger.error(f"Error fetching block production for slots {page[0]}-{page[1]}: {e}")
+                break
+            fetched += 1
+        return fetched
+
+    def _fetch_batch(self, current_slot: int) -> Tuple[int, bool]:
+        """Request all pages in one batch; returns pages merged and whether one did not line up"""
+        pages = [self._page(first, current_slot) for first in range(self.next_slot, current_slot + 1, self.page_slots)]
+        try:
+            responses = self.client.batch([self._call(page) for page in pages])
+        except RpcError as e:
+            logger.error(f"Error fetching block production: {e}")
+            return 0, False
+
+        for i, (page, result) in enumerate(zip(pages, responses)):
+            try:
+                if isinstance(result, RpcError):
+                    raise result
+                self._merge(result['value'])
+            except SlotRangeMismatch as e:
+                # The node shortened an earlier page; the rest is requested page by page
+                logger.warning(f"Block production for slots {page[0]}-{page[1]} {e}")
+                return i, True
+            except (RpcError, KeyError, TypeError) as e:
+                # Keep the covered range contiguous: later pages are retried next time
+                logger.error(f"Error fetching block production for slots {page[0]}-{page[1]}: {e}")
+                return i, False
+        return len(pages), False
+
+    def _merge(self, value: Dict[str, Any]) -> None:
+        """Add one page's counts; raises SlotRangeMismatch unless it starts at `next_slot`"""
+        first, last = value['range']['firstSlot'], value['range']['lastSlot']
+        if first != self.next_slot or last < first:
+            raise SlotRangeMismatch(f"returned slots {first}-{last}, expected a range from {self.next_slot}")
+        for identity, (leader_slots, blocks_produced) in value['byIdentity'].items():
+            counts = self.by_identity.get(identity)
+            if counts:
+                self.by_identity[identity] = [counts[0] + leader_slots, counts[1] + blocks_produced]
+            else:
+                self.by_identity[identity] = [leader_slots, blocks_produced]
+        self.next_slot = last + 1
@@ -0,0 +1,162 @@
+"""In-process TTL/LRU cache"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from .monitoring import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+
+class _Entry:
+    __slots__ = ('value', 'stored_at')
+
+    def __init__(self, value: Any, stored_at: float):
+        self.value = value
+        self.stored_at = stored_at
+
+
+class _Flight:
+    """A load in progress that other callers can wait for"""
+
+    __slots__ = ('done', 'value')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+
+
+class CacheNamespace:
+    def __init__(self, name: str, ttl: float, max_entries: int = 128, stale_ttl: float = 0):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # How long past its TTL a value may still be served while it reloads
+        self.stale_ttl = stale_ttl
+        self._entries: 'OrderedDict[Hashable, _Entry]' = OrderedDict()
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'stale_hits': 0,
+            'misses': 0,
+            'loads': 0,
+            'load_errors': 0,
+            'joined_loads': 0,
+            'evictions': 0
+        }
+
+    def _count(self, event: str) -> None:
+        # Called with the lock held
+        self._stats[event] += 1
+        CACHE_REQUESTS.labels(self.name, event).inc()
+
+    def get(self, key: Hashable = None) -> Any:
+        """Return a fresh value, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry.stored_at < self.ttl:
+                self._entries.move_to_end(key)
+                self._count('hits')
+                return entry.value
+            self._count('misses')
+            return None
+
+    def set(self, value: Any, key: Hashable = None) -> None:
+        if value is None:
+            return
+        with self._lock:
+            self._entries[key] = _Entry(value, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._count('evictions')
+
+    def invalidate(self, key: Hashable = None) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def age(self, key: Hashable = None) -> Optional[float]:
+        """Seconds since the value was stored, or None if there is none"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return time.time() - entry.stored_at if entry is not None else None
+
+    def get_or_load(self, loader: Callable[[], Any], key: Hashable = None, wait: Optional[float] = None) -> Any:
+        """Return the cached value, loading it on a miss or reloading it in the background once stale"""
+        with self._lock:
+            entry = self._entries.get(key)
+            age = time.time() - entry.stored_at if entry is not None else None
+            if age is not None and age < self.ttl:
+                self._entries.move_to_end(key)
+                self._count('hits')
+                return entry.value
+            if age is not None and age < self.ttl + self.stale_ttl:
+                self._count('stale_hits')
+                if key not in self._flights:
+                    self._flights[key] = _Flight()
+                    threading.Thread(target=self._run_load, args=(key, loader), daemon=True,
+                                     name=f'cache-{self.name}').start()
+                return entry.value
+            self._count('misses')
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+                leader = True
+            else:
+                self._count('joined_loads')
+                leader = False
+
+        if leader:
+            if wait is None:
+                return self._run_load(key, loader)
+            threading.Thread(target=self._run_load, args=(key, loader), daemon=True,
+                             name=f'cache-{self.name}').start()
+        flight.done.wait(wait)
+        return flight.value
+
+    def _run_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        value = None
+        try:
+            value = loader()
+        except Exception as e:
+            logger.error(f"Error loading cache entry {self.name}/{key}: {e}", exc_info=True)
+        self.set(value, key)
+        with self._lock:
+            self._count('loads')
+            if value is None:
+                self._count('load_errors')
+            flight = self._flights.pop(key)
+        flight.value = value
+        flight.done.set()
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        lookups = stats['hits'] + stats['stale_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['hits'] + stats['stale_hits']) / lookups if lookups else None
+        return stats
+
+
+_namespaces: Dict[str, CacheNamespace] = {}
+_namespaces_lock = threading.Lock()
+
+
+def namespace(name: str, ttl: float, max_entries: int = 128, stale_ttl: float = 0) -> CacheNamespace:
+    """Create (or return the existing) namespace `name`"""
+    with _namespaces_lock:
+        if name not in _namespaces:
+            _namespaces[name] = CacheNamespace(name, ttl, max_entries, stale_ttl)
+        return _namespaces[name]
+
+
+def stats() -> Dict[str, Dict[str, Any]]:
+    """Counters of every namespace"""
+    with _namespaces_lock:
+        namespaces = list(_namespaces.values())
+    return {ns.name: ns.stats() for ns in namespaces}
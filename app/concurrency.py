@@ -0,0 +1,37 @@
+"""Cooperative I/O for the async (gevent) workers; a no-op outside gevent"""
+
+import logging
+from typing import Any, Callable
+
+logger = logging.getLogger(__name__)
+
+
+def gevent_patched() -> bool:
+    """Whether gevent has monkey-patched this process"""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('socket')
+
+
+def patch_psycopg() -> bool:
+    """Make psycopg2 cooperative under gevent; returns whether it now is"""
+    if not gevent_patched():
+        return False
+    try:
+        from psycogreen.gevent import patch_psycopg as patch
+    except ImportError:
+        logger.error("Running under gevent without psycogreen: database queries block the worker")
+        return False
+    patch()
+    logger.info("psycopg2 patched for gevent")
+    return True
+
+
+def run_cpu_bound(function: Callable[..., Any], *args: Any) -> Any:
+    """Call `function` on a native thread under gevent, so other greenlets keep running"""
+    if not gevent_patched():
+        return function(*args)
+    from gevent import get_hub
+    return get_hub().threadpool.apply(function, args)
@@ -1,8 +1,5 @@
 from os import getenv
 from dotenv import load_dotenv
-import gc
-from typing import Dict, Any
-from time import time
 import logging
 
 # Configure logging
@@ -13,21 +10,68 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 
 class Config:
-    # Cache storage
-    _cache: Dict[str, Any] = {}
-    _cache_timestamps: Dict[str, float] = {}
-    _last_gc_run: float = time()
-    _gc_interval: int = 3600  # Run garbage collection every hour
-
     # API Endpoints
     API_ENDPOINT = getenv('API_ENDPOINT')
     KOII_RPC_URL = getenv('KOII_RPC_URL')
+    # Several RPC endpoints, comma-separated; just KOII_RPC_URL when unset
+    KOII_RPC_URLS = [url.strip() for url in (getenv('KOII_RPC_URLS') or getenv('KOII_RPC_URL') or '').split(',') if url.strip()]
     CRYPTORANK_API_URL = getenv('CRYPTORANK_API_URL')
     CRYPTORANK_API_KEY = getenv('CRYPTORANK_API_KEY')
     VALIDATORS_API_URL = getenv('VALIDATORS_API_URL')
+    STREAM_ENDPOINT = getenv('STREAM_ENDPOINT', '/api/stream')
+
+    # Server-Sent Events push channel
+    STREAM_MAX_CLIENTS = int(getenv('STREAM_MAX_CLIENTS', '1000'))  # per worker
+    STREAM_KEEPALIVE = int(getenv('STREAM_KEEPALIVE', '15'))  # seconds between keepalive comments
+    STREAM_RETRY = int(getenv('STREAM_RETRY', '5000'))  # ms before browsers reconnect
+
+    # RPC timeouts and concurrency (in seconds / threads)
+    RPC_TIMEOUT = int(getenv('RPC_TIMEOUT', '10'))
+    RPC_REWARDS_TIMEOUT = int(getenv('RPC_REWARDS_TIMEOUT', '30'))
+    RPC_FANOUT_TIMEOUT = int(getenv('RPC_FANOUT_TIMEOUT', '15'))
+    RPC_FANOUT_WORKERS = int(getenv('RPC_FANOUT_WORKERS', '16'))
+    RPC_BATCH = getenv('RPC_BATCH', 'true').lower() == 'true'
+
+    # RPC endpoint pool: routing, circuit breaking and hedging across KOII_RPC_URLS
+    RPC_PROBE_INTERVAL = float(getenv('RPC_PROBE_INTERVAL', '10'))  # seconds between latency/slot probes
+    RPC_MAX_SLOT_LAG = int(getenv('RPC_MAX_SLOT_LAG', '150'))  # slots behind the best endpoint before it is set aside
+    RPC_BREAKER_FAILURES = int(getenv('RPC_BREAKER_FAILURES', '3'))  # failures in a row that open the circuit
+    RPC_BREAKER_COOLDOWN = float(getenv('RPC_BREAKER_COOLDOWN', '30'))  # seconds before the endpoint is tried again
+    RPC_HEDGE = getenv('RPC_HEDGE', 'true').lower() == 'true'  # resend slow calls to a second endpoint
+    RPC_HEDGE_MIN_DELAY = float(getenv('RPC_HEDGE_MIN_DELAY', '0.05'))  # seconds, floor of the p95 hedge delay
+
+    # Refresh schedule of the upstream sources (in seconds)
+    VALIDATORS_REFRESH_INTERVAL = float(getenv('VALIDATORS_REFRESH_INTERVAL', '30'))  # vote accounts and epoch info
+    EPOCH_DATA_REFRESH_INTERVAL = float(getenv('EPOCH_DATA_REFRESH_INTERVAL', '3600'))  # inflation rate and supply, also on each new epoch
+    REFRESH_JITTER = float(getenv('REFRESH_JITTER', '0.1'))  # +/- fraction of an interval
+    REFRESH_RETRY_MIN = float(getenv('REFRESH_RETRY_MIN', '5'))  # first retry after a failed fetch, doubling from there
+    REFRESH_RETRY_MAX = float(getenv('REFRESH_RETRY_MAX', '300'))
+
+    # Vote accounts per getInflationReward request, and retries of a failed one
+    RPC_REWARDS_CHUNK_SIZE = int(getenv('RPC_REWARDS_CHUNK_SIZE', '100'))
+    RPC_REWARDS_RETRIES = int(getenv('RPC_REWARDS_RETRIES', '2'))
+    # Target slot time, to annualize per-epoch rewards
+    SLOT_DURATION = float(getenv('SLOT_DURATION', '0.4'))  # seconds
+
+    # Block production is fetched incrementally within the current epoch
+    BLOCK_PRODUCTION_PAGE_SLOTS = int(getenv('BLOCK_PRODUCTION_PAGE_SLOTS', '50000'))  # slots per request
+    BLOCK_PRODUCTION_MIN_SLOTS = int(getenv('BLOCK_PRODUCTION_MIN_SLOTS', '64'))  # new slots before refetching
 
     # Cache TTLs (in seconds)
     PRICE_CACHE_TTL = int(getenv('PRICE_CACHE_TTL', '600'))
+    # How long an expired value is still served while it is refreshed in the background
+    PRICE_CACHE_STALE_TTL = int(getenv('PRICE_CACHE_STALE_TTL', '86400'))
+    CLUSTER_NODES_STALE_TTL = int(getenv('CLUSTER_NODES_STALE_TTL', '3600'))
+
+    # IP geolocation: providers are tried in order ('maxmind', 'ip-api')
+    GEO_PROVIDERS = getenv('GEO_PROVIDERS', 'ip-api')
+    GEO_IP_API_URL = getenv('GEO_IP_API_URL', 'http://ip-api.com/batch')
+    GEO_MAXMIND_DB = getenv('GEO_MAXMIND_DB', 'GeoLite2-City.mmdb')
+    GEO_BATCH_SIZE = int(getenv('GEO_BATCH_SIZE', '100'))
+    GEO_TIMEOUT = int(getenv('GEO_TIMEOUT', '10'))
+    GEO_CACHE_PATH = getenv('GEO_CACHE_PATH', 'geo_cache.sqlite3')
+    GEO_CACHE_TTL = int(getenv('GEO_CACHE_TTL', str(7 * 24 * 3600)))
+    GEO_CACHE_MAX_ENTRIES = int(getenv('GEO_CACHE_MAX_ENTRIES', '10000'))
 
     # External URLs
     KOII_LOGO_URL = getenv('KOII_LOGO_URL')
@@ -46,73 +90,51 @@ class Config:
 
     STADIA_MAPS_API_KEY = getenv('STADIA_MAPS_API_KEY')
 
-    @classmethod
-    def run_garbage_collection(cls) -> None:
-        """Run garbage collection if enough time has passed since last run"""
-        current_time = time()
-        
-        # Check if it's time to run GC
-        if current_time - cls._last_gc_run < cls._gc_interval:
-            return
-
-        try:
-            # Clean up expired cache entries
-            expired_keys = [
-                key for key, timestamp in cls._cache_timestamps.items()
-                if current_time - timestamp > cls.PRICE_CACHE_TTL
-            ]
-            
-            for key in expired_keys:
-                cls._cache.pop(key, None)
-                cls._cache_timestamps.pop(key, None)
-
-            # Force Python's garbage collector
-            collected = gc.collect()
-            
-            logger.info(f"Garbage collection completed: {collected} objects collected")
-            logger.info(f"Cleaned up {len(expired_keys)} expired cache entries")
-            
-            # Update last GC run timestamp
-            cls._last_gc_run = current_time
-            
-        except Exception as e:
-            logger.error(f"Error during garbage collection: {e}")
+    # Postgres connection pool (per worker process)
+    DB_POOL_MIN_SIZE = int(getenv('DB_POOL_MIN_SIZE', '4'))  # connections kept open between requests
+    DB_POOL_MAX_SIZE = int(getenv('DB_POOL_MAX_SIZE', '10'))
+    DB_POOL_TIMEOUT = int(getenv('DB_POOL_TIMEOUT', '5'))  # seconds to wait for a free connection
+    DB_POOL_CHECK_IDLE = int(getenv('DB_POOL_CHECK_IDLE', '30'))  # ping connections idle this long
 
-    @classmethod
-    def cache_set(cls, key: str, value: Any) -> None:
-        """Set a value in the cache with current timestamp"""
-        cls._cache[key] = value
-        cls._cache_timestamps[key] = time()
-        
-        # Run garbage collection if needed
-        cls.run_garbage_collection()
+    # Snapshot versions kept by the refresher to serve deltas from
+    SNAPSHOT_DELTA_HISTORY = int(getenv('SNAPSHOT_DELTA_HISTORY', '10'))
+    # Encoding of the snapshot copy decoded from the database: 'json' (the served body) or 'msgpack'
+    SNAPSHOT_CODEC = getenv('SNAPSHOT_CODEC', 'json')
+    # How long /api/nodes waits for the first snapshot before answering 503
+    COLD_START_WAIT = float(getenv('COLD_START_WAIT', '10'))  # seconds
+    COLD_START_RETRY_AFTER = int(getenv('COLD_START_RETRY_AFTER', '5'))  # seconds
+    # Directory nginx serves /api/nodes from; unset, nothing is published
+    PUBLISH_DIR = getenv('PUBLISH_DIR')
+    PUBLISH_KEEP_VERSIONS = int(getenv('PUBLISH_KEEP_VERSIONS', '10'))
+    # Page sizes of /api/validators/page
+    VALIDATORS_PAGE_LIMIT = int(getenv('VALIDATORS_PAGE_LIMIT', '100'))
+    VALIDATORS_MAX_LIMIT = int(getenv('VALIDATORS_MAX_LIMIT', '1000'))
 
-    @classmethod
-    def cache_get(cls, key: str) -> Any:
-        """Get a value from the cache if not expired"""
-        if key not in cls._cache:
-            return None
-            
-        timestamp = cls._cache_timestamps.get(key)
-        if timestamp is None:
-            return None
-            
-        # Check if cache entry has expired
-        if time() - timestamp > cls.PRICE_CACHE_TTL:
-            cls._cache.pop(key, None)
-            cls._cache_timestamps.pop(key, None)
-            return None
-            
-        return cls._cache.get(key)
+    # Validator metrics history
+    HISTORY_SAMPLE_INTERVAL = int(getenv('HISTORY_SAMPLE_INTERVAL', '60'))  # seconds
+    HISTORY_RETENTION_DAYS = int(getenv('HISTORY_RETENTION_DAYS', '30'))  # raw samples, 0 keeps forever
+
+    # Refresh cycle traces and profiling
+    REFRESH_TRACE_HISTORY = int(getenv('REFRESH_TRACE_HISTORY', '50'))  # cycles kept for /api/debug/timings
+    PROFILE_SAMPLE_RATE = float(getenv('PROFILE_SAMPLE_RATE', '0'))  # fraction of cycles profiled
+    PROFILER = getenv('PROFILER', 'cprofile')  # 'cprofile' or 'pyinstrument'
+    PROFILE_DIR = getenv('PROFILE_DIR', '/tmp/koii-validators-profiles')
+    ADMIN_TOKEN = getenv('ADMIN_TOKEN')  # X-Admin-Token for /api/debug endpoints; they are disabled without it
+
+    # Background refresh leader election ('postgres', 'file' or 'none')
+    LEADER_LOCK = getenv('LEADER_LOCK', 'postgres')
+    LEADER_LOCK_KEY = int(getenv('LEADER_LOCK_KEY', '724201'))
+    LEADER_LOCK_FILE = getenv('LEADER_LOCK_FILE', '/tmp/koii-validators-refresh.lock')
+    LEADER_POLL_INTERVAL = int(getenv('LEADER_POLL_INTERVAL', '10'))  # seconds
+    # Off for processes that only serve stored data (and the benchmarks)
+    BACKGROUND_REFRESH = getenv('BACKGROUND_REFRESH', 'true').lower() == 'true'
 
     @classmethod
     def to_dict(cls):
         """Convert config to dictionary for template rendering"""
-        # Run garbage collection before returning config
-        cls.run_garbage_collection()
-        
         return {
             'API_ENDPOINT': cls.API_ENDPOINT,
+            'STREAM_ENDPOINT': cls.STREAM_ENDPOINT,
             'KOII_LOGO_URL': cls.KOII_LOGO_URL,
             'STAKECRAFT_URL': cls.STAKECRAFT_URL,
             'STAKECRAFT_TWITTER_URL': cls.STAKECRAFT_TWITTER_URL,
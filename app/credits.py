@@ -0,0 +1,70 @@
+"""Packed storage of the vote accounts' epochCredits"""
+
+import itertools
+import struct
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+# magic | count | names length | vote pubkeys ('\n'-joined) | offsets (uint32, count + 1) | triples (int64)
+MAGIC = b'KEC1'
+_HEADER = struct.Struct('<4sII')
+
+
+def _epoch_credits(validator: Any) -> List[List[int]]:
+    epoch_credits = getattr(validator, 'epoch_credits', None)
+    if epoch_credits is None:
+        # Snapshots decoded from before credits were packed
+        epoch_credits = validator.get('epochCredits')
+    return epoch_credits or []
+
+
+def pack(validators: Iterable[Any]) -> bytes:
+    """Pack the epochCredits of validator records (or snapshot dicts)"""
+    vote_pubkeys: List[str] = []
+    all_credits: List[List[List[int]]] = []
+    for validator in validators:
+        vote_pubkeys.append(validator['voteAccountPubkey'])
+        all_credits.append(_epoch_credits(validator))
+
+    offsets = np.zeros(len(all_credits) + 1, dtype=np.uint32)
+    np.cumsum([len(epoch_credits) for epoch_credits in all_credits], out=offsets[1:])
+    triples = np.fromiter(
+        itertools.chain.from_iterable(itertools.chain.from_iterable(all_credits)),
+        np.int64, int(offsets[-1]) * 3
+    )
+    names = '\n'.join(vote_pubkeys).encode()
+    return b''.join([
+        _HEADER.pack(MAGIC, len(vote_pubkeys), len(names)), names,
+        offsets.astype('<u4').tobytes(), triples.astype('<i8').tobytes()
+    ])
+
+
+class PackedEpochCredits:
+    """Read access to a packed blob; the pubkey index is built on first lookup"""
+
+    def __init__(self, blob: bytes, version: Optional[int] = None):
+        magic, count, names_length = _HEADER.unpack_from(blob)
+        if magic != MAGIC:
+            raise ValueError("not a packed epochCredits blob")
+        start = _HEADER.size
+        names = bytes(blob[start:start + names_length]).decode()
+        self.vote_pubkeys = names.split('\n') if count else []
+        start += names_length
+        self._offsets = np.frombuffer(blob, dtype='<u4', count=count + 1, offset=start)
+        start += self._offsets.nbytes
+        self._triples = np.frombuffer(blob, dtype='<i8', offset=start).reshape(-1, 3)
+        self._index: Optional[Dict[str, int]] = None
+        self.version = version
+
+    def __len__(self) -> int:
+        return len(self.vote_pubkeys)
+
+    def get(self, vote_pubkey: str) -> Optional[List[List[int]]]:
+        """The triples of one vote account, or None if it is not in the snapshot"""
+        if self._index is None:
+            self._index = {vote_pubkey: i for i, vote_pubkey in enumerate(self.vote_pubkeys)}
+        i = self._index.get(vote_pubkey)
+        if i is None:
+            return None
+        return self._triples[self._offsets[i]:self._offsets[i + 1]].tolist()
@@ -0,0 +1,170 @@
+"""Process-wide Postgres connection pool"""
+
+import logging
+import os
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import ThreadedConnectionPool
+
+from .config import Config
+from .monitoring import DB_POOL_IN_USE, DB_POOL_TIMEOUTS, DB_POOL_WAIT, DB_QUERY_LATENCY
+
+logger = logging.getLogger(__name__)
+
+# Database configuration
+DB_CONFIG = {
+    'dbname': os.getenv('DB_NAME', 'koii_validators'),
+    'user': os.getenv('DB_USER', 'postgres'),
+    'password': os.getenv('DB_PASSWORD', 'postgres'),
+    'host': os.getenv('DB_HOST', 'localhost'),
+    'port': os.getenv('DB_PORT', '5432')
+}
+
+
+class PoolTimeout(Exception):
+    """No connection became available within DB_POOL_TIMEOUT"""
+
+
+_pool: Optional[ThreadedConnectionPool] = None
+_pool_pid: Optional[int] = None
+_pool_lock = threading.Lock()
+# Bounds concurrent checkouts: ThreadedConnectionPool raises instead of waiting
+_slots = threading.BoundedSemaphore(Config.DB_POOL_MAX_SIZE)
+
+# Names of the statements prepared on each pooled connection
+_prepared: 'weakref.WeakKeyDictionary[Any, set]' = weakref.WeakKeyDictionary()
+# Last time each pooled connection was returned to the pool
+_last_used: 'weakref.WeakKeyDictionary[Any, float]' = weakref.WeakKeyDictionary()
+
+_stats = {
+    'checkouts': 0,
+    'waits': 0,
+    'timeouts': 0,
+    'discarded': 0,
+    'in_use': 0,
+    'wait_seconds_total': 0.0,
+    'wait_seconds_max': 0.0
+}
+_stats_lock = threading.Lock()
+
+
+def get_pool() -> ThreadedConnectionPool:
+    """Return this process's pool, creating it on first use after a fork"""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ThreadedConnectionPool(Config.DB_POOL_MIN_SIZE, Config.DB_POOL_MAX_SIZE, **DB_CONFIG)
+            _pool_pid = os.getpid()
+            logger.info(f"Database pool created (min {Config.DB_POOL_MIN_SIZE}, max {Config.DB_POOL_MAX_SIZE})")
+        return _pool
+
+
+def _is_healthy(conn) -> bool:
+    if conn.closed:
+        return False
+    if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+        return False
+    # Connections idle for a while may have been dropped by the server or a proxy
+    if time.time() - _last_used.get(conn, 0) < Config.DB_POOL_CHECK_IDLE:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def _record_wait(waited: float) -> None:
+    with _stats_lock:
+        _stats['checkouts'] += 1
+        _stats['in_use'] += 1
+        _stats['wait_seconds_total'] += waited
+        _stats['wait_seconds_max'] = max(_stats['wait_seconds_max'], waited)
+        if waited > 0.001:
+            _stats['waits'] += 1
+    DB_POOL_WAIT.observe(waited)
+    DB_POOL_IN_USE.inc()
+
+
+@contextmanager
+def get_connection() -> Iterator[Any]:
+    """Borrow a healthy connection; rolls back on error and returns it to the pool"""
+    started = time.time()
+    if not _slots.acquire(timeout=Config.DB_POOL_TIMEOUT):
+        with _stats_lock:
+            _stats['timeouts'] += 1
+        DB_POOL_TIMEOUTS.inc()
+        raise PoolTimeout(f"no database connection available after {Config.DB_POOL_TIMEOUT}s")
+
+    pool = None
+    conn = None
+    try:
+        pool = get_pool()
+        conn = pool.getconn()
+        while not _is_healthy(conn):
+            logger.warning("Discarding broken pooled database connection")
+            pool.putconn(conn, close=True)
+            with _stats_lock:
+                _stats['discarded'] += 1
+            conn = pool.getconn()
+        _record_wait(time.time() - started)
+    except Exception:
+        if conn is not None and pool is not None:
+            pool.putconn(conn, close=True)
+        _slots.release()
+        raise
+
+    broken = False
+    try:
+        yield conn
+        if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+    except Exception:
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            broken = True
+        raise
+    finally:
+        broken = broken or bool(conn.closed)
+        _last_used[conn] = time.time()
+        pool.putconn(conn, close=broken)
+        with _stats_lock:
+            _stats['in_use'] -= 1
+        DB_POOL_IN_USE.dec()
+        _slots.release()
+
+
+def execute_prepared(cur, name: str, sql: str, params: tuple = ()) -> None:
+    """Run `sql` (with $1, $2... placeholders) as a server-side prepared statement named `name`"""
+    conn = cur.connection
+    prepared = _prepared.setdefault(conn, set())
+    if name not in prepared:
+        cur.execute(f"PREPARE {name} AS {sql}")
+        prepared.add(name)
+    with DB_QUERY_LATENCY.labels(name).time():
+        if params:
+            placeholders = ', '.join(['%s'] * len(params))
+            cur.execute(f"EXECUTE {name} ({placeholders})", params)
+        else:
+            cur.execute(f"EXECUTE {name}")
+
+
+def pool_stats() -> Dict[str, Any]:
+    """Pool size and checkout wait statistics for this process"""
+    with _stats_lock:
+        stats = dict(_stats)
+    pool = _pool if _pool_pid == os.getpid() else None
+    stats['size'] = len(pool._used) + len(pool._pool) if pool else 0
+    stats['idle'] = len(pool._pool) if pool else 0
+    stats['max_size'] = Config.DB_POOL_MAX_SIZE
+    stats['min_size'] = Config.DB_POOL_MIN_SIZE
+    return stats
@@ -0,0 +1,82 @@
+"""Concurrent fan-out of independent upstream calls"""
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, Optional
+
+from . import tracing
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=Config.RPC_FANOUT_WORKERS, thread_name_prefix='rpc-fanout')
+
+
+class FanOutResult:
+    """Results of one fan-out, with per-call errors and durations"""
+
+    def __init__(self):
+        self.started = time.time()
+        self.results: Dict[str, Any] = {}
+        self.errors: Dict[str, str] = {}
+        self.durations: Dict[str, float] = {}
+
+    def get(self, name: str, default: Any = None) -> Any:
+        return self.results.get(name, default)
+
+    def failed(self, name: str) -> bool:
+        return name in self.errors
+
+
+class FanOut:
+    """Calls submitted together; a call that raises, returns None or times out fails on its own"""
+
+    def __init__(self, calls: Dict[str, Callable[[], Any]], timeouts: Optional[Dict[str, float]] = None,
+                 default_timeout: Optional[float] = None):
+        self.started = time.time()
+        self.deadlines = {}
+        self.finished: Dict[str, float] = {}
+        self.futures = {}
+        timeouts = timeouts or {}
+        default_timeout = default_timeout or Config.RPC_FANOUT_TIMEOUT
+        for name, func in calls.items():
+            self.deadlines[name] = self.started + timeouts.get(name, default_timeout)
+            self.futures[name] = _executor.submit(self._timed, name, tracing.profiled(func))
+
+    def _timed(self, name: str, func: Callable[[], Any]) -> Any:
+        try:
+            return func()
+        finally:
+            self.finished[name] = time.time() - self.started
+
+    def wait(self) -> FanOutResult:
+        result = FanOutResult()
+        result.started = self.started
+        for name, future in self.futures.items():
+            try:
+                value = future.result(timeout=max(self.deadlines[name] - time.time(), 0))
+                if value is None:
+                    result.errors[name] = 'returned no data'
+                else:
+                    result.results[name] = value
+            except FutureTimeoutError:
+                future.cancel()
+                result.errors[name] = f"timed out after {self.deadlines[name] - self.started:.1f}s"
+            except Exception as e:
+                result.errors[name] = str(e)
+            result.durations[name] = self.finished.get(name, time.time() - self.started)
+
+        if result.durations:
+            slowest = max(result.durations, key=result.durations.get)
+            logger.info(f"Fan-out of {len(self.futures)} calls finished in {time.time() - self.started:.2f}s "
+                        f"(slowest: {slowest} {result.durations[slowest]:.2f}s)")
+        for name, error in result.errors.items():
+            logger.warning(f"Fan-out call {name} failed: {error}")
+        return result
+
+
+def fan_out(calls: Dict[str, Callable[[], Any]], timeouts: Optional[Dict[str, float]] = None,
+            default_timeout: Optional[float] = None) -> FanOutResult:
+    """Run independent calls concurrently and wait for all of them"""
+    return FanOut(calls, timeouts, default_timeout).wait()
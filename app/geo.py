@@ -0,0 +1,234 @@
+"""IP geolocation for validator nodes"""
+
+import json
+import logging
+from abc import ABC, abstractmethod
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+import requests
+
+from .config import Config
+from .monitoring import GEO_CACHE_REQUESTS, GEO_PROVIDER_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+Location = Dict[str, Any]
+
+
+class GeoCache:
+    """SQLite-backed cache of ip -> location with TTL and LRU eviction; None marks an unresolvable IP"""
+
+    def __init__(self, path: str, ttl: int, max_entries: int):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS geo_cache (
+                    ip TEXT PRIMARY KEY,
+                    location TEXT,
+                    fetched_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS geo_cache_last_access ON geo_cache (last_access)")
+
+    def get_many(self, ips: List[str]) -> Dict[str, Optional[Location]]:
+        """Return the fresh cached entries among `ips`"""
+        if not ips:
+            return {}
+        now = time.time()
+        found: Dict[str, Optional[Location]] = {}
+        with self._lock, self._conn:
+            # Stay under SQLite's bound parameter limit
+            for i in range(0, len(ips), 500):
+                chunk = ips[i:i + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT ip, location FROM geo_cache WHERE ip IN ({placeholders}) AND fetched_at > ?",
+                    (*chunk, now - self.ttl)
+                ).fetchall()
+                for ip, location in rows:
+                    found[ip] = json.loads(location) if location else None
+                self._conn.execute(
+                    f"UPDATE geo_cache SET last_access = ? WHERE ip IN ({placeholders})",
+                    (now, *chunk)
+                )
+        return found
+
+    def set_many(self, locations: Dict[str, Optional[Location]]) -> None:
+        if not locations:
+            return
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO geo_cache (ip, location, fetched_at, last_access) VALUES (?, ?, ?, ?)",
+                [(ip, json.dumps(location) if location else None, now, now) for ip, location in locations.items()]
+            )
+            self._evict()
+
+    def _evict(self) -> None:
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM geo_cache").fetchone()
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM geo_cache WHERE ip IN (SELECT ip FROM geo_cache ORDER BY last_access LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+
+class GeoProvider(ABC):
+    """Resolves a batch of IPs: None if unresolvable, missing if it failed and should be retried"""
+
+    name = 'base'
+
+    @abstractmethod
+    def lookup(self, ips: List[str]) -> Dict[str, Optional[Location]]:
+        ...
+
+
+class IpApiBatchProvider(GeoProvider):
+    name = 'ip-api'
+
+    def __init__(self, url: str, batch_size: int = 100, timeout: float = 10):
+        self.url = url
+        self.batch_size = min(batch_size, 100)  # ip-api rejects larger batches
+        self.timeout = timeout
+
+    def lookup(self, ips: List[str]) -> Dict[str, Optional[Location]]:
+        locations: Dict[str, Optional[Location]] = {}
+        for i in range(0, len(ips), self.batch_size):
+            chunk = ips[i:i + self.batch_size]
+            try:
+                response = requests.post(
+                    self.url,
+                    params={'fields': 'status,message,query,lat,lon,city,country'},
+                    json=chunk,
+                    timeout=self.timeout
+                )
+            except requests.exceptions.RequestException as e:
+                logger.error(f"Error looking up {len(chunk)} IPs with ip-api: {e}")
+                break
+            if response.status_code != 200:
+                logger.error(f"ip-api batch lookup returned status code {response.status_code}")
+                break
+
+            for data in response.json():
+                ip = data.get('query')
+                if data.get('status') == 'success':
+                    locations[ip] = {
+                        'latitude': data['lat'],
+                        'longitude': data['lon'],
+                        'city': data['city'],
+                        'country': data['country']
+                    }
+                else:
+                    locations[ip] = None
+
+            # Out of requests for this window: leave the rest for the next refresh
+            if response.headers.get('X-Rl') == '0':
+                logger.warning(f"ip-api rate limit reached, retrying in {response.headers.get('X-Ttl')}s")
+                break
+        return locations
+
+
+class MaxMindProvider(GeoProvider):
+    """Offline lookups from a local GeoLite2/GeoIP2 City database"""
+
+    name = 'maxmind'
+
+    def __init__(self, path: str):
+        import geoip2.database
+        import geoip2.errors
+        self._not_found = geoip2.errors.AddressNotFoundError
+        self.reader = geoip2.database.Reader(path)
+
+    def lookup(self, ips: List[str]) -> Dict[str, Optional[Location]]:
+        locations: Dict[str, Optional[Location]] = {}
+        for ip in ips:
+            try:
+                record = self.reader.city(ip)
+            except (self._not_found, ValueError):
+                locations[ip] = None
+                continue
+            if record.location.latitude is None:
+                locations[ip] = None
+                continue
+            locations[ip] = {
+                'latitude': record.location.latitude,
+                'longitude': record.location.longitude,
+                'city': record.city.name,
+                'country': record.country.name
+            }
+        return locations
+
+
+class GeoLocator:
+    def __init__(self, cache: Optional[GeoCache], providers: List[GeoProvider]):
+        self.cache = cache
+        self.providers = providers
+
+    def lookup_many(self, ips: Iterable[Optional[str]]) -> Dict[str, Optional[Location]]:
+        """Resolve many IPs at once: cache first, then each provider in turn"""
+        pending = sorted({ip for ip in ips if ip})
+        locations: Dict[str, Optional[Location]] = {}
+        if self.cache:
+            try:
+                locations.update(self.cache.get_many(pending))
+            except sqlite3.Error as e:
+                logger.error(f"Error reading geolocation cache: {e}")
+            pending = [ip for ip in pending if ip not in locations]
+            GEO_CACHE_REQUESTS.labels('hit').inc(len(locations))
+            GEO_CACHE_REQUESTS.labels('miss').inc(len(pending))
+
+        for provider in self.providers:
+            if not pending:
+                break
+            GEO_PROVIDER_LOOKUPS.labels(provider.name).inc(len(pending))
+            try:
+                resolved = provider.lookup(pending)
+            except Exception as e:
+                logger.error(f"Error looking up IPs with {provider.name}: {e}")
+                continue
+            logger.info(f"Resolved {len(resolved)}/{len(pending)} IPs with {provider.name}")
+            if self.cache:
+                try:
+                    self.cache.set_many(resolved)
+                except sqlite3.Error as e:
+                    logger.error(f"Error writing geolocation cache: {e}")
+            locations.update(resolved)
+            # An IP another provider may still know about stays pending
+            pending = [ip for ip in pending if locations.get(ip) is None]
+        return locations
+
+    def lookup(self, ip: str) -> Optional[Location]:
+        return self.lookup_many([ip]).get(ip)
+
+
+def create_geo_locator() -> GeoLocator:
+    """Build the locator from GEO_* settings"""
+    providers: List[GeoProvider] = []
+    for name in [p.strip() for p in Config.GEO_PROVIDERS.split(',') if p.strip()]:
+        if name == 'maxmind':
+            try:
+                providers.append(MaxMindProvider(Config.GEO_MAXMIND_DB))
+            except ImportError:
+                logger.error("GEO_PROVIDERS includes maxmind but the geoip2 package is not installed")
+            except Exception as e:
+                logger.error(f"Error opening MaxMind database {Config.GEO_MAXMIND_DB}: {e}")
+        elif name == 'ip-api':
+            providers.append(IpApiBatchProvider(Config.GEO_IP_API_URL, Config.GEO_BATCH_SIZE, Config.GEO_TIMEOUT))
+        else:
+            logger.warning(f"Unknown geolocation provider '{name}'")
+
+    cache = None
+    try:
+        cache = GeoCache(Config.GEO_CACHE_PATH, Config.GEO_CACHE_TTL, Config.GEO_CACHE_MAX_ENTRIES)
+    except sqlite3.Error as e:
+        logger.error(f"Error opening geolocation cache {Config.GEO_CACHE_PATH}: {e}")
+    return GeoLocator(cache, providers)
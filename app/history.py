@@ -0,0 +1,205 @@
+"""Time-series history of per-validator metrics"""
+
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from psycopg2.extras import execute_values
+
+logger = logging.getLogger(__name__)
+
+# Query step -> (aggregate view, bucket width)
+STEPS = {
+    'hour': ('validator_metrics_hourly', timedelta(hours=1)),
+    'day': ('validator_metrics_daily', timedelta(days=1)),
+}
+
+# Set by init_history_schema
+timescale_enabled = False
+
+SAMPLE_COLUMNS = "time, epoch, slot, identity_pubkey, vote_pubkey, stake, skip_rate, credits_growth, commission, apr, delinquent"
+
+AGGREGATE_SELECT = """
+    SELECT time_bucket(INTERVAL '{width}', time) AS bucket,
+           identity_pubkey,
+           max(epoch) AS epoch,
+           max(slot) AS slot,
+           avg(stake)::BIGINT AS stake,
+           avg(skip_rate) AS skip_rate,
+           avg(credits_growth) AS credits_growth,
+           max(commission) AS commission,
+           avg(apr) AS apr,
+           bool_or(delinquent) AS delinquent,
+           count(*) AS samples
+    FROM validator_metrics
+    GROUP BY bucket, identity_pubkey
+"""
+
+
+def init_history_schema(conn, retention_days: int) -> None:
+    """Create the metrics hypertable and its hourly/daily continuous aggregates"""
+    global timescale_enabled
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS validator_metrics (
+                time TIMESTAMPTZ NOT NULL,
+                epoch INTEGER,
+                slot BIGINT,
+                identity_pubkey TEXT NOT NULL,
+                vote_pubkey TEXT NOT NULL,
+                stake BIGINT,
+                skip_rate DOUBLE PRECISION,
+                credits_growth BIGINT,
+                commission SMALLINT,
+                apr DOUBLE PRECISION,
+                delinquent BOOLEAN
+            )
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS validator_metrics_identity_time
+            ON validator_metrics (identity_pubkey, time DESC)
+        """)
+        conn.commit()
+
+        cur.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'timescaledb'")
+        if not cur.fetchone():
+            logger.warning("TimescaleDB is not available, validator history is served from the raw table")
+            timescale_enabled = False
+            return
+
+    # Continuous aggregates cannot be created inside a transaction block
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            _init_timescale(cur, retention_days)
+    finally:
+        conn.autocommit = False
+    timescale_enabled = True
+    logger.info("Validator history hypertable and continuous aggregates initialized")
+
+
+def _init_timescale(cur, retention_days: int) -> None:
+    cur.execute("CREATE EXTENSION IF NOT EXISTS timescaledb")
+    cur.execute("""
+        SELECT create_hypertable('validator_metrics', 'time',
+                                 chunk_time_interval => INTERVAL '1 day',
+                                 if_not_exists => TRUE, migrate_data => TRUE)
+    """)
+    for view, width in STEPS.values():
+        width_sql = f"{int(width.total_seconds())} seconds"
+        cur.execute(f"""
+            CREATE MATERIALIZED VIEW IF NOT EXISTS {view}
+            WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+            {AGGREGATE_SELECT.format(width=width_sql)}
+            WITH NO DATA
+        """)
+        cur.execute(f"""
+            SELECT add_continuous_aggregate_policy('{view}',
+                start_offset => INTERVAL '{3 * int(width.total_seconds())} seconds',
+                end_offset => INTERVAL '{width_sql}',
+                schedule_interval => INTERVAL '{max(int(width.total_seconds()) // 2, 1800)} seconds',
+                if_not_exists => TRUE)
+        """)
+    if retention_days > 0:
+        # Raw samples expire; the aggregates keep the long-range history
+        cur.execute("""
+            SELECT add_retention_policy('validator_metrics', INTERVAL '1 day' * %s, if_not_exists => TRUE)
+        """, (retention_days,))
+
+
+def record_samples(conn, data: Dict[str, Any]) -> int:
+    """Append one sample per validator of a snapshot; returns the row count"""
+    epoch_info = data.get('epochInfo') or {}
+    epoch = epoch_info.get('currentEpoch')
+    slot = epoch_info.get('absoluteSlot')
+    now = datetime.now(timezone.utc)
+    rows = [
+        (
+            now,
+            epoch,
+            slot,
+            validator['identityPubkey'],
+            validator['voteAccountPubkey'],
+            validator['activatedStake'],
+            validator['skipRate'],
+            validator['creditsGrowth'],
+            validator['commission'],
+            validator.get('apr'),
+            validator['delinquent'],
+        )
+        for validator in data.get('validators', [])
+    ]
+    with conn.cursor() as cur:
+        execute_values(cur, f"INSERT INTO validator_metrics ({SAMPLE_COLUMNS}) VALUES %s", rows, page_size=1000)
+    conn.commit()
+    return len(rows)
+
+
+def choose_step(start: datetime, end: datetime) -> str:
+    """Pick the coarsest resolution that still gives a useful number of points"""
+    span = end - start
+    if span > timedelta(days=7):
+        return 'day'
+    if span > timedelta(hours=6):
+        return 'hour'
+    return 'raw'
+
+
+def query_history(conn, identity: str, start: datetime, end: datetime, step: str) -> List[Dict[str, Any]]:
+    """Read samples for one validator between `start` and `end`"""
+    if step == 'raw':
+        sql = """
+            SELECT time, epoch, slot, stake, skip_rate, credits_growth, commission, apr, delinquent, 1
+            FROM validator_metrics
+            WHERE identity_pubkey = %s AND time >= %s AND time < %s
+            ORDER BY time
+        """
+    elif timescale_enabled:
+        view, _ = STEPS[step]
+        sql = f"""
+            SELECT bucket, epoch, slot, stake, skip_rate, credits_growth, commission, apr, delinquent, samples
+            FROM {view}
+            WHERE identity_pubkey = %s AND bucket >= %s AND bucket < %s
+            ORDER BY bucket
+        """
+    else:
+        sql = f"""
+            SELECT date_trunc('{step}', time) AS bucket,
+                   max(epoch), max(slot), avg(stake)::BIGINT, avg(skip_rate), avg(credits_growth),
+                   max(commission), avg(apr), bool_or(delinquent), count(*)
+            FROM validator_metrics
+            WHERE identity_pubkey = %s AND time >= %s AND time < %s
+            GROUP BY bucket
+            ORDER BY bucket
+        """
+    with conn.cursor() as cur:
+        cur.execute(sql, (identity, start, end))
+        return [
+            {
+                'time': row[0].isoformat(),
+                'epoch': row[1],
+                'slot': row[2],
+                'activatedStake': row[3],
+                'skipRate': row[4],
+                'creditsGrowth': float(row[5]) if row[5] is not None else None,
+                'commission': row[6],
+                'apr': row[7],
+                'delinquent': row[8],
+                'samples': row[9],
+            }
+            for row in cur.fetchall()
+        ]
+
+
+def parse_time(value: Optional[str], default: datetime) -> datetime:
+    """Parse a unix timestamp or ISO 8601 string; naive times are UTC"""
+    if not value:
+        return default
+    try:
+        return datetime.fromtimestamp(float(value), tz=timezone.utc)
+    except ValueError:
+        pass
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
@@ -0,0 +1,208 @@
+"""Leader election for the background refresher"""
+
+import fcntl
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Set
+
+import psycopg2
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderLock:
+    """Base class: a lock that is held for the lifetime of the process."""
+
+    mode = 'none'
+
+    def try_acquire(self) -> bool:
+        return True
+
+    def is_held(self) -> bool:
+        return True
+
+    def release(self) -> None:
+        pass
+
+
+class LockSession:
+    """The process's one connection for session-level advisory locks, shared by all of them"""
+
+    def __init__(self, db_config: Dict[str, Any], reconnect_interval: float = 5):
+        self.db_config = db_config
+        self.reconnect_interval = reconnect_interval
+        self.conn = None
+        # Keys held by this session; they all go with its connection
+        self.held: Set[int] = set()
+        self._next_connect = 0.0
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        if self.conn is not None and not self.conn.closed:
+            return self.conn
+        if time.time() < self._next_connect:
+            return None
+        try:
+            self.conn = psycopg2.connect(**self.db_config)
+            self.conn.autocommit = True
+        except Exception as e:
+            logger.error(f"Error connecting for advisory locks: {e}")
+            self.conn = None
+            # Callers poll; don't open a connection attempt for each of them while the database is down
+            self._next_connect = time.time() + self.reconnect_interval
+        return self.conn
+
+    def try_lock(self, key: int) -> Optional[bool]:
+        """Take `key` without waiting; None when the database is unreachable"""
+        with self._lock:
+            if key in self.held:
+                return True
+            conn = self._connection()
+            if conn is None:
+                return None
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT pg_try_advisory_lock(%s)", (key,))
+                    acquired = cur.fetchone()[0]
+            except Exception as e:
+                logger.error(f"Error taking advisory lock {key}: {e}")
+                self._close()
+                return None
+            if acquired:
+                self.held.add(key)
+            return acquired
+
+    def holds(self, key: int) -> bool:
+        """Whether `key` is still held; losing the connection loses every lock"""
+        with self._lock:
+            if key not in self.held:
+                return False
+            try:
+                with self.conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+                return True
+            except Exception as e:
+                logger.error(f"Lost the advisory lock connection: {e}")
+                self._close()
+                return False
+
+    def unlock(self, key: int) -> None:
+        with self._lock:
+            if key not in self.held:
+                return
+            self.held.discard(key)
+            try:
+                with self.conn.cursor() as cur:
+                    cur.execute("SELECT pg_advisory_unlock(%s)", (key,))
+            except Exception as e:
+                logger.error(f"Error releasing advisory lock {key}: {e}")
+                self._close()
+
+    def _close(self) -> None:
+        if self.conn is not None:
+            try:
+                self.conn.close()
+            except Exception:
+                pass
+        self.conn = None
+        self.held.clear()
+
+
+class PostgresLeaderLock(LeaderLock):
+    """Session-level advisory lock held on the process's lock session."""
+
+    mode = 'postgres'
+
+    def __init__(self, session: LockSession, key: int):
+        self.session = session
+        self.key = key
+
+    def try_acquire(self) -> bool:
+        acquired = bool(self.session.try_lock(self.key))
+        if acquired:
+            logger.info(f"Acquired refresh leader lock (pid {os.getpid()})")
+        return acquired
+
+    def is_held(self) -> bool:
+        return self.session.holds(self.key)
+
+    def release(self) -> None:
+        self.session.unlock(self.key)
+
+
+class BuildLock:
+    """One snapshot build at a time: across processes with a lock session, else within this one"""
+
+    def __init__(self, session: Optional[LockSession], key: int):
+        self.session = session
+        self.key = key
+        # Advisory locks are re-entrant within a session, so threads of this process exclude each other here
+        self._local = threading.Lock()
+
+    def try_acquire(self) -> bool:
+        """False when another thread or process holds it, or when the database is unreachable"""
+        if not self._local.acquire(blocking=False):
+            return False
+        if self.session is None:
+            return True
+        acquired = self.session.try_lock(self.key)
+        if not acquired:
+            self._local.release()
+            if acquired is None:
+                logger.warning("Database unreachable, not building a snapshot without the build lock")
+        return bool(acquired)
+
+    def release(self) -> None:
+        if self.session is not None:
+            self.session.unlock(self.key)
+        self._local.release()
+
+
+class FileLeaderLock(LeaderLock):
+    """Exclusive flock on a file shared by all workers on one host."""
+
+    mode = 'file'
+
+    def __init__(self, path: str):
+        self.path = path
+        self.fd: Optional[int] = None
+
+    def try_acquire(self) -> bool:
+        if self.fd is not None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self.fd = fd
+        logger.info(f"Acquired refresh leader lock file {self.path} (pid {os.getpid()})")
+        return True
+
+    def is_held(self) -> bool:
+        return self.fd is not None
+
+    def release(self) -> None:
+        if self.fd is not None:
+            try:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+            finally:
+                os.close(self.fd)
+            self.fd = None
+
+
+def create_leader_lock(mode: str, session: LockSession, key: int, path: str) -> LeaderLock:
+    """Build the leader lock for the configured mode ('postgres', 'file' or 'none')"""
+    mode = (mode or 'none').lower()
+    if mode == 'postgres':
+        return PostgresLeaderLock(session, key)
+    if mode == 'file':
+        return FileLeaderLock(path)
+    if mode != 'none':
+        logger.warning(f"Unknown LEADER_LOCK mode '{mode}', every worker will refresh")
+    return LeaderLock()
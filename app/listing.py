@@ -0,0 +1,151 @@
+"""Sorted, filtered and paginated views of a snapshot's validators"""
+
+import base64
+import json
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Fields a list can be sorted by
+SORT_FIELDS = (
+    'activatedStake', 'commission', 'skipRate', 'creditsGrowth', 'apr', 'lastVote', 'rootSlot', 'credits',
+    'version', 'delinquent', 'identityPubkey', 'voteAccountPubkey'
+)
+TEXT_FIELDS = ('version', 'identityPubkey', 'voteAccountPubkey')
+
+# Filtered orders kept per snapshot, keyed by sort field and filters
+MAX_CACHED_ORDERS = 64
+
+
+def encode_cursor(value: Any, identity: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([value, identity]).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[Any, str]:
+    """Raises ValueError on a malformed cursor"""
+    try:
+        value, identity = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (TypeError, ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor") from None
+    if not isinstance(identity, str):
+        raise ValueError("Invalid cursor")
+    return value, identity
+
+
+class ValidatorIndex:
+    def __init__(self, data: Dict[str, Any]):
+        self.version = data.get('snapshotVersion')
+        self.validators: List[Dict[str, Any]] = data.get('validators', [])
+        self.identities = np.array([validator['identityPubkey'] for validator in self.validators], dtype=str)
+        # Identities in order, and each validator's position among them
+        self._identity_order = np.argsort(self.identities, kind='stable')
+        self._identity_rank = np.empty(len(self.identities), dtype=np.int32)
+        self._identity_rank[self._identity_order] = np.arange(len(self.identities), dtype=np.int32)
+        self._columns: Dict[str, np.ndarray] = {}
+        # (order, sorted values, sorted identity ranks) per sort field and filter
+        self._orders: Dict[Any, Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.validators)
+
+    def column(self, field: str) -> np.ndarray:
+        with self._lock:
+            column = self._columns.get(field)
+        if column is None:
+            values = [validator.get(field) for validator in self.validators]
+            if field in TEXT_FIELDS:
+                column = np.array([value or '' for value in values], dtype=str)
+            else:
+                column = np.array([value or 0 for value in values], dtype=float if field in ('skipRate', 'apr') else np.int64)
+            with self._lock:
+                self._columns[field] = column
+        return column
+
+    def order(self, field: str, mask_key: Tuple = (), mask: Optional[np.ndarray] = None) -> np.ndarray:
+        """Positions of the (masked) validators in ascending order of `field`, then identity"""
+        return self._sorted(field, mask_key, mask)[0]
+
+    def _sorted(self, field: str, mask_key: Tuple, mask: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        key = (field,) + mask_key
+        with self._lock:
+            entry = self._orders.get(key)
+        if entry is not None:
+            return entry
+        if mask is None:
+            order = np.lexsort((self._identity_rank, self.column(field)))
+        else:
+            order = self.order(field)
+            order = order[mask[order]]
+        # Kept sorted so a cursor is found by binary search without gathering the column
+        entry = (order, self.column(field)[order], self._identity_rank[order])
+        with self._lock:
+            if len(self._orders) >= MAX_CACHED_ORDERS:
+                # Keep the unfiltered orders, drop the rest
+                self._orders = {k: v for k, v in self._orders.items() if len(k) == 1}
+            self._orders[key] = entry
+        return entry
+
+    def mask(self, delinquent: Optional[bool] = None, versions: Sequence[str] = (),
+             min_stake: Optional[int] = None) -> Tuple[Tuple, Optional[np.ndarray]]:
+        """The filter as a cache key and a boolean mask (None when nothing is filtered)"""
+        key: Tuple = ()
+        mask = None
+        if delinquent is not None:
+            key += ('delinquent', delinquent)
+            mask = self.column('delinquent') == int(delinquent)
+        if versions:
+            key += ('version', tuple(sorted(versions)))
+            matches = np.isin(self.column('version'), list(versions))
+            mask = matches if mask is None else mask & matches
+        if min_stake is not None:
+            key += ('minStake', min_stake)
+            matches = self.column('activatedStake') >= min_stake
+            mask = matches if mask is None else mask & matches
+        return key, mask
+
+    def page(self, sort: str, descending: bool, mask_key: Tuple, mask: Optional[np.ndarray], limit: int,
+             offset: int = 0, after: Optional[Tuple[Any, str]] = None) -> Tuple[List[Dict[str, Any]], int, Optional[str]]:
+        """One page of validators; returns (validators, total matching, cursor of the next page)"""
+        order, values, ranks = self._sorted(sort, mask_key, mask)
+        total = len(order)
+        if after is not None:
+            # Rows equal to the cursor's value sit in one run, ordered by identity
+            value, identity = after
+            try:
+                value = values.dtype.type(value)
+            except (TypeError, ValueError):
+                raise ValueError("Invalid cursor") from None
+            low = int(np.searchsorted(values, value, 'left'))
+            high = int(np.searchsorted(values, value, 'right'))
+            # The cursor's identity as a rank; one no longer listed ranks between its neighbours
+            rank = int(np.searchsorted(self.identities, identity, 'left', sorter=self._identity_order))
+            listed = rank < len(self.identities) and self.identities[self._identity_order[rank]] == identity
+            ties = ranks[low:high]
+            if descending:
+                end = low + int(np.searchsorted(ties, rank, 'left'))
+            else:
+                start = low + int(np.searchsorted(ties, rank, 'right' if listed else 'left'))
+        elif descending:
+            start = end = total - offset
+        else:
+            start = offset
+
+        if descending:
+            positions = order[max(end - limit, 0):max(end, 0)][::-1]
+            more = end - limit > 0
+        else:
+            positions = order[start:start + limit]
+            more = start + limit < total
+
+        validators = [self.validators[i] for i in positions.tolist()]
+        cursor = None
+        if more and len(positions):
+            last = int(positions[-1])
+            value = self.column(sort)[last]
+            cursor = encode_cursor(value.item() if hasattr(value, 'item') else value, self.validators[last]['identityPubkey'])
+        return validators, total, cursor
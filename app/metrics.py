@@ -0,0 +1,211 @@
+"""Columnar computation of per-validator metrics"""
+
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_VERSION = "1.16.0"
+
+# Lamport amounts are u64 on chain and their sum is bounded by the supply,
+# so uint64 totals cannot overflow
+STAKE_DTYPE = np.uint64
+
+
+# Fields of a validator record, in the order they are served
+RECORD_FIELDS = (
+    'identityPubkey', 'voteAccountPubkey', 'commission', 'lastVote', 'rootSlot', 'credits', 'activatedStake',
+    'version', 'skipRate', 'creditsGrowth', 'location', 'delinquent', 'apr'
+)
+
+
+@dataclass
+class ValidatorRecord:
+    """One validator of a snapshot, readable like the dict a snapshot decodes to"""
+
+    __slots__ = RECORD_FIELDS + ('epoch_credits',)
+
+    identityPubkey: str
+    voteAccountPubkey: str
+    commission: int
+    lastVote: int
+    rootSlot: int
+    credits: int
+    activatedStake: int
+    version: str
+    skipRate: float
+    creditsGrowth: int
+    location: Optional[Dict[str, Any]]
+    delinquent: bool
+    apr: float
+
+    def __getitem__(self, field: str) -> Any:
+        try:
+            return getattr(self, field)
+        except AttributeError:
+            raise KeyError(field) from None
+
+    def get(self, field: str, default: Any = None) -> Any:
+        return getattr(self, field, default) if field in RECORD_FIELDS else default
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {field: getattr(self, field) for field in RECORD_FIELDS}
+
+
+def record_values(validator: Any) -> Tuple[Any, ...]:
+    """The fields of a record or snapshot dict as a tuple, to keep and compare cheaply"""
+    return tuple(validator.get(field) for field in RECORD_FIELDS)
+
+
+def _last_two_credits(account: Dict[str, Any]) -> Tuple[int, int, bool]:
+    epoch_credits = account.get("epochCredits") or []
+    if len(epoch_credits) < 2:
+        return 0, 0, False
+    return epoch_credits[-1][2], epoch_credits[-2][2], True
+
+
+class ValidatorColumns:
+    """The vote accounts of one refresh as parallel arrays, current validators first"""
+
+    def __init__(self, current: List[Dict[str, Any]], delinquent: List[Dict[str, Any]],
+                 block_production: Optional[Dict[str, List[int]]] = None):
+        self.accounts = current + delinquent
+        count = len(self.accounts)
+        block_production = block_production or {}
+
+        self.vote_pubkeys = [str(account.get("votePubkey", "")) for account in self.accounts]
+        self.identities = [
+            str(account.get("nodePubkey", vote_pubkey))
+            for account, vote_pubkey in zip(self.accounts, self.vote_pubkeys)
+        ]
+        self.versions = [str(account.get("version", DEFAULT_VERSION)) for account in self.accounts]
+
+        self.stake = np.fromiter((int(a.get("activatedStake", 0)) for a in self.accounts), STAKE_DTYPE, count)
+        self.commission = np.fromiter((int(a.get("commission", 0)) for a in self.accounts), np.int64, count)
+        self.delinquent = np.zeros(count, dtype=bool)
+        self.delinquent[len(current):] = True
+
+        production = [block_production.get(identity, (0, 0)) for identity in self.identities]
+        assigned = np.fromiter((int(slots[0]) for slots in production), np.int64, count)
+        produced = np.fromiter((int(slots[1]) for slots in production), np.int64, count)
+        # Validators without leader slots this epoch have a skip rate of 0
+        self.skip_rate = np.divide(
+            (assigned - produced) * 100.0, assigned,
+            out=np.zeros(count), where=assigned > 0
+        )
+
+        credits = np.array([_last_two_credits(account) for account in self.accounts], dtype=np.int64).reshape(count, 3)
+        self.credits_growth = np.where(credits[:, 2] == 1, credits[:, 0] - credits[:, 1], 0)
+
+    def __len__(self) -> int:
+        return len(self.accounts)
+
+    def stake_totals(self) -> Tuple[int, int, int]:
+        """Return (active, current, delinquent) stake: active counts current validators only"""
+        active = int(self.stake[~self.delinquent].sum(dtype=STAKE_DTYPE))
+        delinquent = int(self.stake[self.delinquent].sum(dtype=STAKE_DTYPE))
+        return active, active + delinquent, delinquent
+
+    def apr(self, network_apr: float) -> np.ndarray:
+        """Validator APR: the network APR minus commission"""
+        return network_apr * (1 - self.commission / 100)
+
+    def credits_earned(self, epoch: int) -> np.ndarray:
+        """Vote credits each account earned in `epoch` (0 if it did not vote in it)"""
+        earned = np.zeros(len(self), dtype=np.int64)
+        for i, account in enumerate(self.accounts):
+            for entry_epoch, credits, previous_credits in reversed(account.get("epochCredits") or []):
+                if entry_epoch <= epoch:
+                    if entry_epoch == epoch:
+                        earned[i] = credits - previous_credits
+                    break
+        return earned
+
+    def reward_apr(self, rewards: Dict[str, Any], epoch: int, epochs_per_year: float) -> Dict[str, float]:
+        """APR the stakers of each vote account in `rewards` earned in `epoch`, priced from the median revealed point value"""
+        in_epoch = np.array([vote_pubkey in rewards for vote_pubkey in self.vote_pubkeys], dtype=bool)
+        entries = [rewards.get(vote_pubkey) for vote_pubkey in self.vote_pubkeys]
+        amounts = np.array([(entry.amount if entry else None) or 0 for entry in entries], dtype=float)
+        # The commission charged in that epoch, where the reward reports it
+        commission = np.array([
+            entry.commission if entry and entry.commission is not None else current
+            for entry, current in zip(entries, self.commission.tolist())
+        ], dtype=float)
+        earned = self.credits_earned(epoch).astype(float)
+        stake = self.stake.astype(float)
+
+        revealing = in_epoch & (amounts > 0) & (commission > 0) & (earned > 0) & (stake > 0)
+        if not revealing.any():
+            return {}
+        point_values = amounts[revealing] * 100 / commission[revealing] / (earned[revealing] * stake[revealing])
+        point_value = float(np.median(point_values))
+        apr = point_value * earned * (1 - commission / 100) * epochs_per_year * 100
+        return {vote_pubkey: value for vote_pubkey, value, known in zip(self.vote_pubkeys, apr.tolist(), in_epoch) if known}
+
+    def average_skip_rate(self) -> float:
+        return float(self.skip_rate.mean()) if len(self) else 0
+
+    def records(self, apr: np.ndarray, locations: Optional[Dict[str, Optional[Dict[str, Any]]]] = None) -> List[ValidatorRecord]:
+        """Per-validator records in the shape served by /api/nodes"""
+        locations = locations or {}
+        records = []
+        for account, identity, vote_pubkey, version, commission, stake, skip_rate, credits_growth, delinquent, validator_apr in zip(
+            self.accounts, self.identities, self.vote_pubkeys, self.versions,
+            self.commission.tolist(), self.stake.tolist(), self.skip_rate.tolist(),
+            self.credits_growth.tolist(), self.delinquent.tolist(), apr.tolist()
+        ):
+            record = ValidatorRecord(
+                identity, vote_pubkey, commission,
+                int(account.get("lastVote", 0)), int(account.get("rootSlot", 0)), int(account.get("credits", 0)),
+                stake, version, skip_rate, credits_growth, locations.get(identity), delinquent, validator_apr
+            )
+            record.epoch_credits = account.get("epochCredits") or []
+            records.append(record)
+        return records
+
+    def version_stats(self, apr: np.ndarray) -> Dict[str, Dict[str, Any]]:
+        """Validator counts, stake and averages grouped by software version"""
+        if not len(self):
+            return {}
+        unique, first_seen, group = np.unique(np.array(self.versions), return_index=True, return_inverse=True)
+        groups = len(unique)
+        current = ~self.delinquent
+
+        def total(values: np.ndarray, mask: Optional[np.ndarray] = None) -> np.ndarray:
+            if mask is None:
+                return np.bincount(group, weights=values, minlength=groups)
+            return np.bincount(group[mask], weights=values[mask], minlength=groups)
+
+        def stake_total(mask: np.ndarray) -> np.ndarray:
+            # bincount weights are floats; add.at keeps stake exact
+            sums = np.zeros(groups, dtype=STAKE_DTYPE)
+            np.add.at(sums, group[mask], self.stake[mask])
+            return sums
+
+        current_count = np.bincount(group[current], minlength=groups)
+        delinquent_count = np.bincount(group[self.delinquent], minlength=groups)
+        count = current_count + delinquent_count
+        current_stake = stake_total(current)
+        delinquent_stake = stake_total(self.delinquent)
+        total_apr = total(apr)
+        average_skip_rate = total(self.skip_rate) / count
+        average_credits_growth = total(self.credits_growth.astype(float)) / count
+
+        # Versions in order of first appearance, like the validator list
+        return {
+            str(unique[i]): {
+                'currentValidators': int(current_count[i]),
+                'delinquentValidators': int(delinquent_count[i]),
+                'currentActiveStake': int(current_stake[i]),
+                'delinquentActiveStake': int(delinquent_stake[i]),
+                'averageSkipRate': float(average_skip_rate[i]),
+                'averageCreditsGrowth': float(average_credits_growth[i]),
+                'averageApr': float(total_apr[i] / count[i]),
+                'totalApr': float(total_apr[i]),
+                'validatorsWithApr': int(count[i])
+            }
+            for i in np.argsort(first_seen, kind='stable').tolist()
+        }
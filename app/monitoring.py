@@ -0,0 +1,75 @@
+"""Prometheus metrics"""
+
+import os
+from typing import Dict, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (1e3, 1e4, 5e4, 1e5, 2.5e5, 5e5, 1e6, 2.5e6, 5e6)
+
+RPC_LATENCY = Histogram(
+    'koii_rpc_request_duration_seconds', 'Koii RPC round trip time by method ("batch" for batch requests)',
+    ['method'], buckets=LATENCY_BUCKETS
+)
+RPC_ERRORS = Counter('koii_rpc_errors_total', 'Failed Koii RPC calls by method', ['method'])
+RPC_ENDPOINT_FAILURES = Counter(
+    'koii_rpc_endpoint_failures_total', 'Failed attempts by RPC endpoint (retried on another one when possible)',
+    ['endpoint']
+)
+RPC_HEDGED = Counter(
+    'koii_rpc_hedged_requests_total', 'Calls also sent to a second endpoint after running past their p95 latency',
+    ['method']
+)
+
+REFRESH_DURATION = Histogram(
+    'koii_refresh_duration_seconds', 'Duration of a background refresh cycle',
+    buckets=(1, 2, 5, 10, 15, 20, 30, 45, 60, 120)
+)
+REFRESH_STAGE_DURATION = Histogram(
+    'koii_refresh_stage_duration_seconds', 'Duration of each stage of building a snapshot',
+    ['stage'], buckets=LATENCY_BUCKETS
+)
+REFRESH_FAILURES = Counter('koii_refresh_failures_total', 'Refresh cycles that did not store a snapshot')
+SNAPSHOT_STORED = Gauge(
+    'koii_snapshot_stored_timestamp_seconds', 'Unix time the latest snapshot was stored',
+    multiprocess_mode='mostrecent'
+)
+SNAPSHOT_VERSION = Gauge('koii_snapshot_version', 'Version of the latest stored snapshot', multiprocess_mode='mostrecent')
+VALIDATORS_PROCESSED = Gauge(
+    'koii_validators_processed', 'Validators in the latest stored snapshot', multiprocess_mode='mostrecent'
+)
+
+DB_QUERY_LATENCY = Histogram('koii_db_query_duration_seconds', 'Database query time', ['query'], buckets=LATENCY_BUCKETS)
+DB_POOL_WAIT = Histogram('koii_db_pool_wait_seconds', 'Time spent waiting for a pooled connection', buckets=LATENCY_BUCKETS)
+DB_POOL_IN_USE = Gauge('koii_db_pool_connections_in_use', 'Checked out pooled connections', multiprocess_mode='livesum')
+DB_POOL_TIMEOUTS = Counter('koii_db_pool_timeouts_total', 'Requests that got no pooled connection in time')
+
+GEO_CACHE_REQUESTS = Counter('koii_geo_cache_requests_total', 'IP geolocation cache lookups', ['result'])
+GEO_PROVIDER_LOOKUPS = Counter('koii_geo_provider_lookups_total', 'IPs sent to each geolocation provider', ['provider'])
+
+CACHE_REQUESTS = Counter('koii_cache_requests_total', 'In-process cache lookups and loads', ['namespace', 'result'])
+
+HTTP_LATENCY = Histogram(
+    'koii_http_request_duration_seconds', 'Time to produce a response', ['endpoint', 'status'], buckets=LATENCY_BUCKETS
+)
+HTTP_RESPONSE_SIZE = Histogram(
+    'koii_http_response_size_bytes', 'Response body size as sent', ['endpoint', 'encoding'], buckets=SIZE_BUCKETS
+)
+
+
+def record_stages(durations: Dict[str, float]) -> None:
+    for stage, seconds in durations.items():
+        REFRESH_STAGE_DURATION.labels(stage).observe(seconds)
+
+
+def render() -> Tuple[bytes, str]:
+    """Exposition of all workers' metrics (or this process's outside gunicorn)"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
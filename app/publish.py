@@ -0,0 +1,108 @@
+"""Publishing snapshots as static files for nginx"""
+
+import logging
+import os
+import tempfile
+from typing import List, Optional, Tuple
+
+from .snapshot import EncodedSnapshot
+
+logger = logging.getLogger(__name__)
+
+LATEST = 'nodes.json'
+VERSIONS_DIR = 'snapshots'
+
+
+def _write_atomic(path: str, data: bytes, modified: Optional[int] = None) -> None:
+    directory, name = os.path.split(path)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f'.{name}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp creates the file readable by its owner only; nginx runs as another user
+        os.chmod(temp_path, 0o644)
+        if modified is not None:
+            # nginx derives Last-Modified and the ETag from the file's mtime
+            os.utime(temp_path, (modified, modified))
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _variants(encoded: EncodedSnapshot) -> List[Tuple[str, Optional[bytes]]]:
+    # Companions first, so the plain file never points at an older .gz/.br
+    return [('.gz', encoded.gzip), ('.br', encoded.br), ('', encoded.body)]
+
+
+def _published_versions(versions_dir: str) -> List[int]:
+    versions = set()
+    for name in os.listdir(versions_dir):
+        stem = name.split('.', 1)[0]
+        if stem.isdigit():
+            versions.add(int(stem))
+    return sorted(versions)
+
+
+def _prune(versions_dir: str, keep: int) -> None:
+    for version in _published_versions(versions_dir)[:-keep] if keep > 0 else []:
+        for suffix in ('.json', '.json.gz', '.json.br'):
+            try:
+                os.unlink(os.path.join(versions_dir, f"{version}{suffix}"))
+            except FileNotFoundError:
+                pass
+
+
+def publish_snapshot(directory: str, encoded: EncodedSnapshot, keep: int = 10) -> bool:
+    """Write `encoded` as the latest published snapshot; returns whether it was written"""
+    try:
+        versions_dir = os.path.join(directory, VERSIONS_DIR)
+        os.makedirs(versions_dir, exist_ok=True)
+        if encoded.version is not None:
+            newer = [version for version in _published_versions(versions_dir) if version > encoded.version]
+            if newer:
+                # A newer leader got here first
+                logger.warning(f"Not publishing snapshot version {encoded.version}, version {newer[-1]} is published")
+                return False
+            for suffix, data in _variants(encoded):
+                if data is not None:
+                    _write_atomic(os.path.join(versions_dir, f"{encoded.version}.json{suffix}"), data, encoded.modified)
+        for suffix, data in _variants(encoded):
+            path = os.path.join(directory, LATEST + suffix)
+            if data is not None:
+                _write_atomic(path, data, encoded.modified)
+            elif os.path.exists(path):
+                # No variant for this version: an older one must not be served in its place
+                os.unlink(path)
+        _prune(versions_dir, keep)
+        logger.info(f"Published snapshot version {encoded.version} to {directory}")
+        return True
+    except OSError as e:
+        logger.error(f"Error publishing snapshot to {directory}: {e}")
+        # Better the app serves /api/nodes than nginx a snapshot that is no longer updated
+        unpublish(directory)
+        return False
+
+
+def unpublish(directory: str, version: Optional[int] = None) -> bool:
+    """Remove the latest published snapshot, if `version` is still the newest, so nginx passes /api/nodes to the app"""
+    try:
+        if version is not None:
+            published = _published_versions(os.path.join(directory, VERSIONS_DIR))
+            if published and published[-1] != version:
+                return False
+        for suffix in ('', '.gz', '.br'):
+            try:
+                os.unlink(os.path.join(directory, LATEST + suffix))
+            except FileNotFoundError:
+                pass
+        logger.info(f"Unpublished the latest snapshot from {directory}")
+        return True
+    except OSError as e:
+        logger.error(f"Error unpublishing snapshot from {directory}: {e}")
+        return False
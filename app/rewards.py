@@ -0,0 +1,131 @@
+"""Inflation rewards of the vote accounts, stored once per closed epoch"""
+
+import logging
+import time
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+
+import numpy as np
+from psycopg2.extras import execute_values
+
+from .fanout import FanOut
+from .metrics import ValidatorColumns
+
+logger = logging.getLogger(__name__)
+
+
+class Reward(NamedTuple):
+    """One vote account's reward; all None when it earned nothing that epoch"""
+    amount: Optional[int]  # lamports
+    post_balance: Optional[int]
+    commission: Optional[int]
+    effective_slot: Optional[int]
+
+
+NO_REWARD = Reward(None, None, None, None)
+
+SECONDS_PER_YEAR = 365.25 * 24 * 3600
+
+
+def epochs_per_year(slots_per_epoch: int, slot_duration: float) -> float:
+    return SECONDS_PER_YEAR / (slots_per_epoch * slot_duration)
+
+
+def init_rewards_schema(cur) -> None:
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS validator_rewards (
+            epoch BIGINT NOT NULL,
+            vote_account TEXT NOT NULL,
+            amount BIGINT,
+            post_balance BIGINT,
+            commission SMALLINT,
+            effective_slot BIGINT,
+            PRIMARY KEY (epoch, vote_account)
+        )
+    """)
+
+
+def load_rewards(conn, epoch: int) -> Dict[str, Reward]:
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT vote_account, amount, post_balance, commission, effective_slot
+            FROM validator_rewards WHERE epoch = %s
+        """, (epoch,))
+        return {row[0]: Reward(*row[1:]) for row in cur.fetchall()}
+
+
+def store_rewards(conn, epoch: int, rewards: Dict[str, Reward]) -> None:
+    """Insert rewards; rows already stored (by another process) are kept as they are"""
+    with conn.cursor() as cur:
+        execute_values(cur, """
+            INSERT INTO validator_rewards (epoch, vote_account, amount, post_balance, commission, effective_slot)
+            VALUES %s ON CONFLICT DO NOTHING
+        """, [(epoch, vote_account) + tuple(reward) for vote_account, reward in rewards.items()], page_size=1000)
+    conn.commit()
+
+
+def _parse_reward(entry: Optional[Dict[str, Any]]) -> Reward:
+    if not entry:
+        return NO_REWARD
+    return Reward(entry.get('amount'), entry.get('postBalance'), entry.get('commission'), entry.get('effectiveSlot'))
+
+
+def fetch_rewards(client, vote_accounts: List[str], epoch: int, min_context_slot: int, chunk_size: int,
+                  retries: int, timeout: float) -> Dict[str, Reward]:
+    """The epoch's rewards of `vote_accounts`, fetched in parallel chunks retried on their own"""
+    params = {"epoch": epoch, "commitment": "finalized", "minContextSlot": min_context_slot}
+
+    def fetch_chunk(chunk: List[str]) -> Dict[str, Reward]:
+        for attempt in range(retries + 1):
+            try:
+                result = client.call("getInflationReward", [chunk, params], timeout=timeout)
+                if not isinstance(result, list) or len(result) != len(chunk):
+                    raise ValueError("unexpected getInflationReward result")
+                return {vote_account: _parse_reward(entry) for vote_account, entry in zip(chunk, result)}
+            except Exception as e:
+                if attempt == retries:
+                    raise
+                logger.warning(f"Rewards chunk of {len(chunk)} accounts failed ({e}), retrying")
+                time.sleep(0.5 * 2 ** attempt)
+
+    chunks = [vote_accounts[i:i + chunk_size] for i in range(0, len(vote_accounts), chunk_size)]
+    result = FanOut(
+        {f"chunk{i}": (lambda chunk=chunk: fetch_chunk(chunk)) for i, chunk in enumerate(chunks)},
+        default_timeout=timeout * (retries + 1)
+    ).wait()
+    if result.errors:
+        logger.error(f"{len(result.errors)} of {len(chunks)} rewards chunks failed for epoch {epoch}: "
+                     f"{next(iter(result.errors.values()))}")
+    rewards: Dict[str, Reward] = {}
+    for chunk_rewards in result.results.values():
+        rewards.update(chunk_rewards)
+    return rewards
+
+
+class EpochRewards:
+    """The rewards of one epoch known to this process, and the APR derived from them"""
+
+    def __init__(self, epoch: int, rewards: Optional[Dict[str, Reward]] = None):
+        self.epoch = epoch
+        self.rewards: Dict[str, Reward] = rewards or {}
+        self._apr: Optional[Dict[str, float]] = None
+
+    def __len__(self) -> int:
+        return len(self.rewards)
+
+    def missing(self, vote_accounts: Iterable[str]) -> List[str]:
+        return [vote_account for vote_account in vote_accounts if vote_account not in self.rewards]
+
+    def add(self, rewards: Dict[str, Reward]) -> None:
+        if rewards:
+            self.rewards.update(rewards)
+            self._apr = None
+
+    def apr(self, columns: ValidatorColumns, epochs_per_year: float, estimate: np.ndarray) -> np.ndarray:
+        """Per-validator APR earned in this epoch; `estimate` for validators it has no data on"""
+        if self._apr is None:
+            self._apr = columns.reward_apr(self.rewards, self.epoch, epochs_per_year)
+            logger.info(f"Derived the APR of {len(self._apr)} validators from epoch {self.epoch} rewards")
+        if not self._apr:
+            return estimate
+        apr = np.fromiter((self._apr.get(vote_pubkey, np.nan) for vote_pubkey in columns.vote_pubkeys), float, len(columns))
+        return np.where(np.isnan(apr), estimate, apr)
@@ -0,0 +1,358 @@
+"""Shared JSON-RPC 2.0 client for the Koii RPC endpoints"""
+
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Tuple, Union
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .config import Config
+from .monitoring import RPC_ENDPOINT_FAILURES, RPC_ERRORS, RPC_HEDGED, RPC_LATENCY
+
+logger = logging.getLogger(__name__)
+
+# JSON-RPC errors of a node that is unhealthy or behind the cluster: another node may answer
+NODE_ERROR_CODES = {-32005, -32016}
+
+# Round trips kept per method for its p95, and how many are needed before hedging on it
+LATENCY_WINDOW = 200
+LATENCY_MIN_SAMPLES = 20
+# Weight of the newest probe in an endpoint's latency score
+PROBE_SMOOTHING = 0.3
+
+
+class RpcError(Exception):
+    """A JSON-RPC call failed at the HTTP, decoding or protocol level"""
+
+    def __init__(self, method: str, message: str, code: Optional[int] = None, retryable: bool = False):
+        super().__init__(f"{method}: {message}")
+        self.method = method
+        self.code = code
+        # The endpoint failed rather than the request, so another endpoint may answer it
+        self.retryable = retryable
+
+
+class RpcEndpoint:
+    """One RPC node with its measured latency, slot and circuit breaker state"""
+
+    def __init__(self, url: str):
+        self.url = url
+        # Host only, for logs and metrics: some providers put the API key in the path
+        self.name = urlsplit(url).netloc or url
+        self.latency: Optional[float] = None  # smoothed probe round trip
+        self.slot: Optional[int] = None
+        self.lagging = False
+        self.failures = 0  # consecutive
+        self.open_until = 0.0
+
+
+class KoiiRpcClient:
+    def __init__(self, urls: Union[str, Sequence[str], None], timeout: float = 10, pool_size: int = 16,
+                 hedge: bool = True, hedge_min_delay: float = 0.05, breaker_failures: int = 3,
+                 breaker_cooldown: float = 30, probe_interval: float = 10, max_slot_lag: int = 150):
+        if isinstance(urls, str):
+            urls = [urls]
+        self.endpoints = [RpcEndpoint(url) for url in urls or [] if url]
+        self.timeout = timeout
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.breaker_failures = breaker_failures
+        self.breaker_cooldown = breaker_cooldown
+        self.probe_interval = probe_interval
+        self.max_slot_lag = max_slot_lag
+        self.session = requests.Session()
+        self.session.headers.update({
+            'Content-Type': 'application/json',
+            'Accept': 'application/json'
+        })
+        adapter = HTTPAdapter(pool_connections=max(len(self.endpoints), 1), pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._ids = itertools.count(1)
+        self._ids_lock = threading.Lock()
+        self._lock = threading.Lock()
+        # Recent round trips of each method, across endpoints
+        self._latencies: Dict[str, Deque[float]] = {}
+        # Attempts run here so the caller can wait for the first of a call and its hedge
+        self._executor = ThreadPoolExecutor(max_workers=pool_size * 2, thread_name_prefix='rpc-attempt') \
+            if len(self.endpoints) > 1 else None
+        self._prober: Optional[threading.Thread] = None
+
+    def _next_id(self) -> int:
+        with self._ids_lock:
+            return next(self._ids)
+
+    def _post(self, endpoint: RpcEndpoint, method: str, payload: Any, timeout: float) -> Any:
+        try:
+            response = self.session.post(endpoint.url, json=payload, timeout=timeout)
+        except requests.exceptions.RequestException as e:
+            raise RpcError(method, f"failed to connect to RPC endpoint {endpoint.name}: {e}", retryable=True)
+
+        if response.status_code != 200:
+            logger.error(f"Response text: {response.text[:200]}...")
+            raise RpcError(method, f"RPC endpoint {endpoint.name} returned status code {response.status_code}",
+                           retryable=True)
+
+        content_type = response.headers.get('content-type', '')
+        if 'application/json' not in content_type.lower():
+            logger.error(f"Response text: {response.text[:200]}...")
+            raise RpcError(method, f"unexpected content type from RPC endpoint {endpoint.name}: {content_type}",
+                           retryable=True)
+
+        try:
+            return response.json()
+        except ValueError as e:
+            logger.error(f"Response text: {response.text[:200]}...")
+            raise RpcError(method, f"failed to parse JSON from RPC endpoint {endpoint.name}: {e}", retryable=True)
+
+    @staticmethod
+    def _unwrap(method: str, data: Any) -> Any:
+        if not isinstance(data, dict):
+            raise RpcError(method, "unexpected response structure", retryable=True)
+        if "error" in data:
+            error = data["error"]
+            code = error.get("code") if isinstance(error, dict) else None
+            raise RpcError(method, f"RPC error: {error}", code, retryable=code in NODE_ERROR_CODES)
+        if "result" not in data:
+            raise RpcError(method, "no result in response", retryable=True)
+        return data["result"]
+
+    @classmethod
+    def _batch_response(cls, label: str, data: Any) -> List[Any]:
+        if not isinstance(data, list):
+            # Servers answer a batch they cannot process with a single error object
+            cls._unwrap(label, data)
+            raise RpcError(label, "expected an array response to a batch request", retryable=True)
+        return data
+
+    def _attempt(self, endpoint: RpcEndpoint, method: str, payload: Any, timeout: float,
+                 check: Callable[[str, Any], Any]) -> Any:
+        """Send `payload` to one endpoint and keep score of how it went"""
+        started = time.time()
+        try:
+            result = check(method, self._post(endpoint, method, payload, timeout))
+        except RpcError as e:
+            if e.retryable:
+                self._record_failure(endpoint, e)
+            else:
+                # The endpoint answered; the request itself was refused
+                self._record_answer(endpoint, method, time.time() - started)
+            raise
+        self._record_answer(endpoint, method, time.time() - started)
+        return result
+
+    def _record_answer(self, endpoint: RpcEndpoint, method: str, elapsed: float) -> None:
+        with self._lock:
+            endpoint.failures = 0
+            endpoint.open_until = 0.0
+            self._latencies.setdefault(method, deque(maxlen=LATENCY_WINDOW)).append(elapsed)
+
+    def _record_failure(self, endpoint: RpcEndpoint, error: RpcError) -> None:
+        RPC_ENDPOINT_FAILURES.labels(endpoint.name).inc()
+        with self._lock:
+            endpoint.failures += 1
+            if endpoint.failures < self.breaker_failures or len(self.endpoints) < 2:
+                return
+            # Also re-opens a circuit whose trial call after the cooldown failed
+            endpoint.open_until = time.time() + self.breaker_cooldown
+            if endpoint.failures > self.breaker_failures:
+                return
+        logger.warning(f"RPC endpoint {endpoint.name} failed {endpoint.failures} calls in a row ({error}), "
+                       f"not using it for {self.breaker_cooldown:.0f}s")
+
+    def _route(self) -> List[RpcEndpoint]:
+        """Endpoints to try, in order: the fastest healthy one first"""
+        now = time.time()
+        with self._lock:
+            available = [endpoint for endpoint in self.endpoints if endpoint.open_until <= now and not endpoint.lagging]
+            if not available:
+                # Every endpoint is failing or behind: try them all, the one taken out longest ago first
+                return sorted(self.endpoints, key=lambda endpoint: endpoint.open_until)
+            # Endpoints not probed yet keep their configured order, after the measured ones
+            return sorted(available, key=lambda endpoint: (endpoint.latency is None, endpoint.latency or 0))
+
+    def _hedge_delay(self, method: str, timeout: float) -> float:
+        """How long a call of `method` runs before it is also sent to a second endpoint: its p95 latency"""
+        with self._lock:
+            samples = sorted(self._latencies.get(method, ()))
+        if len(samples) < LATENCY_MIN_SAMPLES:
+            return timeout / 2
+        return max(samples[int(len(samples) * 0.95)], self.hedge_min_delay)
+
+    def _request(self, method: str, label: str, payload: Any, timeout: Optional[float],
+                 check: Callable[[str, Any], Any]) -> Any:
+        timeout = timeout or self.timeout
+        if not self.endpoints:
+            raise RpcError(method, "KOII_RPC_URL is not configured")
+        if len(self.endpoints) == 1:
+            return self._attempt(self.endpoints[0], method, payload, timeout, check)
+
+        self._start_probing()
+        endpoints = self._route()
+        started = time.time()
+        deadline = started + timeout
+        hedge_at = started + self._hedge_delay(method, timeout) if self.hedge else float('inf')
+        pending: Dict[Future, RpcEndpoint] = {}
+        error: Optional[RpcError] = None
+
+        def send() -> None:
+            endpoint = endpoints.pop(0)
+            pending[self._executor.submit(
+                self._attempt, endpoint, method, payload, max(deadline - time.time(), 0.1), check
+            )] = endpoint
+
+        send()
+        while pending:
+            wake = min(deadline, hedge_at) if endpoints else deadline
+            done, _ = wait(list(pending), timeout=max(wake - time.time(), 0), return_when=FIRST_COMPLETED)
+            for future in done:
+                endpoint = pending.pop(future)
+                try:
+                    # Attempts still running finish in the background and are scored like any other
+                    return future.result()
+                except RpcError as e:
+                    if not e.retryable:
+                        raise
+                    logger.warning(f"{e}; trying another endpoint" if endpoints else str(e))
+                    error = e
+            if time.time() >= deadline:
+                break
+            if endpoints and not pending:
+                send()
+            elif endpoints and time.time() >= hedge_at:
+                RPC_HEDGED.labels(label).inc()
+                hedge_at = float('inf')
+                send()
+        if pending:
+            raise RpcError(method, f"no RPC endpoint answered within {timeout:.1f}s", retryable=True)
+        raise error
+
+    def _start_probing(self) -> None:
+        if self._prober is not None or self.probe_interval <= 0:
+            return
+        with self._lock:
+            if self._prober is None:
+                self._prober = threading.Thread(target=self._probe_loop, daemon=True, name='rpc-probe')
+                self._prober.start()
+
+    def _probe_loop(self) -> None:
+        while True:
+            try:
+                self.probe()
+            except Exception as e:
+                logger.error(f"Error probing RPC endpoints: {e}")
+            time.sleep(self.probe_interval)
+
+    def _probe_endpoint(self, endpoint: RpcEndpoint) -> int:
+        payload = {"jsonrpc": "2.0", "id": self._next_id(), "method": "getSlot", "params": []}
+        started = time.time()
+        slot = int(self._attempt(endpoint, "getSlot", payload, min(self.timeout, 5), self._unwrap))
+        elapsed = time.time() - started
+        with self._lock:
+            endpoint.latency = elapsed if endpoint.latency is None \
+                else (1 - PROBE_SMOOTHING) * endpoint.latency + PROBE_SMOOTHING * elapsed
+            endpoint.slot = slot
+        return slot
+
+    def probe(self) -> None:
+        """Measure every endpoint's round trip and slot; endpoints too far behind the highest slot are set aside"""
+        futures = {endpoint: self._executor.submit(self._probe_endpoint, endpoint) for endpoint in self.endpoints}
+        slots = {}
+        for endpoint, future in futures.items():
+            try:
+                slots[endpoint] = future.result()
+            except Exception:
+                # Counted against its circuit breaker by the attempt itself
+                pass
+        if not slots:
+            return
+        highest = max(slots.values())
+        with self._lock:
+            for endpoint, slot in slots.items():
+                lagging = highest - slot > self.max_slot_lag
+                if lagging != endpoint.lagging:
+                    if lagging:
+                        logger.warning(f"RPC endpoint {endpoint.name} is {highest - slot} slots behind, not using it")
+                    else:
+                        logger.info(f"RPC endpoint {endpoint.name} caught up")
+                endpoint.lagging = lagging
+
+    def status(self) -> List[Dict[str, Any]]:
+        """Latency, slot and breaker state of each endpoint, for the health endpoint"""
+        now = time.time()
+        with self._lock:
+            return [
+                {
+                    'endpoint': endpoint.name,
+                    'latencyMs': round(endpoint.latency * 1000, 1) if endpoint.latency is not None else None,
+                    'slot': endpoint.slot,
+                    'lagging': endpoint.lagging,
+                    'failures': endpoint.failures,
+                    'circuitOpen': endpoint.open_until > now
+                }
+                for endpoint in self.endpoints
+            ]
+
+    def call(self, method: str, params: Optional[list] = None, timeout: Optional[float] = None) -> Any:
+        """Send one JSON-RPC request and return its `result`"""
+        payload = {
+            "jsonrpc": "2.0",
+            "id": self._next_id(),
+            "method": method,
+            "params": params or []
+        }
+        started = time.time()
+        try:
+            return self._request(method, method, payload, timeout, self._unwrap)
+        except RpcError:
+            RPC_ERRORS.labels(method).inc()
+            raise
+        finally:
+            RPC_LATENCY.labels(method).observe(time.time() - started)
+
+    def batch(self, calls: Sequence[Tuple[str, Optional[list]]],
+              timeout: Optional[float] = None) -> List[Union[Any, RpcError]]:
+        """Send several requests as one JSON-RPC batch; returns each result, or its RpcError, in call order"""
+        if not calls:
+            return []
+        ids = [self._next_id() for _ in calls]
+        payload = [
+            {"jsonrpc": "2.0", "id": request_id, "method": method, "params": params or []}
+            for request_id, (method, params) in zip(ids, calls)
+        ]
+        label = f"batch[{len(calls)}]"
+        started = time.time()
+        try:
+            data = self._request(label, 'batch', payload, timeout, self._batch_response)
+        except RpcError:
+            RPC_ERRORS.labels('batch').inc()
+            raise
+        finally:
+            RPC_LATENCY.labels('batch').observe(time.time() - started)
+
+        # Responses may come back in any order
+        by_id = {item.get("id"): item for item in data if isinstance(item, dict)}
+        results: List[Union[Any, RpcError]] = []
+        for request_id, (method, _) in zip(ids, calls):
+            try:
+                if request_id not in by_id:
+                    raise RpcError(method, "no response in batch")
+                results.append(self._unwrap(method, by_id[request_id]))
+            except RpcError as e:
+                RPC_ERRORS.labels(method).inc()
+                results.append(e)
+        return results
+
+
+rpc_client = KoiiRpcClient(
+    Config.KOII_RPC_URLS, timeout=Config.RPC_TIMEOUT, pool_size=Config.RPC_FANOUT_WORKERS,
+    hedge=Config.RPC_HEDGE, hedge_min_delay=Config.RPC_HEDGE_MIN_DELAY,
+    breaker_failures=Config.RPC_BREAKER_FAILURES, breaker_cooldown=Config.RPC_BREAKER_COOLDOWN,
+    probe_interval=Config.RPC_PROBE_INTERVAL, max_slot_lag=Config.RPC_MAX_SLOT_LAG
+)
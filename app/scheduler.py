@@ -0,0 +1,130 @@
+"""Per-source refresh schedule of the upstream data"""
+
+import logging
+import random
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class Source:
+    """One upstream value and when to fetch it next"""
+
+    def __init__(self, name: str, interval: Optional[float], epoch_bound: bool = False,
+                 max_age: Optional[float] = None):
+        self.name = name
+        # None: fetched once (and on new epochs when epoch_bound)
+        self.interval = interval
+        self.epoch_bound = epoch_bound
+        # Values older than this are dropped while fetches keep failing
+        self.max_age = max_age
+        self.value: Any = None
+        self.fetched_at: Optional[float] = None
+        self.next_due = 0.0
+        self.failures = 0
+
+
+class SourceSchedule:
+    def __init__(self, sources: Iterable[Source], jitter: float = 0.1, retry_min: float = 5, retry_max: float = 300):
+        self.sources: Dict[str, Source] = {source.name: source for source in sources}
+        self.jitter = jitter
+        self.retry_min = retry_min
+        self.retry_max = retry_max
+        self.epoch: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def due(self, now: Optional[float] = None) -> List[str]:
+        """Sources due now, with those due within their jitter window so they share the fetch"""
+        now = time.time() if now is None else now
+        with self._lock:
+            if not any(source.next_due <= now for source in self.sources.values()):
+                return []
+            return [
+                name for name, source in self.sources.items()
+                if source.next_due <= now + max(1.0, self.jitter * (source.interval or 0))
+            ]
+
+    def seconds_until_due(self, now: Optional[float] = None) -> float:
+        now = time.time() if now is None else now
+        with self._lock:
+            next_due = min((source.next_due for source in self.sources.values()), default=float('inf'))
+        return max(next_due - now, 0)
+
+    def record(self, names: Iterable[str], results: Dict[str, Any], now: Optional[float] = None) -> Set[str]:
+        """Record a fetch of `names`; those missing from `results` failed. Returns the names whose value changed"""
+        now = time.time() if now is None else now
+        # One draw per fetch: sources fetched together with the same interval stay together
+        jitter = 1 + random.uniform(-self.jitter, self.jitter)
+        changed = set()
+        with self._lock:
+            for name in names:
+                source = self.sources[name]
+                if name in results:
+                    if results[name] != source.value:
+                        changed.add(name)
+                    source.value = results[name]
+                    source.fetched_at = now
+                    source.failures = 0
+                    source.next_due = now + source.interval * jitter if source.interval else float('inf')
+                else:
+                    source.failures += 1
+                    delay = min(self.retry_min * 2 ** (source.failures - 1), self.retry_max)
+                    source.next_due = now + delay * jitter
+                    logger.warning(f"Fetching {name} failed {source.failures} time(s), retrying in {delay:.0f}s")
+                    if source.max_age is not None and source.fetched_at is not None \
+                            and now - source.fetched_at > source.max_age and source.value is not None:
+                        source.value = None
+                        changed.add(name)
+        return changed
+
+    def observe_epoch(self, epoch: Optional[int]) -> bool:
+        """Make the epoch-bound sources due when `epoch` is a new one; returns whether it was"""
+        if epoch is None:
+            return False
+        with self._lock:
+            previous, self.epoch = self.epoch, epoch
+            if previous is None or epoch == previous:
+                return False
+            for source in self.sources.values():
+                if source.epoch_bound:
+                    source.next_due = 0.0
+        logger.info(f"Epoch {epoch} started, refreshing the per-epoch sources")
+        return True
+
+    def value(self, name: str) -> Any:
+        source = self.sources.get(name)
+        return source.value if source else None
+
+    def values(self) -> Dict[str, Any]:
+        with self._lock:
+            return {name: source.value for name, source in self.sources.items() if source.value is not None}
+
+    def expire(self, *names: str) -> None:
+        """Make sources due now"""
+        with self._lock:
+            for name in names or self.sources:
+                self.sources[name].next_due = 0.0
+
+    def reset(self) -> None:
+        """Forget every value, as after a restart"""
+        with self._lock:
+            self.epoch = None
+            for source in self.sources.values():
+                source.value = source.fetched_at = None
+                source.next_due = 0.0
+                source.failures = 0
+
+    def status(self, now: Optional[float] = None) -> Dict[str, Dict[str, Any]]:
+        """Age, failures and next fetch of each source, for the health endpoint"""
+        now = time.time() if now is None else now
+        with self._lock:
+            return {
+                name: {
+                    'age': round(now - source.fetched_at, 1) if source.fetched_at is not None else None,
+                    'failures': source.failures,
+                    'nextFetchIn': round(max(source.next_due - now, 0), 1) if source.next_due != float('inf') else None
+                }
+                for name, source in self.sources.items()
+            }
@@ -0,0 +1,411 @@
+"""Storage of the latest validator snapshot, pre-encoded, with its deltas and packed epochCredits"""
+
+import gzip
+import hashlib
+import json
+import logging
+from collections import deque
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from . import credits
+from .concurrency import run_cpu_bound
+from .db import execute_prepared
+from .metrics import ValidatorRecord, record_values
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_ID = 1
+
+# Postgres channel announcing each stored snapshot version
+NOTIFY_CHANNEL = 'validator_snapshot'
+VERSION_SQL = f"SELECT version FROM validator_snapshot WHERE id = {SNAPSHOT_ID}"
+
+# Layout of the snapshot dict; bump when readers of older rows would misread it
+SCHEMA_VERSION = 1
+
+
+class EncodedSnapshot:
+    """A snapshot serialized once, with its compressed variants"""
+
+    __slots__ = ('version', 'etag', 'body', 'gzip', 'br', 'modified')
+
+    def __init__(self, version: Optional[int], etag: str, body: bytes, gzip_body: bytes, br_body: Optional[bytes],
+                 modified: Optional[int] = None):
+        self.version = version
+        self.etag = etag
+        self.body = body
+        self.gzip = gzip_body
+        self.br = br_body
+        # Whole seconds since the epoch at which the snapshot was stored
+        self.modified = modified
+
+    def variant_etag(self, content: bytes) -> str:
+        """ETag of one encoding of the snapshot, the one nginx derives for its published file"""
+        if self.modified is None:
+            return self.etag
+        # nginx's format: modification time and length in hex
+        return f"{self.modified:x}-{len(content):x}"
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, ValidatorRecord):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(data: Any) -> bytes:
+    # orjson serializes ValidatorRecord dataclasses natively
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(',', ':'), default=_default).encode()
+
+
+def loads(body: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+class SnapshotCodec(NamedTuple):
+    """Serialization of the decodable copy of a snapshot (the `data` column)"""
+    name: str
+    encode: Callable[[Any], bytes]
+    decode: Callable[[bytes], Any]
+
+
+def _msgpack_dumps(data: Any) -> bytes:
+    return msgpack.packb(data, default=_default, use_bin_type=True)
+
+
+def _msgpack_loads(body: bytes) -> Any:
+    return msgpack.unpackb(body, raw=False)
+
+
+# The json codec is the served body: a snapshot stored with it leaves `data` NULL
+JSON_CODEC = SnapshotCodec('json', dumps, loads)
+
+CODECS = {JSON_CODEC.name: JSON_CODEC}
+if msgpack is not None:
+    CODECS['msgpack'] = SnapshotCodec('msgpack', _msgpack_dumps, _msgpack_loads)
+
+
+def get_codec(name: str) -> SnapshotCodec:
+    """The codec called `name`, or json if it is unknown or its package is not installed"""
+    codec = CODECS.get(name)
+    if codec is None:
+        logger.warning(f"Snapshot codec {name!r} is not available, using json")
+        return JSON_CODEC
+    return codec
+
+
+def _compress(body: bytes) -> Tuple[bytes, Optional[bytes]]:
+    return (
+        gzip.compress(body, compresslevel=6, mtime=0),
+        brotli.compress(body, quality=5) if brotli is not None else None
+    )
+
+
+def encode_snapshot(data: Dict[str, Any], version: Optional[int] = None) -> EncodedSnapshot:
+    """Serialize a snapshot and pre-compress it"""
+    body = dumps(data)
+    # Compressing a large snapshot takes long enough to stall an async worker
+    gzip_body, br_body = run_cpu_bound(_compress, body)
+    return EncodedSnapshot(version, hashlib.sha256(body).hexdigest()[:32], body, gzip_body, br_body)
+
+
+def init_snapshot_schema(cur) -> None:
+    """Create the snapshot table and migrate the legacy one if present"""
+    cur.execute("CREATE SEQUENCE IF NOT EXISTS validator_snapshot_version_seq")
+    # Spare room on each page keeps the row's updates HOT
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS validator_snapshot (
+            id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+            version BIGINT NOT NULL,
+            data BYTEA,
+            timestamp TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        ) WITH (fillfactor = 50)
+    """)
+    cur.execute("""
+        ALTER TABLE validator_snapshot
+        ADD COLUMN IF NOT EXISTS etag TEXT,
+        ADD COLUMN IF NOT EXISTS body BYTEA,
+        ADD COLUMN IF NOT EXISTS body_gzip BYTEA,
+        ADD COLUMN IF NOT EXISTS body_br BYTEA,
+        ADD COLUMN IF NOT EXISTS epoch_credits BYTEA,
+        ADD COLUMN IF NOT EXISTS codec TEXT NOT NULL DEFAULT 'json',
+        ADD COLUMN IF NOT EXISTS schema_version SMALLINT NOT NULL DEFAULT 1
+    """)
+    migrate_jsonb_snapshot(cur)
+    # Already compressed: TOAST would only try to compress them again on every write
+    cur.execute("""
+        ALTER TABLE validator_snapshot
+        ALTER COLUMN body_gzip SET STORAGE EXTERNAL,
+        ALTER COLUMN body_br SET STORAGE EXTERNAL
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS validator_snapshot_delta (
+            base_version BIGINT PRIMARY KEY,
+            version BIGINT NOT NULL,
+            etag TEXT NOT NULL,
+            body BYTEA NOT NULL,
+            body_gzip BYTEA NOT NULL,
+            body_br BYTEA
+        )
+    """)
+    cur.execute("""
+        ALTER TABLE validator_snapshot_delta
+        ALTER COLUMN body_gzip SET STORAGE EXTERNAL,
+        ALTER COLUMN body_br SET STORAGE EXTERNAL
+    """)
+    migrate_legacy_snapshot(cur)
+
+
+def migrate_jsonb_snapshot(cur) -> None:
+    """Turn a JSONB `data` column into json-codec bytes"""
+    cur.execute("""
+        SELECT data_type FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'validator_snapshot' AND column_name = 'data'
+    """)
+    row = cur.fetchone()
+    if row is None or row[0] != 'jsonb':
+        return
+    cur.execute("""
+        ALTER TABLE validator_snapshot
+        ALTER COLUMN data TYPE BYTEA USING convert_to(data::text, 'UTF8'),
+        ALTER COLUMN data DROP NOT NULL
+    """)
+    logger.info("Converted validator_snapshot.data from JSONB to BYTEA")
+
+
+def migrate_legacy_snapshot(cur) -> None:
+    """Copy the newest row of `latest_validator_data` over and rename that table out of the way"""
+    cur.execute("""
+        SELECT to_regclass('latest_validator_data') IS NOT NULL,
+               to_regclass('latest_validator_data_legacy') IS NOT NULL
+    """)
+    legacy, renamed = cur.fetchone()
+    if not legacy:
+        return
+    if renamed:
+        logger.warning("Both latest_validator_data and latest_validator_data_legacy exist, not migrating either")
+        return
+    cur.execute("""
+        INSERT INTO validator_snapshot (id, version, data, timestamp)
+        SELECT %s, nextval('validator_snapshot_version_seq'), convert_to(data::text, 'UTF8'), timestamp
+        FROM latest_validator_data
+        ORDER BY timestamp DESC
+        LIMIT 1
+        ON CONFLICT (id) DO NOTHING
+    """, (SNAPSHOT_ID,))
+    migrated = cur.rowcount
+    # Kept for a later release to drop
+    cur.execute("ALTER TABLE latest_validator_data RENAME TO latest_validator_data_legacy")
+    logger.info(f"Migrated {migrated} row(s) from latest_validator_data to validator_snapshot, "
+                f"the old table is now latest_validator_data_legacy")
+
+
+def validators_by_identity(data: Dict[str, Any]) -> Dict[str, Tuple[Any, ...]]:
+    """Each validator's fields as a tuple, keyed by identity"""
+    return {validator['identityPubkey']: record_values(validator) for validator in data.get('validators', [])}
+
+
+def diff_snapshot(base_version: int, base_validators: Dict[str, Tuple[Any, ...]], data: Dict[str, Any]) -> Dict[str, Any]:
+    """Changes from an older snapshot to `data`: changed and removed validators plus new stats"""
+    current = {validator['identityPubkey']: validator for validator in data.get('validators', [])}
+    return {
+        'delta': True,
+        'baseVersion': base_version,
+        'snapshotVersion': data['snapshotVersion'],
+        'changed': [
+            validator for identity, validator in current.items()
+            if base_validators.get(identity) != record_values(validator)
+        ],
+        'removed': [identity for identity in base_validators if identity not in current],
+        'stats': {key: value for key, value in data.items() if key != 'validators'}
+    }
+
+
+class SnapshotLog:
+    """The last few snapshots written by this process, to diff new ones against"""
+
+    def __init__(self, size: int):
+        self.entries = deque(maxlen=size)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def add(self, version: int, data: Dict[str, Any]) -> None:
+        self.entries.append((version, validators_by_identity(data)))
+
+    def encode_deltas(self, data: Dict[str, Any]) -> List[EncodedSnapshot]:
+        """Encode one delta to `data` from every logged version"""
+        return [
+            encode_snapshot(diff_snapshot(base_version, base_validators, data), base_version)
+            for base_version, base_validators in self.entries
+        ]
+
+
+def store_snapshot(conn, data: Dict[str, Any], log: Optional[SnapshotLog] = None,
+                   codec: SnapshotCodec = JSON_CODEC) -> EncodedSnapshot:
+    """Encode and replace the snapshot, storing deltas against `log`; returns it with its new version"""
+    packed_credits = credits.pack(data.get('validators', []))
+    with conn.cursor() as cur:
+        if log is not None and not len(log):
+            # Newly elected leader: the stored snapshot is the first base
+            previous = load_snapshot(conn)
+            if previous:
+                log.add(previous[0], previous[1])
+
+        cur.execute("SELECT nextval('validator_snapshot_version_seq')")
+        version = cur.fetchone()[0]
+        data['snapshotVersion'] = version
+        encoded = encode_snapshot(data, version)
+        payload = None if codec is JSON_CODEC else codec.encode(data)
+        cur.execute("""
+            INSERT INTO validator_snapshot (id, version, data, codec, schema_version, timestamp,
+                                            etag, body, body_gzip, body_br, epoch_credits)
+            VALUES (%s, %s, %s, %s, %s, date_trunc('second', NOW()), %s, %s, %s, %s, %s)
+            ON CONFLICT (id) DO UPDATE
+            SET version = EXCLUDED.version, data = EXCLUDED.data, codec = EXCLUDED.codec,
+                schema_version = EXCLUDED.schema_version,
+                -- A second after the previous one at least, so ETags derived from it stay unique
+                timestamp = GREATEST(EXCLUDED.timestamp,
+                                     date_trunc('second', validator_snapshot.timestamp) + INTERVAL '1 second'),
+                etag = EXCLUDED.etag, body = EXCLUDED.body,
+                body_gzip = EXCLUDED.body_gzip, body_br = EXCLUDED.body_br,
+                epoch_credits = EXCLUDED.epoch_credits
+            RETURNING floor(extract(epoch FROM timestamp))::bigint
+        """, (SNAPSHOT_ID, version, payload, codec.name, SCHEMA_VERSION, encoded.etag, encoded.body, encoded.gzip,
+              encoded.br, packed_credits))
+        encoded.modified = cur.fetchone()[0]
+
+        if log is not None:
+            # Each delta's version field holds its base version
+            deltas = log.encode_deltas(data)
+            for delta in deltas:
+                cur.execute("""
+                    INSERT INTO validator_snapshot_delta (base_version, version, etag, body, body_gzip, body_br)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                    ON CONFLICT (base_version) DO UPDATE
+                    SET version = EXCLUDED.version, etag = EXCLUDED.etag, body = EXCLUDED.body,
+                        body_gzip = EXCLUDED.body_gzip, body_br = EXCLUDED.body_br
+                """, (delta.version, version, delta.etag, delta.body, delta.gzip, delta.br))
+            cur.execute("DELETE FROM validator_snapshot_delta WHERE version <> %s", (version,))
+        # Delivered to listeners on commit, after the deltas are visible
+        cur.execute("SELECT pg_notify(%s, %s)", (NOTIFY_CHANNEL, str(version)))
+    conn.commit()
+    if log is not None:
+        log.add(version, data)
+    return encoded
+
+
+def load_snapshot(conn) -> Optional[Tuple[int, Dict[str, Any], Any]]:
+    """Return (version, data, timestamp) of the snapshot, or None if there is none readable yet"""
+    with conn.cursor() as cur:
+        # A json-codec row has no `data` of its own: the body is the encoding
+        execute_prepared(cur, 'load_snapshot', """
+            SELECT version, COALESCE(data, body), codec, schema_version, timestamp
+            FROM validator_snapshot
+            WHERE id = $1
+        """, (SNAPSHOT_ID,))
+        row = cur.fetchone()
+        if row is None:
+            return None
+        version, payload, codec_name, schema_version, timestamp = row
+        if schema_version > SCHEMA_VERSION:
+            logger.warning(f"Snapshot version {version} has schema version {schema_version}, "
+                           f"newer than the {SCHEMA_VERSION} this release reads")
+            return None
+        codec = CODECS.get(codec_name)
+        if codec is None:
+            # Written by a process with a codec this one lacks; the body holds the same snapshot
+            logger.warning(f"Snapshot codec {codec_name!r} is not available, decoding the JSON body")
+            execute_prepared(cur, 'load_snapshot_body', """
+                SELECT body FROM validator_snapshot WHERE id = $1
+            """, (SNAPSHOT_ID,))
+            payload, codec = cur.fetchone()[0], JSON_CODEC
+    return version, codec.decode(bytes(payload)), timestamp
+
+
+def load_encoded_snapshot(conn, cached: Optional[EncodedSnapshot] = None) -> Optional[EncodedSnapshot]:
+    """Return the pre-encoded snapshot, reusing `cached` while its version is current"""
+    with conn.cursor() as cur:
+        execute_prepared(cur, 'snapshot_version', """
+            SELECT version FROM validator_snapshot WHERE id = $1
+        """, (SNAPSHOT_ID,))
+        row = cur.fetchone()
+        if row is None:
+            return None
+        if cached is not None and cached.version == row[0]:
+            return cached
+
+        execute_prepared(cur, 'load_encoded_snapshot', """
+            SELECT version, etag, body, body_gzip, body_br, floor(extract(epoch FROM timestamp))::bigint
+            FROM validator_snapshot
+            WHERE id = $1
+        """, (SNAPSHOT_ID,))
+        row = cur.fetchone()
+        if row is None:
+            return None
+        version, etag, body, body_gzip, body_br, modified = row
+        if body is None:
+            # Written before snapshots were pre-encoded
+            result = load_snapshot(conn)
+            if not result:
+                return None
+            encoded = encode_snapshot(result[1], result[0])
+            encoded.modified = modified
+            return encoded
+        return EncodedSnapshot(version, etag, bytes(body), bytes(body_gzip), bytes(body_br) if body_br is not None else None,
+                               modified)
+
+
+def load_epoch_credits(conn, cached: Optional[credits.PackedEpochCredits] = None) -> Optional[credits.PackedEpochCredits]:
+    """Return the packed epochCredits of the snapshot, reusing `cached` while its version is current"""
+    with conn.cursor() as cur:
+        execute_prepared(cur, 'snapshot_version', """
+            SELECT version FROM validator_snapshot WHERE id = $1
+        """, (SNAPSHOT_ID,))
+        row = cur.fetchone()
+        if row is None:
+            return None
+        if cached is not None and cached.version == row[0]:
+            return cached
+
+        execute_prepared(cur, 'load_epoch_credits', """
+            SELECT version, epoch_credits FROM validator_snapshot WHERE id = $1
+        """, (SNAPSHOT_ID,))
+        row = cur.fetchone()
+        if row is None or row[1] is None:
+            return None
+        return credits.PackedEpochCredits(bytes(row[1]), row[0])
+
+
+def load_delta(conn, base_version: int, version: int) -> Optional[EncodedSnapshot]:
+    """Return the pre-encoded delta from `base_version` to `version`, if it was kept"""
+    with conn.cursor() as cur:
+        execute_prepared(cur, 'load_snapshot_delta', """
+            SELECT etag, body, body_gzip, body_br
+            FROM validator_snapshot_delta
+            WHERE base_version = $1 AND version = $2
+        """, (base_version, version))
+        row = cur.fetchone()
+    if row is None:
+        return None
+    etag, body, body_gzip, body_br = row
+    return EncodedSnapshot(version, etag, bytes(body), bytes(body_gzip), bytes(body_br) if body_br is not None else None)
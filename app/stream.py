@@ -0,0 +1,104 @@
+"""Server-Sent Events push channel for snapshot updates"""
+
+import logging
+import select
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import psycopg2
+from psycopg2 import extensions
+
+logger = logging.getLogger(__name__)
+
+
+def format_event(event: str, data: str, event_id: Optional[int] = None) -> str:
+    """Frame one SSE message; `data` must not contain newlines"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {data}")
+    return '\n'.join(lines) + '\n\n'
+
+
+class SnapshotBroadcaster:
+    """Wakes the stream clients of this process when LISTEN/NOTIFY announces a new snapshot version"""
+
+    def __init__(self, db_config: Dict[str, Any], channel: str, version_sql: str):
+        self.db_config = db_config
+        self.channel = channel
+        self.version_sql = version_sql
+        self.version: Optional[int] = None
+        self.clients = 0
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._thread_lock = threading.Lock()
+
+    def start(self) -> None:
+        """Start the listener thread unless it is already running"""
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._listen, daemon=True)
+                self._thread.start()
+
+    def add_client(self, max_clients: int) -> bool:
+        with self._condition:
+            if self.clients >= max_clients:
+                return False
+            self.clients += 1
+            return True
+
+    def remove_client(self) -> None:
+        with self._condition:
+            self.clients -= 1
+
+    def publish(self, version: int) -> None:
+        with self._condition:
+            if self.version is None or version > self.version:
+                self.version = version
+                self._condition.notify_all()
+
+    def wait(self, after: Optional[int], timeout: float) -> Optional[int]:
+        """Wait up to `timeout` for a version other than `after`; returns the latest version"""
+        with self._condition:
+            self._condition.wait_for(lambda: self.version is not None and self.version != after, timeout)
+            return self.version
+
+    def _listen(self) -> None:
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(**self.db_config)
+                conn.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {self.channel}")
+                    # Catch up on anything announced while we were not listening
+                    cur.execute(self.version_sql)
+                    row = cur.fetchone()
+                if row:
+                    self.publish(row[0])
+                logger.info(f"Listening for snapshot notifications on '{self.channel}'")
+                self._drain(conn)
+            except Exception as e:
+                logger.error(f"Error in snapshot listener: {e}")
+                time.sleep(5)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+    def _drain(self, conn) -> None:
+        while True:
+            # select() on the socket also yields to other greenlets under gevent
+            if select.select([conn], [], [], 60) == ([], [], []):
+                # Quiet for a while: make sure the connection is still alive
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+                continue
+            conn.poll()
+            while conn.notifies:
+                notify = conn.notifies.pop(0)
+                try:
+                    self.publish(int(notify.payload))
+                except ValueError:
+                    logger.warning(f"Ignoring snapshot notification with payload '{notify.payload}'")
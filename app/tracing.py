@@ -0,0 +1,238 @@
+"""Per-stage timings and on-demand profiling of the refresh cycle"""
+
+import cProfile
+import json
+import logging
+import os
+import pstats
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+# Traces waiting to be written by `store_traces`; bounded while the database is down
+_finished: 'deque[Dict[str, Any]]' = deque(maxlen=100)
+
+
+class CycleTrace:
+    """Spans of one refresh cycle; offsets are seconds since the cycle started"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.time()
+        self.spans: List[Dict[str, Any]] = []
+        self._stack: List[str] = []
+        self._lock = threading.Lock()
+        # cProfile only sees its own thread: while profiling, work handed to other threads adds its profiles here
+        self.thread_profiles: Optional[List[cProfile.Profile]] = None
+
+    def add(self, name: str, started: float, duration: float, parent: Optional[str] = None, **attributes: Any) -> None:
+        span = {
+            'name': name,
+            'parent': parent,
+            'offset': round(started - self.started, 6),
+            'duration': round(duration, 6)
+        }
+        span.update(attributes)
+        with self._lock:
+            self.spans.append(span)
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        parent = self._stack[-1] if self._stack else None
+        self._stack.append(name)
+        started = time.time()
+        try:
+            yield
+        finally:
+            self._stack.pop()
+            self.add(name, started, time.time() - started, parent)
+
+    def to_dict(self, status: str) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'started': datetime.fromtimestamp(self.started, timezone.utc).isoformat(),
+            'duration': round(time.time() - self.started, 6),
+            'status': status,
+            'spans': sorted(self.spans, key=lambda span: span['offset'])
+        }
+
+
+def current() -> Optional[CycleTrace]:
+    return getattr(_local, 'trace', None)
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Record a stage of the cycle running in this thread; a no-op outside one"""
+    trace = current()
+    if trace is None:
+        yield
+        return
+    with trace.span(name):
+        yield
+
+
+def record_fanout(result: Any, parent: Optional[str] = None) -> None:
+    """Record the calls of a FanOutResult, which ran on other threads"""
+    trace = current()
+    if trace is None:
+        return
+    parent = parent or (trace._stack[-1] if trace._stack else None)
+    for name, duration in result.durations.items():
+        error = result.errors.get(name)
+        trace.add(name, result.started, duration, parent, **({'error': error} if error else {}))
+
+
+def _profile_path(extension: str) -> str:
+    os.makedirs(Config.PROFILE_DIR, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    return os.path.join(Config.PROFILE_DIR, f"refresh-{stamp}-{os.getpid()}.{extension}")
+
+
+@contextmanager
+def _profiled() -> Iterator[None]:
+    if Config.PROFILER == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            logger.error("PROFILER is pyinstrument but the pyinstrument package is not installed")
+        else:
+            profiler = Profiler()
+            profiler.start()
+            try:
+                yield
+            finally:
+                profiler.stop()
+                path = _profile_path('html')
+                with open(path, 'w') as f:
+                    f.write(profiler.output_html())
+                logger.info(f"Refresh profile written to {path}")
+            return
+
+    trace = current()
+    trace.thread_profiles = []
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        with trace._lock:
+            thread_profiles, trace.thread_profiles = trace.thread_profiles, None
+        stats = pstats.Stats(profiler)
+        for thread_profile in thread_profiles:
+            stats.add(thread_profile)
+        path = _profile_path('prof')
+        stats.dump_stats(path)
+        logger.info(f"Refresh profile written to {path} with {len(thread_profiles)} fan-out call(s) (load with pstats)")
+
+
+def profiled(func: Callable[[], Any]) -> Callable[[], Any]:
+    """Wrap `func`, to be run on another thread, so it is profiled with the cycle of this one"""
+    trace = current()
+    if trace is None or trace.thread_profiles is None:
+        return func
+
+    def run() -> Any:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Python 3.12+ allows one active cProfile per process
+            return func()
+        try:
+            return func()
+        finally:
+            profiler.disable()
+            with trace._lock:
+                # Finished after the cycle's profile was written: too late to add
+                if trace.thread_profiles is not None:
+                    trace.thread_profiles.append(profiler)
+    return run
+
+
+@contextmanager
+def trace_cycle(name: str, profile: bool = False) -> Iterator[CycleTrace]:
+    """Trace the cycle run in the block, profiling it if asked to or sampled"""
+    trace = CycleTrace(name)
+    _local.trace = trace
+    profile = profile or random.random() < Config.PROFILE_SAMPLE_RATE
+    status = 'failed'
+    try:
+        if profile:
+            with _profiled():
+                yield trace
+        else:
+            yield trace
+        status = 'ok'
+    finally:
+        _local.trace = None
+        _finished.append(trace.to_dict(status))
+
+
+def init_trace_schema(cur) -> None:
+    cur.execute("CREATE SEQUENCE IF NOT EXISTS refresh_trace_seq")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS refresh_trace (
+            slot INTEGER PRIMARY KEY,
+            seq BIGINT NOT NULL,
+            trace JSONB NOT NULL
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS refresh_profile_request (
+            id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+            requested_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        )
+    """)
+
+
+def store_traces(conn, history: int) -> None:
+    """Write finished traces into the ring of `history` rows"""
+    while _finished:
+        trace = _finished.popleft()
+        with conn.cursor() as cur:
+            cur.execute("SELECT nextval('refresh_trace_seq')")
+            seq = cur.fetchone()[0]
+            # Overwrite the oldest slot instead of inserting and deleting
+            cur.execute("""
+                INSERT INTO refresh_trace (slot, seq, trace) VALUES (%s, %s, %s)
+                ON CONFLICT (slot) DO UPDATE SET seq = EXCLUDED.seq, trace = EXCLUDED.trace
+            """, (seq % history, seq, json.dumps(trace)))
+        conn.commit()
+
+
+def load_traces(conn, limit: int) -> List[Dict[str, Any]]:
+    """The most recent traces, newest first"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT trace FROM refresh_trace ORDER BY seq DESC LIMIT %s", (limit,))
+        return [row[0] for row in cur.fetchall()]
+
+
+def request_profile(conn) -> None:
+    """Ask the refresh leader to profile its next cycle"""
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO refresh_profile_request (id, requested_at) VALUES (1, NOW())
+            ON CONFLICT (id) DO UPDATE SET requested_at = EXCLUDED.requested_at
+        """)
+    conn.commit()
+
+
+def take_profile_request(conn) -> bool:
+    """Claim a pending profile request, if there is one"""
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM refresh_profile_request RETURNING requested_at")
+        claimed = cur.fetchone() is not None
+    conn.commit()
+    return claimed
@@ -0,0 +1,92 @@
+"""`/api/nodes` throughput under concurrent clients, from memory and from Postgres"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+from werkzeug.serving import make_server
+
+from benchmarks.conftest import app_module
+from app import snapshot
+
+REQUESTS = int(os.environ.get('BENCH_REQUESTS', '200'))
+CONCURRENCY = int(os.environ.get('BENCH_CONCURRENCY', '16'))
+
+ACCEPT_ENCODINGS = {'identity': 'identity', 'gzip': 'gzip', 'br': 'br, gzip'}
+
+
+@pytest.fixture(scope='module')
+def base_url():
+    server = make_server('127.0.0.1', 0, app_module.app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+@pytest.fixture(scope='module')
+def client_pool():
+    local = threading.local()
+
+    def session() -> requests.Session:
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        return local.session
+
+    with ThreadPoolExecutor(CONCURRENCY) as pool:
+        yield pool, session
+
+
+@pytest.fixture(params=['memory', 'postgres'])
+def served(request, monkeypatch, snapshot_data):
+    """The encoded snapshot /api/nodes serves, from memory or from the database"""
+    if request.param == 'postgres':
+        request.getfixturevalue('postgres')
+        encoded = app_module.store_latest_data(dict(snapshot_data))
+        assert encoded is not None
+        return encoded
+    encoded = snapshot.encode_snapshot(snapshot_data, 1)
+    monkeypatch.setattr(app_module, 'get_encoded_snapshot', lambda: encoded)
+    return encoded
+
+
+def _load(benchmark, base_url, client_pool, headers, expected_status):
+    pool, session = client_pool
+    url = f"{base_url}/api/nodes"
+
+    def fetch(_):
+        response = session().get(url, headers=headers, stream=True)
+        body = response.raw.read()
+        return response.status_code, len(body)
+
+    elapsed = []
+
+    def run():
+        started = time.perf_counter()
+        results = list(pool.map(fetch, range(REQUESTS)))
+        elapsed.append(time.perf_counter() - started)
+        return results
+
+    results = benchmark.pedantic(run, rounds=5, warmup_rounds=1)
+    assert all(status == expected_status for status, _ in results)
+    benchmark.extra_info.update(
+        requests=REQUESTS,
+        concurrency=CONCURRENCY,
+        response_bytes=results[0][1],
+        requests_per_second=round(REQUESTS * len(elapsed) / sum(elapsed), 1)
+    )
+
+
+@pytest.mark.parametrize('encoding', list(ACCEPT_ENCODINGS))
+def bench_nodes(benchmark, base_url, client_pool, served, encoding):
+    _load(benchmark, base_url, client_pool, {'Accept-Encoding': ACCEPT_ENCODINGS[encoding]}, 200)
+
+
+def bench_nodes_not_modified(benchmark, base_url, client_pool, served):
+    """Clients revalidating a snapshot they already have"""
+    # ETags are per encoding: revalidate the gzip variant most clients hold
+    headers = {'Accept-Encoding': 'gzip', 'If-None-Match': f'"{served.variant_etag(served.gzip)}"'}
+    _load(benchmark, base_url, client_pool, headers, 304)
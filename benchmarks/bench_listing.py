@@ -0,0 +1,41 @@
+"""`/api/validators/page` pages served from the per-snapshot sort index"""
+
+import pytest
+
+from app import listing, snapshot
+
+
+@pytest.fixture
+def decoded(snapshot_data):
+    """The snapshot as workers decode it from storage"""
+    return snapshot.loads(snapshot.dumps(snapshot_data))
+
+
+@pytest.fixture
+def index(decoded):
+    index = listing.ValidatorIndex(decoded)
+    index.order('apr')
+    return index
+
+
+def bench_build_order(benchmark, decoded):
+    """First request for a sort field after a new snapshot"""
+    benchmark(lambda: listing.ValidatorIndex(decoded).order('apr'))
+
+
+@pytest.mark.parametrize('filtered', [False, True])
+def bench_page(benchmark, index, filtered):
+    """One 50-row page from a warm index, the way most requests run"""
+    def page():
+        mask_key, mask = index.mask(delinquent=False, min_stake=1) if filtered else ((), None)
+        return index.page('apr', True, mask_key, mask, 50)
+
+    validators, total, cursor = benchmark(page)
+    assert len(validators) == 50 and cursor
+
+
+def bench_page_after_cursor(benchmark, index):
+    mask_key, mask = index.mask()
+    validators, _, cursor = index.page('apr', True, mask_key, mask, 50)
+    after = listing.decode_cursor(cursor)
+    benchmark(index.page, 'apr', True, mask_key, mask, 50, 0, after)
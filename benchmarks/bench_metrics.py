@@ -0,0 +1,42 @@
+"""Per-validator metrics: the columnar pass and the per-validator wrapper"""
+
+from benchmarks.conftest import app_module, fixture_for
+from app.metrics import ValidatorColumns
+
+NETWORK_APR = 7.5
+
+
+def _inputs(scale):
+    fixture = fixture_for(scale)
+    accounts = fixture['getVoteAccounts']
+    return accounts['current'], accounts['delinquent'], fixture['getBlockProduction']['value']['byIdentity']
+
+
+def bench_validator_columns(benchmark, scale):
+    current, delinquent, block_production = _inputs(scale)
+    columns = benchmark(ValidatorColumns, current, delinquent, block_production)
+    assert len(columns) == scale
+
+
+def bench_records_and_version_stats(benchmark, scale):
+    current, delinquent, block_production = _inputs(scale)
+    columns = ValidatorColumns(current, delinquent, block_production)
+
+    def run():
+        apr = columns.apr(NETWORK_APR)
+        return columns.records(apr), columns.version_stats(apr)
+
+    records, _ = benchmark(run)
+    assert len(records) == scale
+
+
+def bench_calculate_validator_metrics(benchmark, scale):
+    """One call per validator, as callers outside the refresh use it"""
+    current, delinquent, block_production = _inputs(scale)
+    validators = current + delinquent
+
+    def run():
+        return [app_module.calculate_validator_metrics(v, block_production, NETWORK_APR) for v in validators]
+
+    results = benchmark.pedantic(run, rounds=5, warmup_rounds=1)
+    assert len(results) == scale
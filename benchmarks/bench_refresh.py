@@ -0,0 +1,23 @@
+"""A refresh cycle end to end against the fixture RPC server"""
+
+from benchmarks.conftest import app_module, reset_refresh_state, rpc_server
+
+
+def bench_refresh(benchmark, scale):
+    """A steady-state cycle: vote accounts and epoch info due, everything else still fresh"""
+
+    def run():
+        app_module.source_schedule.expire('voteAccounts', 'rpcEpochInfo')
+        return app_module.build_snapshot()
+
+    app_module.build_snapshot()
+    requests_before = rpc_server.requests
+    data = benchmark.pedantic(run, rounds=5, warmup_rounds=1)
+    assert data is not None and len(data['validators']) == scale
+    benchmark.extra_info['rpc_requests_per_round'] = (rpc_server.requests - requests_before) / 6
+
+
+def bench_refresh_cold(benchmark, scale):
+    """A refresh right after start: every source, the whole epoch of block production"""
+    data = benchmark.pedantic(app_module.build_snapshot, setup=reset_refresh_state, rounds=5)
+    assert data is not None and len(data['validators']) == scale
@@ -0,0 +1,140 @@
+"""Snapshot serialization, deltas and storage"""
+
+import dataclasses
+import json
+
+import pytest
+
+from benchmarks.conftest import app_module
+from app import snapshot
+
+
+@pytest.mark.parametrize('serializer', ['json', 'snapshot'])
+def bench_dumps(benchmark, snapshot_data, serializer):
+    """The standard library against `snapshot.dumps` (orjson when installed)"""
+    if serializer == 'json':
+        dumps = lambda data: json.dumps(data, separators=(",", ":"), default=lambda record: record.to_dict()).encode()  # noqa: E731
+    else:
+        dumps = snapshot.dumps
+    body = benchmark(dumps, snapshot_data)
+    benchmark.extra_info['bytes'] = len(body)
+
+
+def bench_encode_snapshot(benchmark, snapshot_data):
+    """Serialization plus the gzip and brotli variants stored with every snapshot"""
+    encoded = benchmark.pedantic(snapshot.encode_snapshot, args=(snapshot_data, 1), rounds=5, warmup_rounds=1)
+    benchmark.extra_info.update(bytes=len(encoded.body), gzip_bytes=len(encoded.gzip),
+                                br_bytes=len(encoded.br) if encoded.br is not None else None)
+
+
+def bench_encode_deltas(benchmark, snapshot_data):
+    """Deltas to a snapshot in which every tenth validator voted again"""
+    log = snapshot.SnapshotLog(1)
+    log.add(1, snapshot_data)
+    validators = [
+        dataclasses.replace(validator, lastVote=validator.lastVote + 1) if i % 10 == 0 else validator
+        for i, validator in enumerate(snapshot_data['validators'])
+    ]
+    next_data = dict(snapshot_data, validators=validators, snapshotVersion=2)
+    (delta,) = benchmark(log.encode_deltas, next_data)
+    benchmark.extra_info['bytes'] = len(delta.body)
+
+
+def bench_store_snapshot(benchmark, postgres, snapshot_data):
+    encoded = benchmark.pedantic(app_module.store_latest_data, args=(dict(snapshot_data),), rounds=5, warmup_rounds=1)
+    assert encoded is not None
+
+
+def bench_load_snapshot(benchmark, postgres, snapshot_data):
+    """Reading and decoding the stored snapshot, as the non-encoded readers do"""
+    app_module.store_latest_data(dict(snapshot_data))
+    data = benchmark.pedantic(app_module.get_latest_data, rounds=5, warmup_rounds=1)
+    assert data is not None and len(data['validators']) == len(snapshot_data['validators'])
+
+
+# The snapshot codecs, and 'jsonb': the snapshot as the JSONB column it used to be stored in
+CODECS = ['jsonb'] + sorted(snapshot.CODECS)
+
+
+@pytest.fixture(params=CODECS)
+def codec(request, monkeypatch) -> str:
+    """Stores snapshots with the codec (jsonb: in a scratch table with the old JSONB column)"""
+    if request.param != 'jsonb':
+        monkeypatch.setattr(app_module, 'snapshot_codec', snapshot.CODECS[request.param])
+    return request.param
+
+
+@pytest.fixture
+def jsonb_table(postgres):
+    with app_module.get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("CREATE TABLE IF NOT EXISTS bench_snapshot_jsonb (id SMALLINT PRIMARY KEY, data JSONB NOT NULL)")
+        conn.commit()
+    yield 'bench_snapshot_jsonb'
+    with app_module.get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DROP TABLE bench_snapshot_jsonb")
+        conn.commit()
+
+
+def _store_jsonb(data):
+    # The old write: the JSON text sent once more for Postgres to parse into JSONB
+    with app_module.get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO bench_snapshot_jsonb (id, data) VALUES (1, %s::jsonb)
+                ON CONFLICT (id) DO UPDATE SET data = EXCLUDED.data
+            """, (snapshot.dumps(data).decode(),))
+        conn.commit()
+
+
+def _load_jsonb():
+    # The old read: JSONB rendered as text by Postgres and parsed by psycopg2
+    with app_module.get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT data FROM bench_snapshot_jsonb WHERE id = 1")
+            return cur.fetchone()[0]
+
+
+def bench_codec_encode(benchmark, snapshot_data, codec):
+    """Encoding the decodable copy on top of the served body (jsonb: the JSON text sent for Postgres to parse)"""
+    if codec == 'json':
+        pytest.skip("the json copy is the served body: nothing more to encode")
+    if codec == 'jsonb':
+        body = benchmark(lambda data: snapshot.dumps(data).decode(), snapshot_data)
+    else:
+        body = benchmark(snapshot.CODECS[codec].encode, snapshot_data)
+    benchmark.extra_info['bytes'] = len(body)
+
+
+def bench_codec_decode(benchmark, snapshot_data, codec):
+    """Decoding the copy in-process (jsonb: the standard library parse psycopg2 does)"""
+    if codec == 'jsonb':
+        body, decode = snapshot.dumps(snapshot_data).decode(), json.loads
+    else:
+        body, decode = snapshot.CODECS[codec].encode(snapshot_data), snapshot.CODECS[codec].decode
+    data = benchmark(decode, body)
+    assert len(data['validators']) == len(snapshot_data['validators'])
+
+
+def bench_codec_store(benchmark, postgres, jsonb_table, snapshot_data, codec):
+    """Storing a snapshot; jsonb adds the JSONB column the row used to carry"""
+    def store(data):
+        encoded = app_module.store_latest_data(dict(data))
+        if codec == 'jsonb':
+            _store_jsonb(data)
+        return encoded
+
+    assert benchmark.pedantic(store, args=(snapshot_data,), rounds=5, warmup_rounds=1) is not None
+
+
+def bench_codec_load(benchmark, postgres, jsonb_table, snapshot_data, codec):
+    """Reading and decoding the stored snapshot"""
+    if codec == 'jsonb':
+        _store_jsonb(snapshot_data)
+        load = _load_jsonb
+    else:
+        app_module.store_latest_data(dict(snapshot_data))
+        load = app_module.get_latest_data
+    data = benchmark.pedantic(load, rounds=5, warmup_rounds=1)
+    assert data is not None and len(data['validators']) == len(snapshot_data['validators'])
@@ -0,0 +1,120 @@
+"""Shared setup of the benchmark suites"""
+
+import functools
+import hashlib
+import os
+import sys
+import tempfile
+from typing import Any, Dict, List, Optional
+
+import pytest
+
+from benchmarks import fixtures
+from benchmarks.rpc_server import FixtureRpcServer
+
+SCALES = [int(count) for count in os.environ.get('BENCH_SCALES', '100,1000,10000').split(',')]
+
+
+@functools.lru_cache(maxsize=None)
+def fixture_for(count: int) -> fixtures.Fixture:
+    recording = os.environ.get('BENCH_RECORDING')
+    if recording:
+        return fixtures.scale(fixtures.load(recording), count)
+    return fixtures.synthetic(count)
+
+
+rpc_server = FixtureRpcServer(fixture_for(SCALES[0]), float(os.environ.get('BENCH_RPC_LATENCY', '0'))).start()
+_workdir = tempfile.mkdtemp(prefix='koii-validators-bench-')
+
+os.environ.update({
+    'KOII_RPC_URL': rpc_server.url,
+    'BACKGROUND_REFRESH': 'false',
+    'GEO_PROVIDERS': '',
+    'GEO_CACHE_PATH': os.path.join(_workdir, 'geo_cache.sqlite3'),
+    'PROFILE_SAMPLE_RATE': '0'
+})
+os.environ.pop('PROMETHEUS_MULTIPROC_DIR', None)
+
+import app.app  # noqa: E402  (needs the environment above)
+from app.geo import GeoCache, GeoLocator, GeoProvider, Location  # noqa: E402
+from app.rpc import RpcEndpoint  # noqa: E402
+
+# `app.app` is shadowed by the Flask object re-exported from the package
+app_module = sys.modules['app.app']
+# The app may already have been imported against another server (e.g. by the tests' conftest)
+app_module.rpc_client.endpoints = [RpcEndpoint(rpc_server.url)]
+
+CITIES = [
+    ('Frankfurt', 'Germany', 50.11, 8.68),
+    ('Ashburn', 'United States', 39.04, -77.49),
+    ('Tokyo', 'Japan', 35.68, 139.69),
+    ('Singapore', 'Singapore', 1.35, 103.82),
+    ('Amsterdam', 'Netherlands', 52.37, 4.90)
+]
+
+
+class StubGeoProvider(GeoProvider):
+    """Resolves every IP to one of a few cities, derived from the IP"""
+
+    name = 'stub'
+
+    def lookup(self, ips: List[str]) -> Dict[str, Optional[Location]]:
+        locations: Dict[str, Optional[Location]] = {}
+        for ip in ips:
+            city, country, latitude, longitude = CITIES[hashlib.md5(ip.encode()).digest()[0] % len(CITIES)]
+            locations[ip] = {'latitude': latitude, 'longitude': longitude, 'city': city, 'country': country}
+        return locations
+
+
+app_module.geo_locator = GeoLocator(GeoCache(os.environ['GEO_CACHE_PATH'], 3600, 100_000), [StubGeoProvider()])
+
+
+def reset_refresh_state() -> None:
+    """Forget what earlier refreshes cached so the next one sees the current fixture"""
+    app_module.validator_info_cache.invalidate()
+    app_module.cluster_nodes_cache.invalidate()
+    app_module.source_schedule.reset()
+    app_module.block_production_tracker.epoch = None
+    app_module.epoch_rewards = None
+
+
+@pytest.fixture(params=SCALES, ids=lambda count: f"{count}v")
+def scale(request) -> int:
+    """Validator count of the fixture the RPC server replays"""
+    rpc_server.load(fixture_for(request.param))
+    reset_refresh_state()
+    return request.param
+
+
+@functools.lru_cache(maxsize=None)
+def _snapshot_for(count: int) -> Dict[str, Any]:
+    rpc_server.load(fixture_for(count))
+    reset_refresh_state()
+    data = app_module.build_snapshot()
+    assert data is not None, "refresh against the fixture server failed"
+    data['koiiPrice'] = 0.01
+    return data
+
+
+@pytest.fixture
+def snapshot_data(scale) -> Dict[str, Any]:
+    """A complete /api/nodes snapshot of `scale` validators (shared, do not modify)"""
+    return _snapshot_for(scale)
+
+
+def _postgres_available() -> bool:
+    import psycopg2
+
+    try:
+        psycopg2.connect(connect_timeout=2, **app_module.DB_CONFIG).close()
+    except psycopg2.Error:
+        return False
+    return True
+
+
+@pytest.fixture(scope='session')
+def postgres() -> None:
+    """Skip unless the database configured by DB_* is reachable"""
+    if not _postgres_available():
+        pytest.skip("Postgres is not reachable with the DB_* settings")
+    app_module.init_db()
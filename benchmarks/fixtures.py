@@ -0,0 +1,162 @@
+"""RPC fixtures for the benchmarks, recorded or synthetic, at any validator count"""
+
+import json
+import random
+from typing import Any, Dict, List, Optional
+
+BASE58_ALPHABET = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+
+VERSIONS = ['1.16.6', '1.16.7', '1.16.8', '1.17.0']
+
+Fixture = Dict[str, Any]
+
+
+def _pubkey(rng: random.Random) -> str:
+    return ''.join(rng.choice(BASE58_ALPHABET) for _ in range(44))
+
+
+def _clone_pubkey(pubkey: str, copy: int) -> str:
+    """A distinct pubkey for the `copy`-th clone of `pubkey`"""
+    suffix = ''
+    while copy:
+        copy, digit = divmod(copy, len(BASE58_ALPHABET))
+        suffix = BASE58_ALPHABET[digit] + suffix
+    return pubkey[:len(pubkey) - len(suffix) - 1] + '0' + suffix if suffix else pubkey
+
+
+def synthetic(count: int, seed: int = 7, delinquent_share: float = 0.05) -> Fixture:
+    """Responses of a cluster with `count` validators"""
+    rng = random.Random(seed)
+    slots_per_epoch = 432000
+    epoch = 420
+    slot_index = slots_per_epoch // 2
+    first_slot = epoch * slots_per_epoch
+
+    current: List[Dict[str, Any]] = []
+    delinquent: List[Dict[str, Any]] = []
+    nodes: List[Dict[str, Any]] = []
+    by_identity: Dict[str, List[int]] = {}
+    rewards: Dict[str, Optional[Dict[str, Any]]] = {}
+    stakes = [int(rng.paretovariate(1.2) * 1e13) for _ in range(count)]
+    total_stake = sum(stakes)
+
+    for i, stake in enumerate(stakes):
+        identity = _pubkey(rng)
+        vote_pubkey = _pubkey(rng)
+        credits = rng.randint(10_000_000, 50_000_000)
+        account = {
+            'votePubkey': vote_pubkey,
+            'nodePubkey': identity,
+            'activatedStake': stake,
+            'epochVoteAccount': True,
+            'commission': rng.choice([0, 5, 7, 10, 100]),
+            'lastVote': first_slot + slot_index - rng.randint(0, 64),
+            'rootSlot': first_slot + slot_index - rng.randint(32, 128),
+            'credits': credits,
+            'epochCredits': [
+                [epoch - back, credits - back * 400_000, credits - (back + 1) * 400_000]
+                for back in range(4, -1, -1)
+            ],
+            'version': rng.choice(VERSIONS)
+        }
+        (delinquent if rng.random() < delinquent_share else current).append(account)
+        nodes.append({
+            'pubkey': identity,
+            'gossip': f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}:8001",
+            'version': account['version']
+        })
+        leader_slots = round(slot_index * stake / total_stake)
+        if leader_slots:
+            by_identity[identity] = [leader_slots, leader_slots - rng.randint(0, leader_slots // 10)]
+        rewards[vote_pubkey] = {
+            'epoch': epoch - 1,
+            'effectiveSlot': first_slot,
+            # Vote accounts are paid their commission on the epoch's stake rewards
+            'amount': stake // 2000 * account['commission'] // 100,
+            'postBalance': stake,
+            'commission': account['commission']
+        }
+
+    return {
+        'getVoteAccounts': {'current': current, 'delinquent': delinquent},
+        'getClusterNodes': nodes,
+        'getEpochInfo': {
+            'epoch': epoch,
+            'slotIndex': slot_index,
+            'slotsInEpoch': slots_per_epoch,
+            'absoluteSlot': first_slot + slot_index,
+            'blockHeight': first_slot + slot_index - 1000,
+            'transactionCount': 10 ** 9
+        },
+        'getEpochSchedule': {
+            'slotsPerEpoch': slots_per_epoch,
+            'leaderScheduleSlotOffset': slots_per_epoch,
+            'warmup': False,
+            'firstNormalEpoch': 0,
+            'firstNormalSlot': 0
+        },
+        'getInflationRate': {'total': 0.05, 'validator': 0.05, 'foundation': 0.0, 'epoch': epoch},
+        'getSupply': {'context': {'slot': first_slot + slot_index}, 'value': {
+            'total': total_stake * 2, 'circulating': total_stake, 'nonCirculating': total_stake,
+            'nonCirculatingAccounts': []
+        }},
+        'getBlockProduction': {'context': {'slot': first_slot + slot_index}, 'value': {
+            'byIdentity': by_identity,
+            'range': {'firstSlot': first_slot, 'lastSlot': first_slot + slot_index}
+        }},
+        'getInflationReward': rewards
+    }
+
+
+def scale(fixture: Fixture, count: int) -> Fixture:
+    """`fixture` with its validators cloned or truncated to `count`"""
+    accounts = fixture['getVoteAccounts']
+    originals = [(account, False) for account in accounts['current']] + \
+                [(account, True) for account in accounts['delinquent']]
+    if not originals:
+        raise ValueError("fixture has no vote accounts")
+    nodes = {node['pubkey']: node for node in fixture['getClusterNodes']}
+    production = fixture['getBlockProduction']['value']['byIdentity']
+    rewards = fixture['getInflationReward']
+
+    current: List[Dict[str, Any]] = []
+    delinquent: List[Dict[str, Any]] = []
+    cluster_nodes: List[Dict[str, Any]] = []
+    by_identity: Dict[str, List[int]] = {}
+    scaled_rewards: Dict[str, Any] = {}
+    for i in range(count):
+        account, is_delinquent = originals[i % len(originals)]
+        copy = i // len(originals)
+        identity = _clone_pubkey(account['nodePubkey'], copy)
+        vote_pubkey = _clone_pubkey(account['votePubkey'], copy)
+        (delinquent if is_delinquent else current).append(dict(account, nodePubkey=identity, votePubkey=vote_pubkey))
+        node = nodes.get(account['nodePubkey'])
+        if node is not None:
+            # Give every clone its own address so geolocation sees distinct IPs
+            gossip = node.get('gossip') or '0.0.0.0:8001'
+            if copy:
+                gossip = f"10.{copy & 255}.{i >> 8 & 255}.{i & 255}:{gossip.rsplit(':', 1)[-1]}"
+            cluster_nodes.append(dict(node, pubkey=identity, gossip=gossip))
+        if account['nodePubkey'] in production:
+            by_identity[identity] = list(production[account['nodePubkey']])
+        scaled_rewards[vote_pubkey] = rewards.get(account['votePubkey'])
+
+    scaled = dict(fixture)
+    scaled['getVoteAccounts'] = {'current': current, 'delinquent': delinquent}
+    scaled['getClusterNodes'] = cluster_nodes
+    scaled['getBlockProduction'] = {
+        'context': fixture['getBlockProduction'].get('context', {}),
+        'value': dict(fixture['getBlockProduction']['value'], byIdentity=by_identity)
+    }
+    scaled['getInflationReward'] = scaled_rewards
+    return scaled
+
+
+def load(path: str) -> Fixture:
+    with open(path) as f:
+        return json.load(f)
+
+
+def save(fixture: Fixture, path: str) -> None:
+    with open(path, 'w') as f:
+        json.dump(fixture, f)
@@ -0,0 +1,59 @@
+"""Record an RPC fixture from a live endpoint"""
+
+import argparse
+import logging
+import os
+from typing import Any, Dict
+
+# Importing the app must not start a refresh of its own
+os.environ.setdefault('BACKGROUND_REFRESH', 'false')
+
+from app.rpc import KoiiRpcClient
+
+from . import fixtures
+
+logger = logging.getLogger(__name__)
+
+REWARDS_CHUNK = 500
+
+
+def record(client: KoiiRpcClient) -> fixtures.Fixture:
+    calls = {
+        'getVoteAccounts': [{"commitment": "confirmed"}],
+        'getClusterNodes': [],
+        'getEpochInfo': [],
+        'getEpochSchedule': [],
+        'getInflationRate': [],
+        'getSupply': [{"commitment": "finalized"}]
+    }
+    fixture: Dict[str, Any] = {method: client.call(method, params) for method, params in calls.items()}
+    fixture['getBlockProduction'] = client.call("getBlockProduction")
+
+    accounts = fixture['getVoteAccounts']['current'] + fixture['getVoteAccounts']['delinquent']
+    vote_pubkeys = [account['votePubkey'] for account in accounts]
+    epoch = fixture['getEpochInfo']['epoch'] - 1
+    rewards: Dict[str, Any] = {}
+    for i in range(0, len(vote_pubkeys), REWARDS_CHUNK):
+        chunk = vote_pubkeys[i:i + REWARDS_CHUNK]
+        result = client.call("getInflationReward", [chunk, {"epoch": epoch}], timeout=60)
+        rewards.update(zip(chunk, result))
+    fixture['getInflationReward'] = rewards
+    return fixture
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Record the RPC responses of a refresh cycle")
+    parser.add_argument('--url', required=True, help="Koii JSON-RPC endpoint")
+    parser.add_argument('-o', '--output', required=True)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    fixture = record(KoiiRpcClient(args.url, timeout=30))
+    fixtures.save(fixture, args.output)
+    accounts = fixture['getVoteAccounts']
+    logger.info(f"Recorded {len(accounts['current'])} current and {len(accounts['delinquent'])} "
+                f"delinquent validators to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""Local stand-in for the Koii JSON-RPC endpoint"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+from .fixtures import Fixture
+
+SLOT_SECONDS = 0.4
+
+
+class FixtureRpcServer:
+    def __init__(self, fixture: Fixture, latency: float = 0.0, host: str = '127.0.0.1', port: int = 0):
+        self.latency = latency
+        self.requests = 0
+        self.load(fixture)
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def load(self, fixture: Fixture) -> None:
+        """Replay `fixture` from now on; the epoch restarts at its recorded slot"""
+        production = fixture['getBlockProduction']['value']
+        covered = production['range']['lastSlot'] - production['range']['firstSlot'] + 1
+        # Leader slots per slot and the share of them produced, per identity
+        self._rates: List[Tuple[str, float, float]] = [
+            (identity, leader / covered, produced / leader)
+            for identity, (leader, produced) in production['byIdentity'].items() if leader
+        ]
+        self.fixture = fixture
+        self._loaded_at = time.time()
+
+    def epoch_info(self) -> Dict[str, Any]:
+        recorded = self.fixture['getEpochInfo']
+        elapsed = int((time.time() - self._loaded_at) / SLOT_SECONDS)
+        slot_index = min(recorded['slotIndex'] + elapsed, recorded['slotsInEpoch'] - 1)
+        advanced = slot_index - recorded['slotIndex']
+        return dict(recorded, slotIndex=slot_index, absoluteSlot=recorded['absoluteSlot'] + advanced,
+                    blockHeight=recorded.get('blockHeight', 0) + advanced)
+
+    def block_production(self, first_slot: int, last_slot: int) -> Dict[str, Any]:
+        slots = last_slot - first_slot + 1
+        by_identity = {}
+        for identity, rate, produced_share in self._rates:
+            leader = round(rate * slots)
+            if leader:
+                by_identity[identity] = [leader, round(leader * produced_share)]
+        return {
+            'context': {'slot': last_slot},
+            'value': {'byIdentity': by_identity, 'range': {'firstSlot': first_slot, 'lastSlot': last_slot}}
+        }
+
+    def result(self, method: str, params: List[Any]) -> Any:
+        if method == 'getEpochInfo':
+            return self.epoch_info()
+        if method == 'getSlot':
+            return self.epoch_info()['absoluteSlot']
+        if method == 'getBlockProduction':
+            slot_range = (params[0] if params else {}).get('range')
+            if slot_range:
+                return self.block_production(slot_range['firstSlot'], slot_range.get('lastSlot', slot_range['firstSlot']))
+            info = self.epoch_info()
+            return self.block_production(info['absoluteSlot'] - info['slotIndex'], info['absoluteSlot'])
+        if method == 'getInflationReward':
+            rewards = self.fixture['getInflationReward']
+            return [rewards.get(address) for address in params[0]]
+        if method in self.fixture:
+            return self.fixture[method]
+        raise KeyError(method)
+
+    def respond(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            result = self.result(request['method'], request.get('params') or [])
+        except KeyError:
+            return {'jsonrpc': '2.0', 'id': request.get('id'),
+                    'error': {'code': -32601, 'message': f"Method not found: {request.get('method')}"}}
+        return {'jsonrpc': '2.0', 'id': request.get('id'), 'result': result}
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body go out in separate writes; don't let Nagle hold the body back
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                server.requests += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                if isinstance(payload, list):
+                    body = [server.respond(request) for request in payload]
+                else:
+                    body = server.respond(payload)
+                data = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> 'FixtureRpcServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True, name='fixture-rpc')
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> 'FixtureRpcServer':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from . import fixtures
+
+    parser = argparse.ArgumentParser(description="Serve a recorded or synthetic RPC fixture")
+    parser.add_argument('--validators', type=int, default=1000)
+    parser.add_argument('--recording', help="fixture captured with benchmarks.record (default: synthetic)")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument('--port', type=int, default=8899)
+    args = parser.parse_args()
+
+    fixture = fixtures.scale(fixtures.load(args.recording), args.validators) if args.recording \
+        else fixtures.synthetic(args.validators)
+    with FixtureRpcServer(fixture, args.latency, port=args.port) as rpc:
+        print(f"Serving {args.validators} validators at {rpc.url}")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
@@ -1,4 +1,5 @@
 import multiprocessing
+import os
 
 # Server socket
 bind = "0.0.0.0:5000"
@@ -6,12 +7,18 @@ backlog = 2048
 
 # Worker processes
 workers = multiprocessing.cpu_count() * 2 + 1
-worker_class = 'sync'
-worker_connections = 1000
+# An async worker keeps slow requests and idle /api/stream connections from
+# tying up a process: 'gevent' (default), 'gthread' or 'sync'
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gevent')
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '1000'))  # gevent
+threads = int(os.getenv('GUNICORN_THREADS', '8'))  # gthread
 timeout = 120
 graceful_timeout = 30
 keepalive = 2
 
+# Prometheus: workers write their samples here and /metrics merges them
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/koii-validators-metrics')
+
 # Logging
 accesslog = '-'
 errorlog = '-'
@@ -36,3 +43,16 @@ certfile = None
 limit_request_line = 4096
 limit_request_fields = 100
 limit_request_field_size = 8190
+
+# Server hooks
+def on_starting(server):
+    path = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    os.makedirs(path, exist_ok=True)
+    # Samples left by a previous run would be merged into this one
+    for name in os.listdir(path):
+        if name.endswith('.db'):
+            os.remove(os.path.join(path, name))
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,47 @@
+"""Shared setup of the tests"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+from benchmarks import fixtures
+from benchmarks.rpc_server import FixtureRpcServer
+
+VALIDATORS = 100
+
+rpc_server = FixtureRpcServer(fixtures.synthetic(VALIDATORS)).start()
+_workdir = tempfile.mkdtemp(prefix='koii-validators-test-')
+
+os.environ.update({
+    'KOII_RPC_URL': rpc_server.url,
+    'BACKGROUND_REFRESH': 'false',
+    'GEO_PROVIDERS': '',
+    'GEO_CACHE_PATH': os.path.join(_workdir, 'geo_cache.sqlite3'),
+    'PROFILE_SAMPLE_RATE': '0'
+})
+os.environ.pop('PROMETHEUS_MULTIPROC_DIR', None)
+
+import app.app  # noqa: E402  (needs the environment above)
+
+# `app.app` is shadowed by the Flask object re-exported from the package
+app_module = sys.modules['app.app']
+
+
+def _postgres_available() -> bool:
+    import psycopg2
+
+    try:
+        psycopg2.connect(connect_timeout=2, **app_module.DB_CONFIG).close()
+    except psycopg2.Error:
+        return False
+    return True
+
+
+@pytest.fixture(scope='session')
+def postgres() -> None:
+    """Skip unless the database configured by DB_* is reachable"""
+    if not _postgres_available():
+        pytest.skip("Postgres is not reachable with the DB_* settings")
+    app_module.init_db()
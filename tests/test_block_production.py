@@ -0,0 +1,121 @@
+"""Incremental block production: paging, merging and recovery from short or failed pages"""
+
+from typing import Dict, List, Optional
+
+import pytest
+
+from app.block_production import BlockProductionTracker
+from app.rpc import KoiiRpcClient, RpcError
+from tests.conftest import rpc_server
+
+EPOCH_FIRST_SLOT = 1000
+
+
+def _production(first: int, last: int) -> Dict[str, List[int]]:
+    """Each slot led by one of three identities; every fifth slot skipped"""
+    counts: Dict[str, List[int]] = {}
+    for slot in range(first, last + 1):
+        leader, produced = counts.setdefault(f'v{slot % 3}', [0, 0])
+        counts[f'v{slot % 3}'] = [leader + 1, produced + (slot % 5 != 0)]
+    return counts
+
+
+class FakeClient:
+    """Answers getBlockProduction exactly, optionally shortening ranges or failing pages"""
+
+    def __init__(self, clamp: Optional[int] = None, fail_from: Optional[int] = None):
+        self.clamp = clamp
+        self.fail_from = fail_from
+        self.calls = 0
+        self.batches = 0
+
+    def _answer(self, params):
+        first, last = params[0]['range']['firstSlot'], params[0]['range']['lastSlot']
+        if self.fail_from is not None and last >= self.fail_from:
+            return RpcError('getBlockProduction', 'node is behind', -32016, retryable=True)
+        if self.clamp:
+            last = min(last, first + self.clamp - 1)
+        return {'context': {'slot': last},
+                'value': {'byIdentity': _production(first, last), 'range': {'firstSlot': first, 'lastSlot': last}}}
+
+    def call(self, method, params):
+        self.calls += 1
+        answer = self._answer(params)
+        if isinstance(answer, RpcError):
+            raise answer
+        return answer
+
+    def batch(self, calls):
+        self.batches += 1
+        return [self._answer(params) for _, params in calls]
+
+
+def _epoch_info(slot: int, epoch: int = 1) -> dict:
+    return {'epoch': epoch, 'absoluteSlot': slot, 'slotIndex': slot - EPOCH_FIRST_SLOT}
+
+
+@pytest.mark.parametrize('batch', [False, True])
+def test_counts_equal_one_request_over_the_epoch(batch):
+    client = FakeClient()
+    tracker = BlockProductionTracker(client, page_slots=100, min_new_slots=1, batch=batch)
+    assert tracker.update(_epoch_info(1349)) == _production(1000, 1349)
+    assert tracker.update(_epoch_info(1501)) == _production(1000, 1501)
+    if batch:
+        # The first update fetched its four pages in one batch, the second its two
+        assert (client.batches, client.calls) == (2, 0)
+    else:
+        assert client.calls == 6
+
+
+@pytest.mark.parametrize('batch', [False, True])
+def test_shortened_pages_are_continued_where_they_end(batch):
+    # The node returns at most 30 slots per page however many were asked for
+    tracker = BlockProductionTracker(FakeClient(clamp=30), page_slots=100, min_new_slots=1, batch=batch)
+    assert tracker.update(_epoch_info(1249)) == _production(1000, 1249)
+    assert tracker.next_slot == 1250
+
+
+@pytest.mark.parametrize('batch', [False, True])
+def test_failed_page_is_retried_next_time(batch):
+    client = FakeClient(fail_from=1200)
+    tracker = BlockProductionTracker(client, page_slots=100, min_new_slots=1, batch=batch)
+    # Pages 1000-1099 and 1100-1199 merge; the rest waits
+    assert tracker.update(_epoch_info(1349)) == _production(1000, 1199)
+    assert tracker.next_slot == 1200
+    client.fail_from = None
+    assert tracker.update(_epoch_info(1349)) == _production(1000, 1349)
+
+
+def test_nothing_fetched_yet_is_none():
+    tracker = BlockProductionTracker(FakeClient(fail_from=0), page_slots=100, min_new_slots=1)
+    assert tracker.update(_epoch_info(1050)) is None
+
+
+def test_recent_counts_are_reused_until_enough_new_slots():
+    client = FakeClient()
+    tracker = BlockProductionTracker(client, page_slots=100, min_new_slots=50, batch=False)
+    tracker.update(_epoch_info(1099))
+    assert tracker.update(_epoch_info(1120)) == _production(1000, 1099)
+    assert client.calls == 1
+    assert tracker.update(_epoch_info(1149)) == _production(1000, 1149)
+
+
+def test_new_epoch_starts_over():
+    tracker = BlockProductionTracker(FakeClient(), page_slots=100, min_new_slots=1)
+    tracker.update(_epoch_info(1300))
+    assert tracker.update({'epoch': 2, 'absoluteSlot': 2050, 'slotIndex': 50}) == _production(2000, 2050)
+    assert tracker.first_slot == 2000
+
+
+def test_against_the_fixture_server():
+    client = KoiiRpcClient(rpc_server.url, probe_interval=0)
+    epoch_info = client.call('getEpochInfo')
+    first_slot = epoch_info['absoluteSlot'] - epoch_info['slotIndex']
+    tracker = BlockProductionTracker(client, page_slots=50_000, min_new_slots=1)
+    before = rpc_server.requests
+    counts = tracker.update(epoch_info)
+    assert counts
+    assert tracker.first_slot == first_slot and tracker.next_slot == epoch_info['absoluteSlot'] + 1
+    # Several pages, one round trip
+    assert rpc_server.requests - before == 1
+    assert all(0 <= produced <= leader for leader, produced in counts.values())
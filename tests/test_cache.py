@@ -0,0 +1,139 @@
+"""Namespaced TTL/LRU cache: single-flight loads, stale-while-revalidate, errors and eviction"""
+
+import threading
+import time
+
+import pytest
+
+from app import cache
+
+TTL = 10
+STALE_TTL = 20
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """time.time() as seen by the cache, advanced by hand"""
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, 'time', lambda: now[0])
+    return now
+
+
+class BlockingLoader:
+    """A loader that counts its calls and returns `value` once released"""
+
+    def __init__(self, value):
+        self.value = value
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        self.started.set()
+        assert self.release.wait(5)
+        return self.value
+
+
+def _wait_for(condition, timeout=5.0):
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return
+        time.sleep(0.01)
+    raise AssertionError("condition not met in time")
+
+
+def test_concurrent_misses_share_one_load(clock):
+    ns = cache.CacheNamespace('test-single-flight', TTL)
+    loader = BlockingLoader('value')
+    results = []
+    callers = [threading.Thread(target=lambda: results.append(ns.get_or_load(loader))) for _ in range(8)]
+    for caller in callers:
+        caller.start()
+    _wait_for(lambda: ns.stats()['joined_loads'] == 7)
+    loader.release.set()
+    for caller in callers:
+        caller.join(5)
+    assert results == ['value'] * 8
+    assert loader.calls == 1
+    stats = ns.stats()
+    assert (stats['misses'], stats['loads']) == (8, 1)
+    # Cached from then on
+    assert ns.get_or_load(loader) == 'value' and loader.calls == 1
+
+
+def test_stale_value_is_served_while_one_reload_runs(clock):
+    ns = cache.CacheNamespace('test-stale', TTL, stale_ttl=STALE_TTL)
+    ns.set('old')
+    clock[0] += TTL + 1
+    loader = BlockingLoader('new')
+    # Every caller gets the old value at once; only the first starts a reload
+    assert [ns.get_or_load(loader) for _ in range(5)] == ['old'] * 5
+    assert loader.started.wait(5)
+    assert loader.calls == 1
+    loader.release.set()
+    _wait_for(lambda: ns.stats()['loads'] == 1)
+    assert ns.get_or_load(loader) == 'new'
+    assert ns.stats()['stale_hits'] == 5
+
+
+def test_past_the_stale_window_callers_wait(clock):
+    ns = cache.CacheNamespace('test-expired', TTL, stale_ttl=STALE_TTL)
+    ns.set('old')
+    clock[0] += TTL + STALE_TTL + 1
+    assert ns.get_or_load(lambda: 'new') == 'new'
+
+
+def test_wait_gives_up_on_a_slow_load(clock):
+    ns = cache.CacheNamespace('test-wait', TTL)
+    loader = BlockingLoader('late')
+    assert ns.get_or_load(loader, wait=0.05) is None
+    loader.release.set()
+    _wait_for(lambda: ns.stats()['loads'] == 1)
+    # The load finished in the background and its value was kept
+    assert ns.get_or_load(loader, wait=0.05) == 'late'
+    assert loader.calls == 1
+
+
+@pytest.mark.parametrize('failure', ['raise', 'none'])
+def test_failed_loads_are_not_cached(clock, failure):
+    ns = cache.CacheNamespace(f'test-errors-{failure}', TTL)
+    calls = []
+
+    def loader():
+        calls.append(1)
+        if failure == 'raise':
+            raise RuntimeError('upstream down')
+        return None
+
+    assert ns.get_or_load(loader) is None
+    assert ns.get_or_load(loader) is None
+    assert len(calls) == 2
+    assert ns.stats()['load_errors'] == 2
+    assert ns.get_or_load(lambda: 'recovered') == 'recovered'
+
+
+def test_failed_reload_keeps_the_stale_value(clock):
+    ns = cache.CacheNamespace('test-stale-error', TTL, stale_ttl=STALE_TTL)
+    ns.set('old')
+    clock[0] += TTL + 1
+    assert ns.get_or_load(lambda: None) == 'old'
+    _wait_for(lambda: ns.stats()['loads'] == 1)
+    assert ns.get_or_load(lambda: None) == 'old'
+
+
+def test_least_recently_used_entries_are_evicted(clock):
+    ns = cache.CacheNamespace('test-evict', TTL, max_entries=2)
+    ns.set('a', key='a')
+    ns.set('b', key='b')
+    assert ns.get('a') == 'a'  # b is now the least recently used
+    assert ns.get_or_load(lambda: 'c', key='c') == 'c'
+    assert ns.get('b') is None
+    assert (ns.get('a'), ns.get('c')) == ('a', 'c')
+    assert ns.stats()['evictions'] == 1
+    assert ns.stats()['entries'] == 2
+
+
+def test_namespaces_are_shared_by_name():
+    assert cache.namespace('test-shared', TTL) is cache.namespace('test-shared', 1)
+    assert 'test-shared' in cache.stats()
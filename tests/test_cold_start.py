@@ -0,0 +1,88 @@
+"""Cold /api/nodes requests: one snapshot build however many arrive at once"""
+
+import threading
+import time
+
+import pytest
+
+from app import cache
+from app.leader import BuildLock, LockSession
+from tests.conftest import VALIDATORS, app_module, rpc_server
+
+REQUESTS = 12
+
+
+@pytest.fixture
+def cold(monkeypatch):
+    """Nothing stored; counts the builds, each slow enough for every request to arrive during it"""
+    builds = []
+    build_snapshot = app_module.build_snapshot
+    released = threading.Event()
+
+    def counted_build():
+        builds.append(threading.current_thread().name)
+        released.wait(5)
+        return build_snapshot()
+
+    monkeypatch.setattr(app_module, 'build_snapshot', counted_build)
+    monkeypatch.setattr(app_module, 'get_encoded_snapshot', lambda: None)
+    monkeypatch.setattr(app_module, 'store_latest_data', lambda data, log=None: None)
+    monkeypatch.setattr(app_module, 'build_lock', BuildLock(None, app_module.BUILD_LOCK_KEY))
+    monkeypatch.setattr(app_module, 'cold_start_cache', cache.CacheNamespace('test-cold-start', 60, max_entries=1))
+    monkeypatch.setattr(app_module.Config, 'COLD_START_WAIT', 10)
+    app_module.source_schedule.reset()
+    app_module.validator_info_cache.invalidate()
+    return builds, released
+
+
+def _get_concurrently(path: str, count: int):
+    responses = [None] * count
+
+    def get(i):
+        responses[i] = app_module.app.test_client().get(path)
+
+    threads = [threading.Thread(target=get, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, responses
+
+
+def test_concurrent_cold_requests_build_once(cold):
+    builds, released = cold
+    requests_before = rpc_server.requests
+    threads, responses = _get_concurrently('/api/nodes', REQUESTS)
+    # Every request is waiting on the one build
+    for _ in range(500):
+        stats = app_module.cold_start_cache.stats()
+        if stats['misses'] == REQUESTS:
+            break
+        time.sleep(0.01)
+    assert stats['misses'] == REQUESTS and stats['joined_loads'] == REQUESTS - 1
+    released.set()
+    for thread in threads:
+        thread.join(30)
+
+    assert len(builds) == 1
+    assert rpc_server.requests > requests_before
+    assert [response.status_code for response in responses] == [200] * REQUESTS
+    bodies = {response.get_data() for response in responses}
+    assert len(bodies) == 1
+    assert len(responses[0].get_json()['validators']) == VALIDATORS
+
+
+def test_another_process_building_is_waited_for(cold, postgres, monkeypatch):
+    builds, released = cold
+    released.set()
+    other = LockSession(app_module.DB_CONFIG)
+    assert other.try_lock(app_module.BUILD_LOCK_KEY)
+    try:
+        monkeypatch.setattr(app_module, 'build_lock', BuildLock(LockSession(app_module.DB_CONFIG),
+                                                                app_module.BUILD_LOCK_KEY))
+        monkeypatch.setattr(app_module.Config, 'COLD_START_WAIT', 0.5)
+        response = app_module.app.test_client().get('/api/nodes')
+    finally:
+        other.unlock(app_module.BUILD_LOCK_KEY)
+    # Nothing was stored while it waited, so it gives up without calling the RPC node
+    assert builds == []
+    assert response.status_code == 503
+    assert response.headers['Retry-After']
@@ -0,0 +1,93 @@
+"""Packed epochCredits and the endpoints that unpack them"""
+
+import numpy as np
+import pytest
+
+from app import credits, snapshot
+from app.metrics import ValidatorColumns
+from tests.conftest import app_module
+
+
+def _account(i: int, epochs: int) -> dict:
+    return {
+        'votePubkey': f'vote{i}', 'nodePubkey': f'id{i}', 'activatedStake': 10 ** 12, 'commission': 5,
+        # Credits past 2**32 must survive packing
+        'epochCredits': [[400 + e, 2 ** 33 + (e + 1) * 1000, 2 ** 33 + e * 1000] for e in range(epochs)]
+    }
+
+
+@pytest.fixture
+def accounts():
+    return [_account(i, epochs) for i, epochs in enumerate([64, 0, 1, 3])]
+
+
+def test_pack_records_round_trip(accounts):
+    records = ValidatorColumns(accounts, []).records(np.zeros(len(accounts)))
+    packed = credits.PackedEpochCredits(credits.pack(records), version=7)
+    assert len(packed) == 4 and packed.version == 7
+    for account in accounts:
+        assert packed.get(account['votePubkey']) == account['epochCredits']
+    assert packed.get('unknown') is None
+    # Records serialize without them
+    assert 'epochCredits' not in snapshot.loads(snapshot.dumps(records[0]))
+
+
+def test_pack_snapshot_dicts(accounts):
+    # Validators decoded from a snapshot stored before credits were packed
+    validators = [{'voteAccountPubkey': a['votePubkey'], 'epochCredits': a['epochCredits']} for a in accounts]
+    validators.append({'voteAccountPubkey': 'bare'})
+    packed = credits.PackedEpochCredits(credits.pack(validators))
+    assert packed.get('vote0') == accounts[0]['epochCredits']
+    assert packed.get('bare') == []
+
+
+def test_pack_nothing():
+    packed = credits.PackedEpochCredits(credits.pack([]))
+    assert len(packed) == 0
+    assert packed.get('vote0') is None
+
+
+def test_reads_from_a_memoryview(accounts):
+    records = ValidatorColumns(accounts, []).records(np.zeros(len(accounts)))
+    blob = credits.pack(records)
+    assert credits.PackedEpochCredits(memoryview(blob)).get('vote3') == accounts[3]['epochCredits']
+
+
+def test_rejects_other_blobs():
+    with pytest.raises(ValueError):
+        credits.PackedEpochCredits(b'JSON' + bytes(8))
+
+
+@pytest.fixture
+def client(monkeypatch, accounts):
+    records = ValidatorColumns(accounts, []).records(np.zeros(len(accounts)))
+    data = {'snapshotVersion': 7, 'validators': records}
+    encoded = snapshot.encode_snapshot(data, 7)
+    packed = credits.PackedEpochCredits(credits.pack(records), version=7)
+    monkeypatch.setattr(app_module, 'get_encoded_snapshot', lambda: encoded)
+    monkeypatch.setattr(app_module, 'get_epoch_credits', lambda: packed)
+    monkeypatch.setattr(app_module, 'decoded_snapshot', None)
+    return app_module.app.test_client()
+
+
+def test_credits_endpoint(client, accounts):
+    response = client.get('/api/validators/vote2/credits')
+    assert response.status_code == 200
+    assert response.get_json() == {
+        'voteAccountPubkey': 'vote2', 'snapshotVersion': 7, 'epochCredits': accounts[2]['epochCredits']
+    }
+    assert client.get('/api/validators/unknown/credits').status_code == 404
+
+
+def test_credits_endpoint_before_the_first_snapshot(monkeypatch):
+    monkeypatch.setattr(app_module, 'get_epoch_credits', lambda: None)
+    assert app_module.app.test_client().get('/api/validators/vote0/credits').status_code == 503
+
+
+def test_nodes_only_carry_credits_when_asked(client, accounts):
+    full = client.get('/api/nodes').get_json()
+    assert 'epochCredits' not in full['validators'][0]
+    selected = client.get('/api/nodes?fields=voteAccountPubkey,epochCredits').get_json()
+    assert selected['validators'] == [
+        {'voteAccountPubkey': a['votePubkey'], 'epochCredits': a['epochCredits']} for a in accounts
+    ]
@@ -0,0 +1,37 @@
+"""Access to the /api/debug endpoints"""
+
+import contextlib
+
+import pytest
+
+from tests.conftest import app_module
+
+TOKEN = 'test-admin-token'
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(app_module, 'get_connection', lambda: contextlib.nullcontext(None))
+    monkeypatch.setattr(app_module.tracing, 'load_traces', lambda conn, limit: [])
+    monkeypatch.setattr(app_module.tracing, 'request_profile', lambda conn: None)
+    return app_module.app.test_client()
+
+
+def _requests(client, headers=None):
+    return [
+        client.get('/api/debug/timings', headers=headers).status_code,
+        client.post('/api/debug/profile', headers=headers).status_code
+    ]
+
+
+def test_denied_without_a_configured_token(client, monkeypatch):
+    monkeypatch.setattr(app_module.Config, 'ADMIN_TOKEN', None)
+    assert _requests(client) == [403, 403]
+    assert _requests(client, {'X-Admin-Token': ''}) == [403, 403]
+
+
+def test_token_is_required(client, monkeypatch):
+    monkeypatch.setattr(app_module.Config, 'ADMIN_TOKEN', TOKEN)
+    assert _requests(client) == [403, 403]
+    assert _requests(client, {'X-Admin-Token': 'wrong'}) == [403, 403]
+    assert _requests(client, {'X-Admin-Token': TOKEN}) == [200, 202]
@@ -0,0 +1,46 @@
+"""Bulk geolocation: providers in turn behind the SQLite cache"""
+
+from typing import Dict, List, Optional
+
+import pytest
+
+from app.geo import GeoCache, GeoLocator, GeoProvider, Location
+
+FRANKFURT = {'latitude': 50.11, 'longitude': 8.68, 'city': 'Frankfurt', 'country': 'Germany'}
+
+
+class DictProvider(GeoProvider):
+    """Resolves the IPs it knows; the rest are left to the next provider"""
+
+    def __init__(self, name: str, known: Dict[str, Optional[Location]]):
+        self.name = name
+        self.known = known
+        self.asked: List[List[str]] = []
+
+    def lookup(self, ips: List[str]) -> Dict[str, Optional[Location]]:
+        self.asked.append(ips)
+        return {ip: self.known[ip] for ip in ips if ip in self.known}
+
+
+def test_provider_without_lookup_fails_when_created():
+    class Incomplete(GeoProvider):
+        name = 'incomplete'
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_providers_are_tried_in_turn_and_cached(tmp_path):
+    cache = GeoCache(str(tmp_path / 'geo.sqlite3'), 3600, 100)
+    first = DictProvider('first', {'10.0.0.1': FRANKFURT})
+    second = DictProvider('second', {'10.0.0.2': None})
+    locator = GeoLocator(cache, [first, second])
+
+    locations = locator.lookup_many(['10.0.0.1', '10.0.0.2', '10.0.0.3', None, '10.0.0.1'])
+    assert locations == {'10.0.0.1': FRANKFURT, '10.0.0.2': None}
+    assert first.asked == [['10.0.0.1', '10.0.0.2', '10.0.0.3']]
+    assert second.asked == [['10.0.0.2', '10.0.0.3']]
+
+    # Resolved IPs, unresolvable ones included, come from the cache; failed ones are asked again
+    locator.lookup_many(['10.0.0.1', '10.0.0.2', '10.0.0.3'])
+    assert first.asked[-1] == ['10.0.0.3']
@@ -0,0 +1,96 @@
+"""Smoke test of the production server: gunicorn with its default gevent workers"""
+
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+
+from tests.conftest import rpc_server
+
+pytest.importorskip('gunicorn')
+pytest.importorskip('gevent')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(scope='module')
+def server(postgres, tmp_path_factory):
+    """Base URL of gunicorn running the app with one gevent worker and the background refresh on"""
+    port = _free_port()
+    env = dict(os.environ, BACKGROUND_REFRESH='true', KOII_RPC_URL=rpc_server.url,
+               PROMETHEUS_MULTIPROC_DIR=str(tmp_path_factory.mktemp('metrics')))
+    # The worker class under test is gunicorn_config.py's default
+    env.pop('GUNICORN_WORKER_CLASS', None)
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn_config.py', '--workers', '1',
+         '--bind', f'127.0.0.1:{port}', 'app.app:app'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base_url = f'http://127.0.0.1:{port}'
+    try:
+        # Up, and serving what its refresh stored rather than a snapshot other tests left behind
+        deadline = time.time() + 60
+        while True:
+            assert process.poll() is None, "gunicorn exited"
+            try:
+                if requests.get(f'{base_url}/api/nodes', timeout=10).json().get('validators'):
+                    break
+            except (requests.ConnectionError, ValueError):
+                pass
+            assert time.time() < deadline, "gunicorn did not serve a snapshot"
+            time.sleep(0.2)
+        yield base_url
+    finally:
+        # Quick shutdown: a graceful one waits out streams until their next keepalive shows the client left
+        process.send_signal(signal.SIGINT)
+        process.wait(timeout=30)
+
+
+def _read_event(response) -> dict:
+    fields = {}
+    for line in response.iter_lines(decode_unicode=True):
+        if not line:
+            if 'event' in fields:
+                return fields
+            continue
+        name, _, value = line.partition(': ')
+        fields[name] = value
+    raise AssertionError("stream closed before an event")
+
+
+def test_endpoints_while_streams_are_open(server):
+    streams = [requests.get(f'{server}/api/stream?since=0', stream=True, timeout=30) for _ in range(20)]
+    try:
+        # Twenty idle streams on one worker must not hold up other requests
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            nodes = pool.submit(requests.get, f'{server}/api/nodes', timeout=60)
+            page = pool.submit(requests.get, f'{server}/api/validators/page?sort=activatedStake&order=desc&limit=5',
+                               timeout=60)
+            nodes, page = nodes.result(), page.result()
+        assert nodes.status_code == 200
+        assert len(nodes.json()['validators']) > 0
+        assert page.status_code == 200
+        assert len(page.json()['validators']) == 5
+
+        for response in streams:
+            assert response.status_code == 200
+            assert response.headers['Content-Type'].startswith('text/event-stream')
+        event = _read_event(streams[0])
+        assert event['event'] in ('snapshot', 'delta')
+        assert json.loads(event['data'])['snapshotVersion'] == int(event['id'])
+    finally:
+        for response in streams:
+            response.close()
@@ -0,0 +1,121 @@
+"""Leader election and the build lock on a process's advisory lock session"""
+
+import os
+import threading
+import time
+
+import psycopg2
+import pytest
+
+from app.leader import BuildLock, FileLeaderLock, LockSession, PostgresLeaderLock, create_leader_lock
+from tests.conftest import app_module
+
+# Clear of the keys the app itself uses
+LEADER_KEY = 7_000_000 + os.getpid()
+BUILD_KEY = LEADER_KEY + 1
+
+
+def test_file_lock_has_one_holder(tmp_path):
+    path = str(tmp_path / 'leader.lock')
+    first, second = FileLeaderLock(path), FileLeaderLock(path)
+    assert first.try_acquire() and first.is_held()
+    assert not second.try_acquire()
+    first.release()
+    assert second.try_acquire()
+    second.release()
+
+
+def test_build_lock_without_a_session_excludes_threads():
+    lock = BuildLock(None, BUILD_KEY)
+    assert lock.try_acquire()
+    other = []
+    thread = threading.Thread(target=lambda: other.append(lock.try_acquire()))
+    thread.start()
+    thread.join()
+    assert other == [False]
+    lock.release()
+    assert lock.try_acquire()
+    lock.release()
+
+
+def test_unknown_mode_lets_every_worker_lead():
+    lock = create_leader_lock('bogus', None, LEADER_KEY, '')
+    assert lock.mode == 'none' and lock.try_acquire() and lock.is_held()
+
+
+@pytest.fixture
+def sessions(postgres):
+    """Two processes' lock sessions"""
+    created = [LockSession(app_module.DB_CONFIG, reconnect_interval=0) for _ in range(2)]
+    yield created
+    for session in created:
+        session._close()
+
+
+def _backend_pid(session: LockSession) -> int:
+    return session.conn.get_backend_pid()
+
+
+def _lock_holders(key: int):
+    conn = psycopg2.connect(**app_module.DB_CONFIG)
+    try:
+        with conn.cursor() as cur:
+            # A bigint key is split over classid (high half) and objid (low half)
+            cur.execute("""
+                SELECT pid FROM pg_locks
+                WHERE locktype = 'advisory' AND granted AND classid = 0 AND objid = %s
+            """, (key,))
+            return [row[0] for row in cur.fetchall()]
+    finally:
+        conn.close()
+
+
+def test_leader_and_build_locks_share_one_connection(sessions):
+    session, _ = sessions
+    leader = PostgresLeaderLock(session, LEADER_KEY)
+    build = BuildLock(session, BUILD_KEY)
+    assert leader.try_acquire()
+    conn = session.conn
+    assert build.try_acquire()
+    assert session.conn is conn
+    assert _lock_holders(LEADER_KEY) == _lock_holders(BUILD_KEY) == [_backend_pid(session)]
+    build.release()
+    assert _lock_holders(BUILD_KEY) == []
+    # Releasing the build lock keeps the leader lock
+    assert leader.is_held() and _lock_holders(LEADER_KEY) == [_backend_pid(session)]
+    leader.release()
+    assert _lock_holders(LEADER_KEY) == []
+
+
+def test_other_process_takes_over_when_the_holders_session_drops(sessions):
+    first, second = sessions
+    holder, standby = PostgresLeaderLock(first, LEADER_KEY), PostgresLeaderLock(second, LEADER_KEY)
+    assert holder.try_acquire()
+    assert BuildLock(first, BUILD_KEY).try_acquire()
+    assert not standby.try_acquire()
+    assert not BuildLock(second, BUILD_KEY).try_acquire()
+
+    # The holder's connection goes away, e.g. a network partition or a server restart
+    with second.conn.cursor() as cur:
+        cur.execute("SELECT pg_terminate_backend(%s)", (_backend_pid(first),))
+    for _ in range(50):
+        if not _lock_holders(LEADER_KEY):
+            break
+        time.sleep(0.05)
+
+    # Both of its locks went with it
+    assert not holder.is_held()
+    assert first.held == set()
+    assert standby.try_acquire() and standby.is_held()
+    assert BuildLock(second, BUILD_KEY).try_acquire()
+    # The old holder reconnects but cannot take the lock back
+    assert not holder.try_acquire()
+    assert first.conn is not None and not first.conn.closed
+
+
+def test_unreachable_database_is_not_a_lock():
+    session = LockSession(dict(app_module.DB_CONFIG, host='127.0.0.1', port='1', connect_timeout=1),
+                          reconnect_interval=60)
+    assert session.try_lock(LEADER_KEY) is None
+    assert not PostgresLeaderLock(session, LEADER_KEY).try_acquire()
+    assert not BuildLock(session, BUILD_KEY).try_acquire()
@@ -0,0 +1,146 @@
+"""Sorting, filtering and cursor paging of /api/validators/page"""
+
+import random
+
+import pytest
+
+from app import listing, snapshot
+from tests.conftest import app_module
+
+
+def _validator(i: int, rng: random.Random) -> dict:
+    return {
+        'identityPubkey': f'id{rng.randrange(10 ** 6):06d}-{i}',
+        'voteAccountPubkey': f'vote{i}',
+        # Few distinct values, so most rows tie with others
+        'activatedStake': rng.choice([0, 10, 20, 30]),
+        'commission': rng.choice([0, 5, 100]),
+        'apr': rng.choice([0.0, 5.5, 7.25]),
+        'version': rng.choice(['1.16.0', '1.17.2', None]),
+        'delinquent': rng.random() < 0.3
+    }
+
+
+@pytest.fixture
+def data():
+    rng = random.Random(7)
+    return {'snapshotVersion': 3, 'validators': [_validator(i, rng) for i in range(60)]}
+
+
+def _expected(validators, field, descending):
+    def key(validator):
+        value = validator.get(field)
+        if value is None:
+            value = '' if field in listing.TEXT_FIELDS else 0
+        return value, validator['identityPubkey']
+    return sorted(validators, key=key, reverse=descending)
+
+
+def _walk(index, field, descending, mask_key=(), mask=None, limit=7):
+    """Every page, following cursors; returns the identities in order"""
+    seen, after = [], None
+    while True:
+        validators, total, cursor = index.page(field, descending, mask_key, mask, limit, after=after)
+        seen += [validator['identityPubkey'] for validator in validators]
+        if cursor is None:
+            return seen, total
+        after = listing.decode_cursor(cursor)
+
+
+def test_cursor_round_trip():
+    cursor = listing.encode_cursor(12.5, 'abc')
+    assert '=' not in cursor
+    assert listing.decode_cursor(cursor) == (12.5, 'abc')
+
+
+@pytest.mark.parametrize('cursor', ['!!', 'bm90IGpzb24', listing.encode_cursor(1, 'x')[:-3]])
+def test_malformed_cursor(cursor):
+    with pytest.raises(ValueError):
+        listing.decode_cursor(cursor)
+
+
+@pytest.mark.parametrize('field', ['activatedStake', 'commission', 'apr', 'version', 'delinquent', 'identityPubkey'])
+@pytest.mark.parametrize('descending', [False, True])
+def test_cursor_pages_follow_sort_order(data, field, descending):
+    index = listing.ValidatorIndex(data)
+    seen, total = _walk(index, field, descending)
+    assert total == len(data['validators'])
+    assert seen == [v['identityPubkey'] for v in _expected(data['validators'], field, descending)]
+
+
+def test_offset_pages(data):
+    index = listing.ValidatorIndex(data)
+    expected = [v['identityPubkey'] for v in _expected(data['validators'], 'apr', True)]
+    pages = [index.page('apr', True, (), None, 10, offset)[0] for offset in range(0, 60, 10)]
+    assert [v['identityPubkey'] for page in pages for v in page] == expected
+    assert index.page('apr', True, (), None, 10, 60)[0] == []
+
+
+def test_filters(data):
+    index = listing.ValidatorIndex(data)
+    mask_key, mask = index.mask(delinquent=False, versions=['1.17.2'], min_stake=20)
+    matching = [
+        v for v in data['validators']
+        if not v['delinquent'] and v['version'] == '1.17.2' and v['activatedStake'] >= 20
+    ]
+    seen, total = _walk(index, 'commission', False, mask_key, mask, limit=3)
+    assert total == len(matching)
+    assert seen == [v['identityPubkey'] for v in _expected(matching, 'commission', False)]
+    # The filtered order is cached under its key
+    assert index.mask(min_stake=20, versions=['1.17.2'], delinquent=False)[0] == mask_key
+
+
+def test_no_filter_has_no_mask(data):
+    assert listing.ValidatorIndex(data).mask() == ((), None)
+
+
+@pytest.mark.parametrize('descending', [False, True])
+def test_cursor_survives_a_new_snapshot(data, descending):
+    index = listing.ValidatorIndex(data)
+    first, _, cursor = index.page('activatedStake', descending, (), None, 20)
+    after = listing.decode_cursor(cursor)
+    # The row the cursor names is gone from the next snapshot
+    remaining = [v for v in data['validators'] if v['identityPubkey'] != after[1]]
+    newer = listing.ValidatorIndex({'snapshotVersion': 4, 'validators': remaining})
+    rest, _, _ = newer.page('activatedStake', descending, (), None, 100, after=after)
+    expected = [v['identityPubkey'] for v in _expected(remaining, 'activatedStake', descending)]
+    assert [v['identityPubkey'] for v in rest] == expected[len(first) - 1:]
+
+
+def test_cursor_of_wrong_type(data):
+    index = listing.ValidatorIndex(data)
+    with pytest.raises(ValueError):
+        index.page('activatedStake', True, (), None, 10, after=('lots', 'id'))
+
+
+@pytest.fixture
+def client(monkeypatch, data):
+    encoded = snapshot.encode_snapshot(data, data['snapshotVersion'])
+    monkeypatch.setattr(app_module, 'get_encoded_snapshot', lambda: encoded)
+    monkeypatch.setattr(app_module, 'validator_index', None)
+    return app_module.app.test_client()
+
+
+def test_endpoint_pages(client, data):
+    response = client.get('/api/validators/page?sort=apr&order=asc&limit=25&delinquent=true&fields=identityPubkey,apr')
+    assert response.status_code == 200
+    body = response.get_json()
+    delinquent = [v for v in data['validators'] if v['delinquent']]
+    assert body['snapshotVersion'] == 3
+    assert body['total'] == len(delinquent)
+    assert body['validators'] == [
+        {'identityPubkey': v['identityPubkey'], 'apr': v['apr']} for v in _expected(delinquent, 'apr', False)
+    ][:25]
+
+    # The same query is answered with 304 until the snapshot changes
+    again = client.get(response.request.full_path, headers={'If-None-Match': response.headers['ETag']})
+    assert again.status_code == 304
+
+
+@pytest.mark.parametrize('query', [
+    'sort=stakeWeight', 'order=up', 'delinquent=yes', 'cursor=abc&offset=5', 'cursor=!!', 'fields=secret'
+])
+def test_endpoint_rejects_bad_parameters(client, query):
+    response = client.get(f'/api/validators/page?{query}')
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
@@ -0,0 +1,151 @@
+"""The columnar metrics against the per-validator math they replaced"""
+
+from typing import Any, Dict, List
+
+import numpy as np
+import pytest
+
+from app.metrics import ValidatorColumns
+from benchmarks import fixtures
+from tests.conftest import app_module
+
+NETWORK_APR = 7.5
+
+
+def _reference_metrics(validator: Dict[str, Any], block_production: Dict[str, List[int]], network_apr: float,
+                       delinquent: bool) -> Dict[str, Any]:
+    """One validator as the refresh computed it before the columns, one at a time"""
+    vote_pubkey = str(validator.get("votePubkey", ""))
+    identity_pubkey = str(validator.get("nodePubkey", vote_pubkey))
+    commission = int(validator.get("commission", 0)) / 100
+    skip_rate = 0
+    if identity_pubkey in block_production:
+        assigned_slots, produced_blocks = (int(slots) for slots in block_production[identity_pubkey])
+        skip_rate = ((assigned_slots - produced_blocks) / assigned_slots) * 100 if assigned_slots > 0 else 0
+    epoch_credits = validator.get("epochCredits", [])
+    credits_growth = epoch_credits[-1][2] - epoch_credits[-2][2] if len(epoch_credits) >= 2 else 0
+    return {
+        'identityPubkey': identity_pubkey,
+        'voteAccountPubkey': vote_pubkey,
+        'commission': int(validator.get("commission", 0)),
+        'lastVote': int(validator.get("lastVote", 0)),
+        'rootSlot': int(validator.get("rootSlot", 0)),
+        'credits': int(validator.get("credits", 0)),
+        'activatedStake': int(validator.get("activatedStake", 0)),
+        'version': str(validator.get("version", "1.16.0")),
+        'skipRate': skip_rate,
+        'creditsGrowth': credits_growth,
+        'location': None,
+        'delinquent': delinquent,
+        'apr': network_apr - (network_apr * commission)
+    }
+
+
+def _reference_version_stats(validators: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    by_version: Dict[str, Dict[str, Any]] = {}
+    for validator in validators:
+        stats = by_version.setdefault(validator['version'], {
+            'currentValidators': 0, 'delinquentValidators': 0, 'currentActiveStake': 0, 'delinquentActiveStake': 0,
+            'averageSkipRate': 0, 'averageCreditsGrowth': 0, 'averageApr': 0, 'totalApr': 0, 'validatorsWithApr': 0
+        })
+        if validator['delinquent']:
+            stats['delinquentValidators'] += 1
+            stats['delinquentActiveStake'] += validator['activatedStake']
+        else:
+            stats['currentValidators'] += 1
+            stats['currentActiveStake'] += validator['activatedStake']
+        stats['averageSkipRate'] += validator['skipRate']
+        stats['averageCreditsGrowth'] += validator['creditsGrowth']
+        stats['totalApr'] += validator['apr']
+        stats['validatorsWithApr'] += 1
+    for stats in by_version.values():
+        total = stats['currentValidators'] + stats['delinquentValidators']
+        stats['averageSkipRate'] /= total
+        stats['averageCreditsGrowth'] /= total
+        stats['averageApr'] = stats['totalApr'] / stats['validatorsWithApr']
+    return by_version
+
+
+def _assert_matches_reference(current, delinquent, block_production):
+    expected = [_reference_metrics(v, block_production, NETWORK_APR, False) for v in current] + \
+        [_reference_metrics(v, block_production, NETWORK_APR, True) for v in delinquent]
+
+    columns = ValidatorColumns(current, delinquent, block_production)
+    apr = columns.apr(NETWORK_APR)
+    records = [record.to_dict() for record in columns.records(apr)]
+    assert records == [pytest.approx(validator) for validator in expected]
+
+    stakes = [v['activatedStake'] for v in expected]
+    active = sum(stake for stake, v in zip(stakes, expected) if not v['delinquent'])
+    assert columns.stake_totals() == (active, sum(stakes), sum(stakes) - active)
+    average_skip_rate = sum(v['skipRate'] for v in expected) / len(expected) if expected else 0
+    assert columns.average_skip_rate() == pytest.approx(average_skip_rate)
+
+    version_stats = columns.version_stats(apr)
+    reference = _reference_version_stats(expected)
+    # Same versions in the same order, with the same aggregates
+    assert list(version_stats) == list(reference)
+    for version, stats in reference.items():
+        assert version_stats[version] == pytest.approx(stats)
+
+
+@pytest.mark.parametrize('count', [1, 10, 500])
+def test_synthetic_cluster(count):
+    fixture = fixtures.synthetic(count, delinquent_share=0.2)
+    accounts = fixture['getVoteAccounts']
+    _assert_matches_reference(accounts['current'], accounts['delinquent'],
+                              fixture['getBlockProduction']['value']['byIdentity'])
+
+
+def _account(i: int, **fields) -> Dict[str, Any]:
+    account = {
+        'votePubkey': f'vote{i}', 'nodePubkey': f'id{i}', 'activatedStake': 10 ** 12, 'commission': 10,
+        'lastVote': 100, 'rootSlot': 90, 'credits': 5000, 'version': '1.17.0',
+        'epochCredits': [[1, 3000, 1000], [2, 5000, 3000]]
+    }
+    account.update(fields)
+    return account
+
+
+def test_edge_cases():
+    current = [
+        _account(0, activatedStake=0),
+        _account(1),  # no leader slots at all
+        _account(2),  # leader slots assigned but none this epoch yet
+        _account(3, epochCredits=[[2, 100, 0]], commission=100),
+        _account(4, version=None)
+    ]
+    del current[4]['version']
+    block_production = {'id0': [10, 7], 'id2': [0, 0], 'id3': [4, 4], 'id4': [3, 0]}
+    _assert_matches_reference(current, [_account(5, activatedStake=0)], block_production)
+
+
+def test_delinquent_only():
+    delinquent = [_account(0), _account(1, version='1.16.8', commission=0)]
+    _assert_matches_reference([], delinquent, {'id0': [8, 2]})
+    columns = ValidatorColumns([], delinquent, {})
+    assert columns.stake_totals()[0] == 0
+
+
+def test_no_validators():
+    columns = ValidatorColumns([], [], {})
+    assert columns.records(columns.apr(NETWORK_APR)) == []
+    assert columns.version_stats(columns.apr(NETWORK_APR)) == {}
+    assert columns.stake_totals() == (0, 0, 0)
+    assert columns.average_skip_rate() == 0
+
+
+def test_single_validator_wrapper():
+    fixture = fixtures.synthetic(20)
+    block_production = fixture['getBlockProduction']['value']['byIdentity']
+    for validator in fixture['getVoteAccounts']['current']:
+        metrics = app_module.calculate_validator_metrics(validator, block_production, NETWORK_APR, locations={})
+        assert metrics == pytest.approx(_reference_metrics(validator, block_production, NETWORK_APR, False))
+
+
+def test_stake_sums_stay_exact():
+    # Past 2**53 a float sum would round
+    current = [_account(i, activatedStake=2 ** 60 + i) for i in range(4)]
+    columns = ValidatorColumns(current, [], {})
+    assert columns.stake_totals()[0] == sum(2 ** 60 + i for i in range(4))
+    assert columns.version_stats(np.zeros(4))['1.17.0']['currentActiveStake'] == sum(2 ** 60 + i for i in range(4))
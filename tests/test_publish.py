@@ -0,0 +1,113 @@
+"""Publishing snapshots for nginx and the ETags both sides send"""
+
+import os
+
+import pytest
+
+from app import publish, snapshot
+from tests.conftest import app_module
+
+
+def _encoded(version: int, modified: int = 1700000000) -> snapshot.EncodedSnapshot:
+    encoded = snapshot.encode_snapshot({'validators': [], 'version': version}, version)
+    encoded.modified = modified
+    return encoded
+
+
+def _nginx_etag(path: str) -> str:
+    """The ETag nginx sends for a static file"""
+    stat = os.stat(path)
+    return f'{int(stat.st_mtime):x}-{stat.st_size:x}'
+
+
+def test_published_files_carry_the_app_etag(tmp_path):
+    encoded = _encoded(5)
+    assert publish.publish_snapshot(str(tmp_path), encoded)
+    for suffix, content in (('', encoded.body), ('.gz', encoded.gzip)):
+        assert (tmp_path / f'nodes.json{suffix}').read_bytes() == content
+        assert _nginx_etag(tmp_path / f'nodes.json{suffix}') == encoded.variant_etag(content)
+        assert (tmp_path / 'snapshots' / f'5.json{suffix}').read_bytes() == content
+
+
+def test_prunes_old_versions(tmp_path):
+    for version in range(1, 6):
+        publish.publish_snapshot(str(tmp_path), _encoded(version, 1700000000 + version), keep=2)
+    assert {name.split('.')[0] for name in os.listdir(tmp_path / 'snapshots')} == {'4', '5'}
+
+
+def test_never_replaces_a_newer_version(tmp_path):
+    publish.publish_snapshot(str(tmp_path), _encoded(5))
+    assert not publish.publish_snapshot(str(tmp_path), _encoded(4))
+    assert (tmp_path / 'nodes.json').read_bytes() == _encoded(5).body
+
+
+def test_unpublish_only_its_own_version(tmp_path):
+    publish.publish_snapshot(str(tmp_path), _encoded(5))
+    assert not publish.unpublish(str(tmp_path), 4)
+    assert (tmp_path / 'nodes.json').exists()
+    assert publish.unpublish(str(tmp_path), 5)
+    assert not any(name.startswith('nodes.json') for name in os.listdir(tmp_path))
+    # Kept versions stay servable
+    assert (tmp_path / 'snapshots' / '5.json').exists()
+
+
+def test_failed_publish_unpublishes(tmp_path, monkeypatch):
+    publish.publish_snapshot(str(tmp_path), _encoded(5))
+
+    def fail(*args):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(publish, '_write_atomic', fail)
+    assert not publish.publish_snapshot(str(tmp_path), _encoded(6))
+    assert not (tmp_path / 'nodes.json').exists()
+
+
+def test_lost_leadership_unpublishes(tmp_path, monkeypatch):
+    """The background loop publishes when it takes the lock and unpublishes when it loses it"""
+    encoded = _encoded(5)
+    held = iter([True, False])
+
+    class Lock:
+        def is_held(self):
+            return False
+
+        def try_acquire(self):
+            return next(held)
+
+    # Not an Exception, which the loop would log and retry
+    class Stop(BaseException):
+        pass
+
+    published = []
+
+    def sleep(seconds):
+        published.append((tmp_path / 'nodes.json').exists())
+        if len(published) == 2:
+            raise Stop
+
+    monkeypatch.setattr(app_module.Config, 'PUBLISH_DIR', str(tmp_path))
+    monkeypatch.setattr(app_module, 'leader_lock', Lock())
+    monkeypatch.setattr(app_module, 'get_encoded_snapshot', lambda: encoded)
+    monkeypatch.setattr(app_module, 'update_validator_data', lambda: None)
+    monkeypatch.setattr(app_module.time, 'sleep', sleep)
+    with pytest.raises(Stop):
+        app_module.background_update()
+    assert published == [True, False]
+
+
+def test_store_time_is_unique_per_version(postgres):
+    first = app_module.store_latest_data({'validators': []})
+    second = app_module.store_latest_data({'validators': []})
+    assert second.modified > first.modified
+
+
+def test_app_etag_matches_the_served_encoding(postgres, monkeypatch):
+    monkeypatch.setattr(app_module, 'encoded_snapshot', None)
+    encoded = app_module.store_latest_data({'validators': []})
+    client = app_module.app.test_client()
+    for accept, content in (('gzip', encoded.gzip), ('identity', encoded.body)):
+        response = client.get('/api/nodes', headers={'Accept-Encoding': accept})
+        assert response.data == content
+        assert response.headers['ETag'] == f'"{encoded.modified:x}-{len(content):x}"'
+        again = client.get('/api/nodes', headers={'Accept-Encoding': accept, 'If-None-Match': response.headers['ETag']})
+        assert again.status_code == 304
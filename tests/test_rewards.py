@@ -0,0 +1,142 @@
+"""Per-epoch inflation rewards and the APR derived from them"""
+
+import numpy as np
+import pytest
+
+from app import rewards
+from app.metrics import ValidatorColumns
+from app.rpc import KoiiRpcClient, RpcError
+from tests.conftest import app_module, rpc_server
+
+EPOCH = 419
+EPOCHS_PER_YEAR = 182.625
+# Lamports a staked lamport earns per vote credit in EPOCH
+POINT_VALUE = 2.5e-13
+
+
+def _account(i: int, stake: int, commission: int, earned: int = 400_000) -> dict:
+    return {
+        'votePubkey': f'vote{i}', 'nodePubkey': f'id{i}', 'activatedStake': stake, 'commission': commission,
+        'epochCredits': [[EPOCH - 1, 1_000_000, 600_000], [EPOCH, 1_000_000 + earned, 1_000_000]]
+    }
+
+
+def _reward(account: dict, commission=None, scale: float = 1.0) -> rewards.Reward:
+    """The commission the vote account takes on its stake's rewards"""
+    earned = account['epochCredits'][-1][1] - account['epochCredits'][-1][2]
+    commission = account['commission'] if commission is None else commission
+    amount = round(commission / 100 * POINT_VALUE * earned * account['activatedStake'] * scale)
+    return rewards.Reward(amount, 10 ** 9, commission, EPOCH * 432000 + 1)
+
+
+def _apr(commission: float, earned: int = 400_000) -> float:
+    return POINT_VALUE * earned * (1 - commission / 100) * EPOCHS_PER_YEAR * 100
+
+
+def test_epochs_per_year():
+    assert rewards.epochs_per_year(432000, 0.4) == pytest.approx(EPOCHS_PER_YEAR)
+
+
+def test_apr_from_revealed_point_value():
+    accounts = [_account(0, 10 ** 12, 10), _account(1, 5 * 10 ** 13, 5, earned=300_000), _account(2, 10 ** 12, 0)]
+    columns = ValidatorColumns(accounts, [])
+    apr = columns.reward_apr({a['votePubkey']: _reward(a) for a in accounts}, EPOCH, EPOCHS_PER_YEAR)
+    assert apr['vote0'] == pytest.approx(_apr(10))
+    assert apr['vote1'] == pytest.approx(_apr(5, earned=300_000))
+    # A validator without commission reveals nothing but is priced like the others
+    assert apr['vote2'] == pytest.approx(_apr(0))
+
+
+def test_median_ignores_an_outlier():
+    accounts = [_account(i, 10 ** 12, 10) for i in range(4)]
+    entries = {a['votePubkey']: _reward(a) for a in accounts}
+    entries['vote3'] = _reward(accounts[3], scale=20)
+    apr = ValidatorColumns(accounts, []).reward_apr(entries, EPOCH, EPOCHS_PER_YEAR)
+    # The point value is the median of the four, the middle two of which are exact
+    assert apr['vote0'] == pytest.approx(_apr(10))
+
+
+def test_commission_of_the_reward_epoch_is_used():
+    account = _account(0, 10 ** 12, 100)
+    # Charged 10% during the epoch, 100% now
+    entries = {'vote0': _reward(account, commission=10)}
+    apr = ValidatorColumns([account], []).reward_apr(entries, EPOCH, EPOCHS_PER_YEAR)
+    assert apr['vote0'] == pytest.approx(_apr(10))
+
+
+def test_nothing_revealed():
+    account = _account(0, 10 ** 12, 0)
+    columns = ValidatorColumns([account], [])
+    assert columns.reward_apr({'vote0': _reward(account)}, EPOCH, EPOCHS_PER_YEAR) == {}
+    assert columns.reward_apr({'vote0': rewards.NO_REWARD}, EPOCH, EPOCHS_PER_YEAR) == {}
+
+
+def test_epoch_rewards_fall_back_to_the_estimate():
+    accounts = [_account(0, 10 ** 12, 10), _account(1, 10 ** 12, 10)]
+    columns = ValidatorColumns(accounts, [])
+    known = rewards.EpochRewards(EPOCH, {'vote0': _reward(accounts[0])})
+    estimate = np.array([1.0, 2.0])
+    apr = known.apr(columns, EPOCHS_PER_YEAR, estimate)
+    assert apr[0] == pytest.approx(_apr(10))
+    assert apr[1] == 2.0
+    assert known.missing(['vote0', 'vote1']) == ['vote1']
+    # Derived once per epoch, again after new rewards arrive
+    known.add({'vote1': _reward(accounts[1])})
+    assert known.apr(columns, EPOCHS_PER_YEAR, estimate)[1] == pytest.approx(_apr(10))
+
+
+class FlakyClient:
+    """getInflationReward that fails the first `failures` calls of each chunk"""
+
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.calls = {}
+
+    def call(self, method, params, timeout=None):
+        chunk = tuple(params[0])
+        self.calls[chunk] = self.calls.get(chunk, 0) + 1
+        if self.calls[chunk] <= self.failures:
+            raise RpcError(method, 'timed out', retryable=True)
+        return [{'amount': 1, 'postBalance': 2, 'commission': 3, 'effectiveSlot': 4} if account != 'none' else None
+                for account in chunk]
+
+
+@pytest.fixture(autouse=True)
+def no_retry_delay(monkeypatch):
+    monkeypatch.setattr(rewards.time, 'sleep', lambda seconds: None)
+
+
+def test_fetch_in_chunks_with_retries():
+    client = FlakyClient(failures=1)
+    fetched = rewards.fetch_rewards(client, ['a', 'b', 'none', 'c', 'd'], EPOCH, 0, chunk_size=2, retries=1, timeout=5)
+    assert fetched['a'] == rewards.Reward(1, 2, 3, 4)
+    assert fetched['none'] == rewards.NO_REWARD
+    assert set(fetched) == {'a', 'b', 'none', 'c', 'd'}
+    assert sorted(client.calls.values()) == [2, 2, 2]
+
+
+def test_chunks_that_keep_failing_are_left_out():
+    fetched = rewards.fetch_rewards(FlakyClient(failures=5), ['a', 'b'], EPOCH, 0, chunk_size=1, retries=2, timeout=5)
+    assert fetched == {}
+
+
+def test_fetch_from_the_fixture_server():
+    client = KoiiRpcClient(rpc_server.url, probe_interval=0)
+    vote_accounts = list(rpc_server.fixture['getInflationReward'])
+    fetched = rewards.fetch_rewards(client, vote_accounts, EPOCH, 0, chunk_size=7, retries=0, timeout=5)
+    assert set(fetched) == set(vote_accounts)
+
+
+def test_store_and_load(postgres):
+    epoch = 10 ** 9  # clear of real epochs
+    with app_module.get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM validator_rewards WHERE epoch = %s", (epoch,))
+        conn.commit()
+        rewards.store_rewards(conn, epoch, {'a': rewards.Reward(1, 2, 3, 4), 'b': rewards.NO_REWARD})
+        # Rows stored by another process are kept
+        rewards.store_rewards(conn, epoch, {'a': rewards.Reward(9, 9, 9, 9)})
+        assert rewards.load_rewards(conn, epoch) == {'a': rewards.Reward(1, 2, 3, 4), 'b': rewards.NO_REWARD}
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM validator_rewards WHERE epoch = %s", (epoch,))
+        conn.commit()
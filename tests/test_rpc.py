@@ -0,0 +1,155 @@
+"""The RPC client: batches, failover, circuit breaking, hedging and lag detection"""
+
+import copy
+import socket
+import time
+
+import pytest
+
+from app.rpc import KoiiRpcClient, RpcError
+from benchmarks import fixtures
+from benchmarks.rpc_server import FixtureRpcServer
+
+FIXTURE = fixtures.synthetic(10)
+
+
+@pytest.fixture
+def servers():
+    """Start fixture RPC servers: servers(latency, ...) -> one server per latency"""
+    started = []
+
+    def start(*latencies, fixture=FIXTURE):
+        new = [FixtureRpcServer(fixture, latency).start() for latency in latencies]
+        started.extend(new)
+        return new
+
+    yield start
+    for server in started:
+        server.stop()
+
+
+@pytest.fixture
+def dead_url():
+    """A URL nothing listens on"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    return f'http://127.0.0.1:{port}'
+
+
+def _client(urls, **options):
+    options.setdefault('probe_interval', 0)
+    options.setdefault('timeout', 5)
+    return KoiiRpcClient(urls, **options)
+
+
+def test_call_and_batch(servers):
+    server, = servers(0)
+    client = _client(server.url)
+    assert client.call('getEpochInfo')['epoch'] == 420
+    epoch_info, missing, slot = client.batch([('getEpochInfo', None), ('noSuchMethod', None), ('getSlot', [])])
+    assert epoch_info['epoch'] == 420 and isinstance(slot, int)
+    assert isinstance(missing, RpcError) and missing.code == -32601
+    assert server.requests == 2
+
+
+def test_unconfigured_client_raises():
+    with pytest.raises(RpcError):
+        _client(None).call('getSlot')
+
+
+def test_fails_over_to_the_next_endpoint(servers, dead_url):
+    server, = servers(0)
+    client = _client([dead_url, server.url])
+    assert isinstance(client.call('getSlot'), int)
+    assert [status['failures'] for status in client.status()] == [1, 0]
+
+
+def test_request_errors_are_not_retried(servers):
+    first, second = servers(0, 0)
+    client = _client([first.url, second.url])
+    with pytest.raises(RpcError) as error:
+        client.call('noSuchMethod')
+    assert error.value.code == -32601
+    assert (first.requests, second.requests) == (1, 0)
+
+
+def test_breaker_opens_and_retries_after_cooldown(servers, dead_url):
+    server, = servers(0)
+    client = _client([dead_url, server.url], breaker_failures=2, breaker_cooldown=0.3)
+    for _ in range(2):
+        client.call('getSlot')
+    assert client.status()[0]['circuitOpen']
+
+    # While open, calls go straight to the healthy endpoint
+    client.call('getSlot')
+    assert client.status()[0]['failures'] == 2
+
+    # After the cooldown one trial call goes back to it, and its failure re-opens the circuit
+    time.sleep(0.35)
+    assert not client.status()[0]['circuitOpen']
+    client.call('getSlot')
+    assert client.status()[0]['failures'] == 3
+    assert client.status()[0]['circuitOpen']
+
+
+def test_every_endpoint_failing_raises(dead_url):
+    client = _client([dead_url, dead_url], breaker_failures=1)
+    for _ in range(2):
+        with pytest.raises(RpcError) as error:
+            client.call('getSlot')
+        assert error.value.retryable
+
+
+def _prime_latencies(client, method, seconds):
+    """Enough fast round trips of `method` for its p95 to be known"""
+    for _ in range(20):
+        client._record_answer(client.endpoints[1], method, seconds)
+
+
+@pytest.mark.parametrize('hedge', [True, False])
+def test_slow_calls_are_hedged(servers, hedge):
+    slow, fast = servers(1.0, 0)
+    client = _client([slow.url, fast.url], hedge=hedge, hedge_min_delay=0.05)
+    _prime_latencies(client, 'getEpochInfo', 0.01)
+    started = time.time()
+    assert client.call('getEpochInfo')['epoch'] == 420
+    elapsed = time.time() - started
+    if hedge:
+        # Sent to the second endpoint after the p95 (floored at hedge_min_delay), which answers first
+        assert elapsed < 0.5
+        assert fast.requests == 1
+    else:
+        assert elapsed >= 1.0
+        assert fast.requests == 0
+
+
+def test_hedge_delay_waits_for_samples(servers):
+    first, second = servers(0, 0)
+    client = _client([first.url, second.url], timeout=4, hedge_min_delay=0.05)
+    assert client._hedge_delay('getSlot', 4) == 2
+    _prime_latencies(client, 'getSlot', 0.2)
+    assert client._hedge_delay('getSlot', 4) == pytest.approx(0.2)
+
+
+def test_probe_routes_to_the_fastest(servers):
+    slow, fast = servers(0.1, 0)
+    client = _client([slow.url, fast.url])
+    client.probe()
+    assert [endpoint.url for endpoint in client._route()] == [fast.url, slow.url]
+
+
+def test_probe_sets_lagging_endpoints_aside(servers):
+    behind = copy.deepcopy(FIXTURE)
+    behind['getEpochInfo']['absoluteSlot'] -= 1000
+    current, = servers(0)
+    lagging, = servers(0, fixture=behind)
+    client = _client([lagging.url, current.url], max_slot_lag=150)
+    client.probe()
+    assert [status['lagging'] for status in client.status()] == [True, False]
+    assert [endpoint.url for endpoint in client._route()] == [current.url]
+
+    # Caught up again
+    lagging.load(FIXTURE)
+    client.probe()
+    assert not client.status()[0]['lagging']
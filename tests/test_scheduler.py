@@ -0,0 +1,104 @@
+"""Per-source refresh schedule: intervals, retry backoff, epoch changes and stale values"""
+
+import pytest
+
+from app.scheduler import Source, SourceSchedule
+
+
+def _schedule(jitter=0.0, **options):
+    return SourceSchedule([
+        Source('voteAccounts', 30),
+        Source('clusterNodes', 300),
+        Source('inflationRate', 3600, epoch_bound=True),
+        Source('slotsPerEpoch', None),
+        Source('koiiPrice', 60, max_age=120)
+    ], jitter=jitter, **options)
+
+
+def test_everything_is_due_at_first():
+    schedule = _schedule()
+    assert set(schedule.due(0)) == set(schedule.sources)
+
+
+def test_each_source_keeps_its_interval():
+    schedule = _schedule()
+    schedule.record(schedule.due(0), {name: 1 for name in schedule.sources}, now=0)
+    assert schedule.due(29) == []
+    assert schedule.due(30) == ['voteAccounts']
+    assert schedule.seconds_until_due(10) == 20
+    # Fetched once: never due again
+    assert schedule.sources['slotsPerEpoch'].next_due == float('inf')
+
+
+def test_jitter_window_groups_sources():
+    schedule = SourceSchedule([Source('a', 100), Source('b', 100)], jitter=0.1)
+    schedule.sources['b'].next_due = 105
+    schedule.sources['a'].next_due = 100
+    # b is due within a's jitter window, so both go in one fetch
+    assert schedule.due(100) == ['a', 'b']
+
+
+def test_record_reports_changed_values():
+    schedule = _schedule()
+    assert schedule.record(['voteAccounts', 'clusterNodes'], {'voteAccounts': [1], 'clusterNodes': {}}, now=0) \
+        == {'voteAccounts', 'clusterNodes'}
+    assert schedule.record(['voteAccounts'], {'voteAccounts': [1]}, now=30) == set()
+    assert schedule.record(['voteAccounts'], {'voteAccounts': [2]}, now=60) == {'voteAccounts'}
+
+
+def test_failures_back_off_exponentially_up_to_the_maximum():
+    schedule = _schedule(retry_min=5, retry_max=60)
+    delays = []
+    for _ in range(6):
+        schedule.record(['clusterNodes'], {}, now=1000)
+        delays.append(schedule.sources['clusterNodes'].next_due - 1000)
+    assert delays == [5, 10, 20, 40, 60, 60]
+    assert schedule.status(1000)['clusterNodes']['failures'] == 6
+
+    # A success resets the backoff and returns to the regular interval
+    schedule.record(['clusterNodes'], {'clusterNodes': {}}, now=2000)
+    assert schedule.sources['clusterNodes'].failures == 0
+    assert schedule.sources['clusterNodes'].next_due == 2300
+    schedule.record(['clusterNodes'], {}, now=2300)
+    assert schedule.sources['clusterNodes'].next_due == 2305
+
+
+@pytest.mark.parametrize('draw', [-0.1, 0.1])
+def test_jitter_spreads_intervals_and_retries(monkeypatch, draw):
+    monkeypatch.setattr('app.scheduler.random.uniform', lambda low, high: draw)
+    schedule = _schedule(jitter=0.1, retry_min=10)
+    schedule.record(['voteAccounts'], {'voteAccounts': 1}, now=0)
+    assert schedule.sources['voteAccounts'].next_due == pytest.approx(30 * (1 + draw))
+    schedule.record(['clusterNodes'], {}, now=0)
+    assert schedule.sources['clusterNodes'].next_due == pytest.approx(10 * (1 + draw))
+
+
+def test_stale_value_is_dropped_while_failing():
+    schedule = _schedule(retry_min=5)
+    schedule.record(['koiiPrice'], {'koiiPrice': 0.01}, now=0)
+    # Still within max_age: the last price is kept
+    assert schedule.record(['koiiPrice'], {}, now=100) == set()
+    assert schedule.value('koiiPrice') == 0.01
+    assert schedule.record(['koiiPrice'], {}, now=121) == {'koiiPrice'}
+    assert schedule.value('koiiPrice') is None
+    assert 'koiiPrice' not in schedule.values()
+
+
+def test_new_epoch_makes_epoch_bound_sources_due():
+    schedule = _schedule()
+    schedule.record(list(schedule.sources), {name: 1 for name in schedule.sources}, now=0)
+    assert not schedule.observe_epoch(420)  # first epoch seen
+    assert not schedule.observe_epoch(420)
+    assert schedule.due(1) == []
+    assert schedule.observe_epoch(421)
+    assert schedule.due(1) == ['inflationRate']
+
+
+def test_expire_and_reset():
+    schedule = _schedule()
+    schedule.record(list(schedule.sources), {name: 1 for name in schedule.sources}, now=0)
+    schedule.expire('clusterNodes')
+    assert schedule.due(1) == ['clusterNodes']
+    schedule.reset()
+    assert schedule.values() == {}
+    assert set(schedule.due(1)) == set(schedule.sources)
@@ -0,0 +1,251 @@
+"""Snapshot deltas and /api/nodes?since="""
+
+import copy
+import json
+import os
+
+import pytest
+
+from app import snapshot
+from app.metrics import RECORD_FIELDS
+from tests.conftest import app_module
+
+
+def _validator(i: int, **fields) -> dict:
+    validator = {field: None for field in RECORD_FIELDS}
+    validator.update(identityPubkey=f'id{i}', voteAccountPubkey=f'vote{i}', activatedStake=1000 * i,
+                     commission=5, credits=100 * i, delinquent=False)
+    validator.update(fields)
+    return validator
+
+
+def _snapshot(validators, **stats) -> dict:
+    return dict({'epoch': 10, 'totalStake': sum(v['activatedStake'] for v in validators), 'validators': validators},
+                **stats)
+
+
+def _apply(base: dict, delta: dict) -> dict:
+    """What a client does with a delta"""
+    validators = {v['identityPubkey']: v for v in base['validators']}
+    for identity in delta['removed']:
+        del validators[identity]
+    for validator in delta['changed']:
+        validators[validator['identityPubkey']] = validator
+    return dict(delta['stats'], validators=list(validators.values()))
+
+
+@pytest.fixture
+def versions():
+    """Two snapshots: one validator changed, one removed, one added"""
+    old = _snapshot([_validator(i) for i in range(5)], snapshotVersion=1)
+    new = _snapshot([_validator(0), _validator(1, credits=999), _validator(2), _validator(4), _validator(5)],
+                    epoch=11, snapshotVersion=2)
+    return old, new
+
+
+def test_diff_snapshot(versions):
+    old, new = versions
+    delta = snapshot.diff_snapshot(1, snapshot.validators_by_identity(old), new)
+    assert delta['delta'] is True
+    assert (delta['baseVersion'], delta['snapshotVersion']) == (1, 2)
+    assert [v['identityPubkey'] for v in delta['changed']] == ['id1', 'id5']
+    assert delta['removed'] == ['id3']
+    assert delta['stats'] == {key: value for key, value in new.items() if key != 'validators'}
+    assert _apply(old, delta) == new
+
+
+def test_unchanged_snapshot_has_empty_delta(versions):
+    old, _ = versions
+    delta = snapshot.diff_snapshot(1, snapshot.validators_by_identity(old), dict(old, snapshotVersion=2))
+    assert delta['changed'] == [] and delta['removed'] == []
+
+
+def test_log_encodes_a_delta_per_logged_version(versions):
+    old, new = versions
+    log = snapshot.SnapshotLog(2)
+    for version in (7, 8, 9):
+        log.add(version, old)
+    assert len(log) == 2
+    deltas = log.encode_deltas(new)
+    # Each delta is keyed by its base version
+    assert [delta.version for delta in deltas] == [8, 9]
+    assert snapshot.loads(deltas[0].body)['baseVersion'] == 8
+
+
+def test_encoded_variants_decode_to_the_same_body(versions):
+    import gzip
+
+    _, new = versions
+    encoded = snapshot.encode_snapshot(new, 2)
+    assert snapshot.loads(encoded.body) == new
+    assert gzip.decompress(encoded.gzip) == encoded.body
+    if encoded.br is not None:
+        import brotli
+        assert brotli.decompress(encoded.br) == encoded.body
+    # Without a store time the ETag is the content hash
+    assert encoded.variant_etag(encoded.gzip) == encoded.etag
+
+
+@pytest.fixture
+def stored(postgres, monkeypatch, versions):
+    """Both snapshots stored in order, with a delta from the first; returns both encoded and the first as data"""
+    old, new = copy.deepcopy(versions)
+    log = snapshot.SnapshotLog(3)
+    monkeypatch.setattr(app_module, 'encoded_snapshot', None)
+    first = app_module.store_latest_data(old, log)
+    second = app_module.store_latest_data(new, log)
+    assert first is not None and second is not None
+    return first, second, old
+
+
+def test_since_returns_the_delta(stored):
+    first, second, old = stored
+    client = app_module.app.test_client()
+    response = client.get(f'/api/nodes?since={first.version}', headers={'Accept-Encoding': 'identity'})
+    assert response.status_code == 200
+    delta = response.get_json()
+    assert (delta['baseVersion'], delta['snapshotVersion']) == (first.version, second.version)
+    assert _apply(old, delta) == snapshot.loads(second.body)
+
+
+def test_since_current_version_is_not_modified(stored):
+    _, second, _ = stored
+    response = app_module.app.test_client().get(f'/api/nodes?since={second.version}')
+    assert response.status_code == 304
+
+
+def test_since_unknown_version_returns_the_snapshot(stored):
+    _, second, _ = stored
+    response = app_module.app.test_client().get('/api/nodes?since=0', headers={'Accept-Encoding': 'identity'})
+    assert response.status_code == 200
+    assert response.data == second.body
+
+
+@pytest.fixture
+def schema(postgres):
+    """A connection whose tables live in a schema of their own, created by init_snapshot_schema"""
+    import psycopg2
+
+    name = f'test_snapshot_{os.getpid()}'
+    conn = psycopg2.connect(**app_module.DB_CONFIG)
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {name} CASCADE")
+        cur.execute(f"CREATE SCHEMA {name}")
+        cur.execute(f"SET search_path TO {name}")
+    conn.commit()
+    try:
+        yield conn
+    finally:
+        conn.rollback()
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA {name} CASCADE")
+        conn.commit()
+        conn.close()
+
+
+def _init_schema(conn):
+    with conn.cursor() as cur:
+        snapshot.init_snapshot_schema(cur)
+    conn.commit()
+
+
+def _column(conn, column):
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT {column} FROM validator_snapshot")
+        return cur.fetchone()[0]
+
+
+@pytest.mark.parametrize('codec_name', ['json', 'msgpack'])
+def test_codec_round_trip(schema, versions, codec_name):
+    if codec_name == 'msgpack':
+        pytest.importorskip('msgpack')
+    _init_schema(schema)
+    _, new = copy.deepcopy(versions)
+    encoded = snapshot.store_snapshot(schema, new, codec=snapshot.get_codec(codec_name))
+    version, data, _ = snapshot.load_snapshot(schema)
+    assert version == encoded.version
+    assert data == new
+    assert _column(schema, 'codec') == codec_name
+    # The json copy is the body itself
+    assert (_column(schema, 'data') is None) == (codec_name == 'json')
+
+
+def test_unknown_codec_reads_the_json_body(schema, versions):
+    _init_schema(schema)
+    _, new = copy.deepcopy(versions)
+    # Written by a release with a codec this one does not have
+    future = snapshot.SnapshotCodec('future', lambda data: b'\x00not json', None)
+    snapshot.store_snapshot(schema, new, codec=future)
+    assert _column(schema, 'codec') == 'future'
+    assert snapshot.load_snapshot(schema)[1] == new
+
+
+def test_unknown_codec_name_falls_back_to_json():
+    assert snapshot.get_codec('no-such-codec') is snapshot.JSON_CODEC
+
+
+def test_newer_schema_version_is_skipped(schema, versions):
+    _init_schema(schema)
+    _, new = copy.deepcopy(versions)
+    encoded = snapshot.store_snapshot(schema, new)
+    with schema.cursor() as cur:
+        cur.execute("UPDATE validator_snapshot SET schema_version = %s", (snapshot.SCHEMA_VERSION + 1,))
+    schema.commit()
+    assert snapshot.load_snapshot(schema) is None
+    # The served bytes do not depend on the layout and are still read
+    assert snapshot.load_encoded_snapshot(schema).body == encoded.body
+
+
+def test_jsonb_column_is_converted_in_place(schema, versions):
+    _, new = versions
+    with schema.cursor() as cur:
+        cur.execute("CREATE SEQUENCE validator_snapshot_version_seq")
+        # The table as releases before the codecs created it
+        cur.execute("""
+            CREATE TABLE validator_snapshot (
+                id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+                version BIGINT NOT NULL,
+                data JSONB NOT NULL,
+                timestamp TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            )
+        """)
+        cur.execute("INSERT INTO validator_snapshot (id, version, data) VALUES (1, 41, %s)", (json.dumps(new),))
+    schema.commit()
+
+    _init_schema(schema)
+    with schema.cursor() as cur:
+        cur.execute("""
+            SELECT data_type, is_nullable FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = 'validator_snapshot' AND column_name = 'data'
+        """)
+        assert cur.fetchone() == ('bytea', 'YES')
+    assert snapshot.load_snapshot(schema)[:2] == (41, new)
+    # Not pre-encoded yet: encoded from the converted copy
+    encoded = snapshot.load_encoded_snapshot(schema)
+    assert encoded.version == 41 and snapshot.loads(encoded.body) == new
+    # Running the setup again leaves it alone
+    _init_schema(schema)
+    assert snapshot.load_snapshot(schema)[:2] == (41, new)
+
+
+def test_legacy_table_is_migrated_and_kept(schema, versions):
+    old, _ = versions
+    with schema.cursor() as cur:
+        # As the original release created it
+        cur.execute("CREATE TABLE latest_validator_data (id SERIAL PRIMARY KEY, data JSONB NOT NULL, "
+                    "timestamp TIMESTAMPTZ DEFAULT NOW())")
+        cur.execute("INSERT INTO latest_validator_data (data, timestamp) VALUES (%s, NOW() - INTERVAL '1 hour')",
+                    (json.dumps({'validators': []}),))
+        cur.execute("INSERT INTO latest_validator_data (data) VALUES (%s)", (json.dumps(old),))
+    schema.commit()
+
+    _init_schema(schema)
+    assert snapshot.load_snapshot(schema)[1] == old
+    with schema.cursor() as cur:
+        cur.execute("SELECT to_regclass('latest_validator_data'), to_regclass('latest_validator_data_legacy')")
+        assert cur.fetchone() == (None, 'latest_validator_data_legacy')
+        cur.execute("SELECT count(*) FROM latest_validator_data_legacy")
+        assert cur.fetchone()[0] == 2
+    # Nothing left to migrate on the next startup
+    _init_schema(schema)
+    assert snapshot.load_snapshot(schema)[1] == old
@@ -0,0 +1,111 @@
+"""The /api/stream push channel: notifications, keep-alives, deltas and client bookkeeping"""
+
+import os
+import threading
+
+import psycopg2
+import pytest
+
+from app import snapshot, stream
+from tests.conftest import app_module
+
+
+def test_format_event():
+    assert stream.format_event('snapshot', '{"a":1}', 7) == 'id: 7\nevent: snapshot\ndata: {"a":1}\n\n'
+    assert stream.format_event('ping', 'x') == 'event: ping\ndata: x\n\n'
+
+
+def test_wait_wakes_on_a_newer_version():
+    broadcaster = stream.SnapshotBroadcaster({}, 'unused', '')
+    assert broadcaster.wait(None, 0.01) is None
+    threading.Timer(0.05, broadcaster.publish, (3,)).start()
+    assert broadcaster.wait(None, 5) == 3
+    # Older versions arriving late are ignored
+    broadcaster.publish(2)
+    assert broadcaster.wait(3, 0.01) == 3
+
+
+@pytest.fixture
+def broadcaster(monkeypatch):
+    """The app's broadcaster, fed by the test instead of a LISTEN connection"""
+    broadcaster = stream.SnapshotBroadcaster({}, 'unused', '')
+    monkeypatch.setattr(broadcaster, 'start', lambda: None)
+    monkeypatch.setattr(app_module, 'broadcaster', broadcaster)
+    monkeypatch.setattr(app_module.Config, 'STREAM_KEEPALIVE', 0.05)
+    monkeypatch.setattr(app_module, 'get_encoded_delta', lambda since, version: None)
+    return broadcaster
+
+
+def _open(path='/api/stream', **kwargs):
+    response = app_module.app.test_client().get(path, buffered=False, **kwargs)
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    return response, iter(response.response)
+
+
+def _next(chunks) -> str:
+    chunk = next(chunks)
+    return chunk.decode() if isinstance(chunk, bytes) else chunk
+
+
+def test_notification_reaches_the_client(broadcaster):
+    response, chunks = _open()
+    try:
+        assert _next(chunks) == f'retry: {app_module.Config.STREAM_RETRY}\n\n'
+        broadcaster.publish(5)
+        assert _next(chunks) == stream.format_event('snapshot', '{"snapshotVersion": 5}', 5)
+        # Nothing new: a keep-alive comment once STREAM_KEEPALIVE passes
+        assert _next(chunks) == ': keepalive\n\n'
+        broadcaster.publish(6)
+        assert 'id: 6\n' in _next(chunks)
+    finally:
+        response.close()
+
+
+def test_reconnecting_client_gets_the_delta(broadcaster, monkeypatch):
+    delta = snapshot.encode_snapshot({'delta': True, 'baseVersion': 4, 'snapshotVersion': 5}, 4)
+    monkeypatch.setattr(app_module, 'get_encoded_delta', lambda since, version: delta if since == 4 else None)
+    broadcaster.publish(5)
+    response, chunks = _open(headers={'Last-Event-ID': '4'})
+    try:
+        _next(chunks)
+        assert _next(chunks) == stream.format_event('delta', delta.body.decode(), 5)
+    finally:
+        response.close()
+
+
+def test_client_is_forgotten_on_disconnect(broadcaster, monkeypatch):
+    monkeypatch.setattr(app_module.Config, 'STREAM_MAX_CLIENTS', 1)
+    response, chunks = _open()
+    _next(chunks)
+    assert broadcaster.clients == 1
+    # The worker's limit is reached
+    refused = app_module.app.test_client().get('/api/stream')
+    assert refused.status_code == 503 and refused.headers['Retry-After']
+    response.close()
+    assert broadcaster.clients == 0
+    response, chunks = _open()
+    response.close()
+    assert broadcaster.clients == 0
+
+
+def test_notify_reaches_a_listener(postgres):
+    channel = f'test_stream_{os.getpid()}'
+    broadcaster = stream.SnapshotBroadcaster(app_module.DB_CONFIG, channel, "SELECT 1 WHERE false")
+    broadcaster.start()
+    conn = psycopg2.connect(**app_module.DB_CONFIG)
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            # Notifications sent before the listener is up are lost, so keep announcing
+            for _ in range(100):
+                cur.execute("SELECT pg_notify(%s, '7')", (channel,))
+                if broadcaster.wait(None, 0.05) == 7:
+                    break
+            assert broadcaster.version == 7
+            # Malformed payloads are skipped
+            cur.execute("SELECT pg_notify(%s, 'not a version')", (channel,))
+            cur.execute("SELECT pg_notify(%s, '8')", (channel,))
+            assert broadcaster.wait(7, 5) == 8
+    finally:
+        conn.close()
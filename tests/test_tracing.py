@@ -0,0 +1,34 @@
+"""Refresh traces and the profiles of sampled cycles"""
+
+import pstats
+
+from app import fanout, tracing
+from tests.conftest import app_module
+
+
+def _fan_out_work():
+    return sum(range(1000))
+
+
+def test_spans_and_fan_out_calls_are_recorded():
+    with tracing.trace_cycle('test') as trace:
+        with tracing.span('stage'):
+            with tracing.span('inner'):
+                pass
+            tracing.record_fanout(fanout.fan_out({'work': _fan_out_work}))
+    spans = {span['name']: span for span in trace.to_dict('ok')['spans']}
+    assert spans['inner']['parent'] == 'stage'
+    assert spans['work']['parent'] == 'stage'
+    assert spans['stage']['parent'] is None
+
+
+def test_profile_includes_the_fan_out_threads(tmp_path, monkeypatch):
+    monkeypatch.setattr(app_module.Config, 'PROFILE_DIR', str(tmp_path))
+    monkeypatch.setattr(app_module.Config, 'PROFILER', 'cprofile')
+    with tracing.trace_cycle('test', profile=True):
+        assert fanout.fan_out({'work': _fan_out_work}).get('work') == sum(range(1000))
+    path, = tmp_path.glob('*.prof')
+    functions = {name for _, _, name in pstats.Stats(str(path)).stats}
+    assert '_fan_out_work' in functions
+    # Outside a profiled cycle calls run as they are
+    assert tracing.profiled(_fan_out_work) is _fan_out_work